@@ -2,23 +2,65 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
-from src.config import DATA_PATH, MODEL_PATH
+from src.config import DATA_PATH
+from src.model_registry import current_model_path
 from src.data_loader import load_data
 from src.train import train_price_model
-from src.predict import load_model_bundle, predict_price
-from src.deal import evaluate_deal
-from src.logging_db import log_prediction, read_logs
+from src.incremental import start_incremental_update, read_status
+from src.predict import load_model_bundle, cached_predict_interval
+from src.prediction_cache import model_file_token
+from src.deal import evaluate_deal, GREAT_DEAL
+from src.explain import ExplanationUnavailableError, explain_rows
+from src.features import build_input_data, default_mileage
+from src.logging_db import log_prediction, query_logs, label_counts, daily_diff, get_writer
+from src.metrics import metrics
+from src.prediction_cache import prediction_cache
 from src.chatbot_rules import parse_user_message, recommend
-from src.analytics import dataset_kpis, price_by_brand
+from src.chatbot_index import ListingIndex
+from src.market_cube import get_market_cube
+from src.market_deals import get_market_deals, great_deals
+from src.comparables import get_comparables_index
+from src.listings_query import ListingsQuery, PRICE_BUCKETS
+from src.feature_store import source_version
 
 # إعدادات الصفحة
 st.set_page_config(page_title="SmartCar AI Pro", layout="wide", page_icon="🏎️")
 
-# تحميل البيانات مع التخزين المؤقت للسرعة
-@st.cache_data
+# تحميل البيانات مع التخزين المؤقت للسرعة (جدول واحد مشترك للقراءة فقط، بدون نسخة في كل تفاعل)
+@st.cache_resource
 def get_cached_data():
     return load_data(DATA_PATH)
 
+# الموديل يُحمّل مرة واحدة لكل نسخة من ملفه (وليس مع كل تفاعل في المقيم)
+@st.cache_resource
+def get_cached_bundle(model_token):
+    return load_model_bundle()
+
+# مكعب تجميعات السوق: يُبنى مرة لكل نسخة بيانات ويُحدَّث تدريجياً عند إضافة سيارات
+@st.cache_resource
+def get_cached_cube(data_version):
+    return get_market_cube(DATA_PATH)
+
+# تقييم كل سيارات السوق مرة لكل نسخة بيانات وموديل (السيارات المضافة فقط تُقيَّم عند التحديث)
+@st.cache_resource
+def get_cached_market_deals(data_version, model_token):
+    return get_market_deals(DATA_PATH, get_cached_bundle(model_token), model_token)
+
+# فهرس السيارات المشابهة للمقيم: مرة لكل نسخة بيانات (السيارات المضافة فقط تُفهرس عند التحديث)
+@st.cache_resource
+def get_cached_comparables(data_version):
+    return get_comparables_index(DATA_PATH)
+
+# خدمة استعلام الاستكشاف (رموز الأعمدة ومكعب العدّادات) تُبنى مرة لكل نسخة بيانات
+@st.cache_resource
+def get_listings_query(data_version):
+    return ListingsQuery(get_cached_data())
+
+# فهرس البحث للمساعد الذكي يُبنى مرة واحدة ويُشارك بين الجلسات
+@st.cache_resource
+def get_listing_index():
+    return ListingIndex(get_cached_data())
+
 # التحقق من وجود البيانات
 try:
     df = get_cached_data()
@@ -36,13 +78,26 @@ if st.sidebar.button("🚀 إعادة تدريب الموديل"):
         res = train_price_model(df)
         st.sidebar.success(f"تم بنجاح! R²: {res['metrics']['r2']:.4f}")
 
+# التحديث التدريجي يعمل في عملية منفصلة على السيارات الجديدة فقط
+if st.sidebar.button("⚡ تحديث تدريجي (السيارات الجديدة فقط)"):
+    if start_incremental_update() is None:
+        st.sidebar.info("يوجد تحديث قيد التشغيل بالفعل.")
+inc_status = read_status()
+if inc_status.get("state") == "running":
+    st.sidebar.caption("⏳ التحديث التدريجي قيد التشغيل...")
+elif inc_status.get("state") == "done":
+    st.sidebar.caption(f"✅ آخر تحديث: نسخة {inc_status['version']} | R²: {inc_status['r2']:.4f}")
+elif inc_status.get("state") == "failed":
+    st.sidebar.caption(f"❌ فشل التحديث: {inc_status.get('message')}")
+
 # التبويبات الرئيسية
-tabs = st.tabs(["📊 Dashboard", "🔍 Car Discovery", "💰 AI Valuator", "🤖 Chatbot Assistant", "📜 Logs"])
+tabs = st.tabs(["📊 Dashboard", "🔍 Car Discovery", "🔥 Great Deals", "💰 AI Valuator", "🤖 Chatbot Assistant", "📜 Logs"])
 
 # --- Tab 1: Dashboard ---
 with tabs[0]:
     st.subheader("📊 تحليل بيانات السوق")
-    kpis = dataset_kpis(df)
+    cube = get_cached_cube(source_version(DATA_PATH))
+    kpis = cube.kpis()
     c1, c2, c3, c4 = st.columns(4)
     c1.metric("إجمالي السيارات", f"{kpis['count']:,}")
     c2.metric("متوسط السعر", f"${kpis['mean_price']:,.0f}")
@@ -51,32 +106,87 @@ with tabs[0]:
 
     col_graph1, col_graph2 = st.columns(2)
     with col_graph1:
-        brand_data = price_by_brand(df)
+        brand_data = cube.price_by_brand()
         fig = px.bar(brand_data, x="Brand", y="Avg_Price_USD", title="متوسط السعر حسب الماركة", color="Avg_Price_USD")
         st.plotly_chart(fig, use_container_width=True)
     with col_graph2:
-        # رسم بياني يوضح العلاقة التي حققت R2 عالية
-        fig2 = px.scatter(df, x="Horsepower", y="Price_USD", color="Body_Type", hover_data=['Year'], title="العلاقة بين القوة والسعر")
+        # رسم بياني يوضح العلاقة التي حققت R2 عالية (عينة ثابتة لكل نوع جسم بدل كل الصفوف)
+        fig2 = px.scatter(cube.scatter_sample(), x="Horsepower", y="Price_USD", color="Body_Type", hover_data=['Year'], title="العلاقة بين القوة والسعر")
         st.plotly_chart(fig2, use_container_width=True)
 
+    age_data = cube.price_by_age_bracket()
+    fig3 = px.bar(age_data, x="Age_Bracket", y="Avg_Price_USD", title="متوسط السعر حسب فئة العمر")
+    st.plotly_chart(fig3, use_container_width=True)
+
 # --- Tab 2: Discovery ---
 with tabs[1]:
     st.subheader("🔎 استكشاف وتصفية السيارات")
-    f_brand = st.multiselect("اختر الماركة", sorted(df["Brand"].unique()))
-    f_price = st.slider("نطاق السعر ($)", int(df["Price_USD"].min()), int(df["Price_USD"].max()), (10000, 50000))
-    
-    filtered_df = df.copy()
-    if f_brand: filtered_df = filtered_df[filtered_df["Brand"].isin(f_brand)]
-    filtered_df = filtered_df[(filtered_df["Price_USD"] >= f_price[0]) & (filtered_df["Price_USD"] <= f_price[1])]
-    st.dataframe(filtered_df, use_container_width=True)
+    listings = get_listings_query(source_version(DATA_PATH))
+    d_c1, d_c2, d_c3 = st.columns(3)
+    f_brand = d_c1.multiselect("اختر الماركة", listings.options["Brand"], key="disc_brand")
+    f_fuel = d_c2.multiselect("الوقود", listings.options["Fuel_Type"], key="disc_fuel")
+    f_body = d_c3.multiselect("نوع الجسم", listings.options["Body_Type"], key="disc_body")
+    f_price = st.select_slider("نطاق السعر ($)", options=PRICE_BUCKETS, value=(10_000, 50_000),
+                               format_func=lambda v: "∞" if v == float("inf") else f"{v:,.0f}", key="disc_price")
+    d_c4, d_c5 = st.columns(2)
+    sort_options = {"بدون ترتيب": None, "الأرخص أولاً": "price_asc", "الأغلى أولاً": "price_desc",
+                    "الأحدث أولاً": "newest", "الأقوى أولاً": "horsepower"}
+    f_sort = d_c4.selectbox("ترتيب النتائج", list(sort_options), key="disc_sort")
+    f_page_size = d_c5.selectbox("عدد الصفوف في الصفحة", [25, 50, 100, 200], index=1, key="disc_page_size")
+
+    # الفلاتر كشرائح سعر بين الحدين المختارين (الحدان على نفس القيمة = لا نتائج)؛ الاختيار الفارغ = بدون تصفية
+    lo, hi = PRICE_BUCKETS.index(f_price[0]), PRICE_BUCKETS.index(f_price[1])
+    filters = {"Brand": f_brand or None, "Fuel_Type": f_fuel or None, "Body_Type": f_body or None,
+               "Price_Bucket": list(range(lo, hi))}
+    total = listings.count(filters)
+    n_pages = max(1, -(-total // f_page_size))
+
+    # الرجوع للصفحة الأولى عند تغيير الفلاتر
+    disc_key = (tuple(f_brand), tuple(f_fuel), tuple(f_body), f_price, f_sort, f_page_size)
+    if st.session_state.get("disc_filters") != disc_key:
+        st.session_state["disc_filters"] = disc_key
+        st.session_state["disc_page"] = 1
+    page_no = st.number_input(f"الصفحة (من {n_pages:,})", 1, n_pages, key="disc_page")
 
-# --- Tab 3: Valuator ---
+    st.caption(f"{total:,} سيارة مطابقة")
+    st.dataframe(listings.page(filters, page_no - 1, f_page_size, sort_options[f_sort]), use_container_width=True)
+
+    with st.expander("📊 عدد السيارات لكل خيار"):
+        facets = listings.facets(filters)
+        fc1, fc2 = st.columns(2)
+        fc1.bar_chart(facets["Brand"])
+        fc2.bar_chart(facets["Price_Bucket"])
+        fc1.bar_chart(facets["Fuel_Type"])
+        fc2.bar_chart(facets["Body_Type"])
+
+# --- Tab 3: Great Deals ---
 with tabs[2]:
+    st.subheader("🔥 أفضل الصفقات في السوق")
+    if not current_model_path().exists():
+        st.warning("⚠️ الموديل غير موجود! يرجى الضغط على 'إعادة تدريب' من القائمة الجانبية.")
+    else:
+        market_deals = get_cached_market_deals(source_version(DATA_PATH), model_file_token())
+        g_c1, g_c2, g_c3, g_c4 = st.columns(4)
+        g_brand = g_c1.multiselect("الماركة", sorted(market_deals["Brand"].unique()), key="deals_brand")
+        g_body = g_c2.multiselect("نوع الجسم", sorted(market_deals["Body_Type"].unique()), key="deals_body")
+        g_min = g_c3.slider("أقل خصم (%)", 0, 50, 0, key="deals_min")
+        g_limit = g_c4.selectbox("عدد النتائج", [25, 50, 100, 200], index=1, key="deals_limit")
+
+        top = great_deals(market_deals, g_brand, g_body, g_min, g_limit)
+        st.caption(f"{int((market_deals['Deal_Code'] == GREAT_DEAL).sum()):,} صفقة ممتازة من أصل {len(market_deals):,} سيارة")
+        st.dataframe(
+            top.drop(columns="Deal_Code").round({"Predicted_Price_USD": 0, "Fair_Lower_USD": 0, "Fair_Upper_USD": 0,
+                                                  "Discount_USD": 0, "Discount_Pct": 1}),
+            use_container_width=True,
+        )
+
+# --- Tab 4: Valuator ---
+with tabs[3]:
     st.subheader("💰 المقيم الذكي (AI Valuator)")
-    if not MODEL_PATH.exists():
+    if not current_model_path().exists():
         st.warning("⚠️ الموديل غير موجود! يرجى الضغط على 'إعادة تدريب' من القائمة الجانبية.")
     else:
-        bundle = load_model_bundle()
+        bundle = get_cached_bundle(model_file_token())
         col_in1, col_in2 = st.columns(2)
         with col_in1:
             in_brand = st.selectbox("الماركة", sorted(df["Brand"].unique()))
@@ -87,48 +197,70 @@ with tabs[2]:
             in_cc = st.number_input("سعة المحرك (CC)", 800, 7000, 2000)
             in_fuel = st.selectbox("الوقود", df["Fuel_Type"].unique())
             in_trans = st.selectbox("ناقل الحركة", df["Transmission"].unique())
+            in_mileage = st.number_input("استهلاك الوقود (كم/لتر)", 1.0, 60.0, float(default_mileage(bundle)))
         
         in_listed = st.number_input("السعر المعروض حالياً ($)", value=25000)
+        in_same = st.checkbox("السيارات المشابهة من نفس الماركة ونوع الجسم فقط", value=True)
 
         if st.button("⚖️ تحليل القيمة العادلة"):
             # تجهيز الميزات بنفس الترتيب والمسميات التي تدرب عليها الموديل
-            input_feats = {
-                "Brand": in_brand, 
-                "Body_Type": in_body,
-                "Year": in_year, 
-                "Horsepower": in_hp,
-                "Engine_CC": in_cc, 
-                "Fuel_Type": in_fuel, 
-                "Transmission": in_trans,
-                "Car_Age": 2026 - in_year, 
-                "HP_per_CC": in_hp / (in_cc + 1),
-                "Mileage_km_per_l": 15.0
-            }
+            with metrics.timer("build_input"):
+                input_feats = build_input_data(in_brand, in_body, in_year, in_hp, in_cc, in_fuel, in_trans, in_mileage)
             
-            pred = predict_price(bundle, input_feats)
+            # السعر مع نطاقه الخاص بهذه السيارة (من تشتت أشجار الموديل)
+            pred, pred_lower, pred_upper = cached_predict_interval(bundle, input_feats)
             # استخدام مفاتيح bundle الصحيحة للتقييم
-            deal = evaluate_deal(in_listed, pred, bundle['metrics']['mae'], bundle['metrics']['r2'])
+            with metrics.timer("evaluate_deal"):
+                deal = evaluate_deal(in_listed, pred, bundle['metrics']['mae'], bundle['metrics']['r2'],
+                                     lower=pred_lower, upper=pred_upper)
             
             st.divider()
             res_c1, res_c2 = st.columns(2)
             with res_c1:
                 st.metric("سعر الذكاء الاصطناعي المتوقع", f"${pred:,.0f}")
-                st.write(f"🎯 ثقة النموذج: **{deal.confidence_score}%**")
+                st.write(f"🎯 ثقة التقييم لهذه السيارة: **{deal.confidence_score}%**")
             with res_c2:
                 st.subheader(f"النتيجة: {deal.label}")
                 st.info(f"نطاق السعر العادل: **${deal.lower:,.0f} - ${deal.upper:,.0f}**")
             
+            # لماذا هذا السعر: مساهمة كل ميزة بالدولار فوق/تحت سعر الأساس
+            try:
+                explained, _ = explain_rows(bundle, [input_feats])
+            except ExplanationUnavailableError as e:
+                explained = []
+                st.caption(f"تفسير السعر غير متاح: {e}")
+            if explained:
+                why = pd.DataFrame(explained[0]["contributions"])
+                why["الأثر"] = np.where(why["contribution_usd"] >= 0, "يرفع السعر", "يخفض السعر")
+                fig_why = px.bar(why.iloc[::-1], x="contribution_usd", y="feature", color="الأثر", orientation="h",
+                                 title=f"لماذا هذا السعر؟ (سعر الأساس ${explained[0]['base_price']:,.0f})",
+                                 hover_data=["value"])
+                st.plotly_chart(fig_why, use_container_width=True)
+
+            # أقرب السيارات المعروضة فعلاً في السوق لهذه المواصفات
+            st.markdown("#### 🚗 سيارات مشابهة في السوق")
+            with metrics.timer("comparables_search"):
+                comparables = get_cached_comparables(source_version(DATA_PATH)).query(
+                    input_feats,
+                    brands=[in_brand] if in_same else None,
+                    body_types=[in_body] if in_same else None,
+                )
+            st.dataframe(comparables.round({"Price_USD": 0, "Distance": 2}), use_container_width=True)
+
             log_prediction("RandomForest", True, input_feats, pred, in_listed, deal.label)
 
-# --- Tab 4: Chatbot ---
-# --- Tab 4: Chatbot Assistant ---
-with tabs[3]:
+# --- Tab 5: Chatbot ---
+# --- Tab 5: Chatbot Assistant ---
+with tabs[4]:
     st.subheader("🤖 مساعد الشراء الذكي")
     st.write("اكتب ما تبحث عنه، مثلاً: 'بدي سيارة تويوتا تحت الـ 30000' أو 'Kia 2022 Petrol'")
     
     # استخدام st.form لمنع الـ App من إعادة التحميل عند كل حرف
     with st.form(key='chat_form'):
         chat_input = st.text_input("أدخل طلبك هنا:")
+        sort_labels = {"بدون ترتيب": None, "الأرخص أولاً": "price_asc", "الأغلى أولاً": "price_desc",
+                       "الأحدث أولاً": "newest", "الأقوى أولاً": "horsepower"}
+        chat_sort = st.selectbox("ترتيب النتائج", list(sort_labels))
         submit_button = st.form_submit_button(label='بحث ذكي 🔍')
 
     if submit_button and chat_input:
@@ -137,7 +269,7 @@ with tabs[3]:
             prefs = parse_user_message(chat_input)
             
             # 2. جلب التوصيات
-            recs = recommend(df, prefs)
+            recs = recommend(df, prefs, sort_by=sort_labels[chat_sort], index=get_listing_index())
             
             if recs is not None and not recs.empty:
                 st.success(f"✅ وجدت لك هذه الخيارات الرائعة:")
@@ -153,11 +285,56 @@ with tabs[3]:
             else:
                 st.warning("⚠️ لم أجد تطابقاً دقيقاً. جربي تغيير البحث (مثلاً: اذكر السعر أو الماركة فقط).")
 
-# --- Tab 5: Logs ---
-with tabs[4]:
+# --- Tab 6: Logs ---
+with tabs[5]:
     st.subheader("📜 سجل العمليات (Logs)")
     try:
-        logs_df = read_logs()
-        st.dataframe(logs_df, use_container_width=True)
-    except:
-        st.write("لا يوجد سجلات متاحة حالياً.")
\ No newline at end of file
+        # ملخصات محسوبة داخل SQLite بدل تحميل السجل كاملاً
+        labels_df = label_counts()
+        if labels_df.empty:
+            st.write("لا يوجد سجلات متاحة حالياً.")
+        else:
+            col_sum1, col_sum2 = st.columns(2)
+            with col_sum1:
+                st.plotly_chart(px.bar(labels_df, x="deal_label", y="count", title="عدد العمليات حسب التقييم"), use_container_width=True)
+            with col_sum2:
+                daily_df = daily_diff()
+                st.plotly_chart(px.line(daily_df, x="day", y="mean_diff_amount", title="متوسط فرق السعر اليومي"), use_container_width=True)
+
+            f_c1, f_c2, f_c3 = st.columns(3)
+            f_label = f_c1.selectbox("التقييم", ["الكل"] + labels_df["deal_label"].tolist())
+            f_since = f_c2.date_input("من تاريخ", value=None)
+            page_size = f_c3.selectbox("عدد الصفوف", [25, 50, 100, 200], index=1)
+
+            # ترقيم الصفحات: نحفظ مؤشرات الصفحات السابقة في الجلسة
+            filters_key = (f_label, str(f_since), page_size)
+            if st.session_state.get("logs_filters") != filters_key:
+                st.session_state["logs_filters"] = filters_key
+                st.session_state["logs_cursors"] = [None]
+            cursors = st.session_state["logs_cursors"]
+
+            page_df, next_before_id = query_logs(
+                limit=page_size,
+                before_id=cursors[-1],
+                since=f_since.isoformat() if f_since else None,
+                deal_label=None if f_label == "الكل" else f_label,
+            )
+            st.dataframe(page_df, use_container_width=True)
+
+            nav1, nav2, nav3 = st.columns([1, 1, 4])
+            if nav1.button("⬅️ الأحدث", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+            if nav2.button("الأقدم ➡️", disabled=next_before_id is None):
+                cursors.append(next_before_id)
+                st.rerun()
+            nav3.caption(f"صفحة {len(cursors)}")
+    except Exception:
+        st.write("لا يوجد سجلات متاحة حالياً.")
+
+# --- لوحة الأداء (اختيارية): زمن كل مرحلة منذ بدء العملية ---
+if st.sidebar.checkbox("🐞 لوحة الأداء (Debug)"):
+    st.sidebar.dataframe(pd.DataFrame(metrics.stage_summary()).round(3), use_container_width=True)
+    cache_stats = prediction_cache.stats()
+    st.sidebar.caption(f"الذاكرة المؤقتة: {cache_stats['hit_rate']:.0%} إصابة من {cache_stats['hits'] + cache_stats['misses']} طلب")
+    st.sidebar.caption(f"طابور السجلات: {get_writer().stats()['queue_depth']} | آخر تأخير كتابة: {get_writer().stats()['last_lag_ms']} ms")
\ No newline at end of file
@@ -0,0 +1,63 @@
+"""
+مقارنة سرعة /predict/batch مع تكرار /predict صفاً صفاً.
+التشغيل من جذر المشروع:
+    python -m benchmarks.bench_batch_predict --rows 1000
+"""
+import argparse
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from main_api import app
+from src.config import DATA_PATH
+from src.data_loader import load_data
+
+
+def sample_cars(n_rows, seed=42):
+    """بناء طلبات سيارات من بيانات السوق الحقيقية."""
+    df = load_data(DATA_PATH)
+    sample = df.sample(n=n_rows, replace=True, random_state=seed)
+    return [
+        {
+            "brand": r.Brand,
+            "body_type": r.Body_Type,
+            "year": int(r.Year),
+            "horsepower": float(r.Horsepower),
+            "engine_cc": float(r.Engine_CC),
+            "fuel_type": r.Fuel_Type,
+            "transmission": r.Transmission,
+            "listed_price": float(r.Price_USD),
+        }
+        for r in sample.itertuples()
+    ]
+
+
+def run(n_rows):
+    client = TestClient(app)
+    cars = sample_cars(n_rows)
+
+    start = time.perf_counter()
+    single = [client.post("/predict", json=car).json() for car in cars]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = client.post("/predict/batch", json={"cars": cars}).json()
+    batch_time = time.perf_counter() - start
+
+    # التأكد أن النتيجتين متطابقتان قبل مقارنة السرعة
+    single_prices = np.array([r["ai_predicted_price"] for r in single])
+    batch_prices = np.array([r["ai_predicted_price"] for r in batch["results"]])
+    assert np.allclose(single_prices, batch_prices), "batch results differ from /predict"
+
+    print(f"rows: {n_rows}")
+    print(f"loop over /predict : {loop_time:8.3f}s  ({n_rows / loop_time:10.1f} rows/s)")
+    print(f"/predict/batch     : {batch_time:8.3f}s  ({n_rows / batch_time:10.1f} rows/s)")
+    print(f"speedup            : {loop_time / batch_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500)
+    args = parser.parse_args()
+    run(args.rows)
\ No newline at end of file
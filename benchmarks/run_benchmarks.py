@@ -0,0 +1,254 @@
+"""
+مجموعة قياسات قابلة للتكرار للمسارات الحرجة: تحميل البيانات، التدريب، التوقع، البحث، والسجلات.
+لكل حجم بيانات يُولَّد ملف cars.csv اصطناعي (انظر synthetic_data.py) وتُكتب النتائج كـ JSON.
+مع --baseline تُقارن النتائج بملف سابق ويُرجع الأمر 1 إذا ساء أي قياس أكثر من الحد المسموح.
+
+التشغيل من جذر المشروع:
+    python -m benchmarks.run_benchmarks --sizes 10k,1M
+    python -m benchmarks.run_benchmarks --sizes 10k --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --sizes 10k --baseline benchmarks/baseline.json --tolerance 0.2
+    python -m benchmarks.run_benchmarks --sizes 10M --skip train     # التدريب على 10M صف بطيء جداً
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+import sklearn
+
+from benchmarks.synthetic_data import generate_cars_csv, parse_size
+from src.chatbot_index import ListingIndex
+from src.chatbot_rules import parse_user_message, recommend
+from src.compiled_model import export_compiled
+from src.config import BASE_DIR, REPORTS_DIR
+from src.data_loader import load_data
+from src.feature_store import store_paths
+from src.logging_db import PredictionLogWriter, build_record
+from src.model_registry import current_model_path
+from src.predict import predict_price, predict_prices
+
+BENCH_DATA_DIR = BASE_DIR / "benchmarks" / "data"
+ALL_BENCHMARKS = ["load", "train", "predict", "recommend", "logging"]
+
+CHAT_QUERIES = [
+    "بدي سيارة تويوتا تحت 40 ألف",
+    "want a bmw under 60k",
+    "electric car 2020",
+    "كيا ديزل تحت 30000 دولار",
+    "mercedes 2022",
+    "hybrid under 25k",
+]
+
+
+def _timed(fn, repeats=1):
+    """زمن كل تكرار بالثواني."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return np.asarray(times)
+
+
+def bench_load(csv_path):
+    n_rows = parse_rows(csv_path)
+    for path in store_paths(csv_path):
+        path.unlink(missing_ok=True)
+    cold = _timed(lambda: load_data(csv_path, use_store=True))[0]
+    warm = _timed(lambda: load_data(csv_path, use_store=True), repeats=3).min()
+    stream = _timed(lambda: load_data(csv_path, use_store=False))[0]
+    return {
+        "load_store_cold_s": cold,
+        "load_store_warm_s": warm,
+        "load_stream_s": stream,
+        "load_store_warm_rows_per_s": n_rows / warm,
+        "load_stream_rows_per_s": n_rows / stream,
+    }
+
+
+def bench_train(csv_path, work_dir):
+    """التدريب في عملية منفصلة مع سجل موديلات مؤقت."""
+    env = dict(os.environ, SMARTCAR_MODEL_REGISTRY_DIR=str(work_dir / "registry"))
+    out = subprocess.run([sys.executable, "-m", "benchmarks.train_worker", str(csv_path)],
+                         cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def bench_predict(bundle, df, n_single=200, batch_size=1000):
+    features = bundle["features_used"]
+    rows = df[features].sample(n=max(n_single, batch_size), replace=True, random_state=0).to_dict("records")
+
+    single = _timed_each(lambda row: predict_price(bundle, row), rows[:n_single])
+    batch = _timed(lambda: predict_prices(bundle, rows[:batch_size]), repeats=5)
+    return {
+        "predict_single_p50_ms": float(np.median(single) * 1000.0),
+        "predict_single_p95_ms": float(np.percentile(single, 95) * 1000.0),
+        "predict_batch_ms": float(np.median(batch) * 1000.0),
+        "predict_batch_rows_per_s": float(batch_size / np.median(batch)),
+    }
+
+
+def _timed_each(fn, items):
+    times = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        times.append(time.perf_counter() - start)
+    return np.asarray(times)
+
+
+def bench_recommend(df, repeats=20):
+    build = _timed(lambda: ListingIndex(df))[0]
+    index = ListingIndex(df)
+    prefs = [parse_user_message(q) for q in CHAT_QUERIES] * repeats
+    query = _timed_each(lambda p: recommend(df, p, index=index), prefs)
+    return {
+        "recommend_index_build_s": build,
+        "recommend_p50_ms": float(np.median(query) * 1000.0),
+        "recommend_p95_ms": float(np.percentile(query, 95) * 1000.0),
+    }
+
+
+def bench_logging(work_dir, n_records=20000):
+    # طابور يتسع لكل السجلات حتى نقيس سرعة الكتابة وليس عدد المحذوف
+    writer = PredictionLogWriter(work_dir / "bench_logs.db", "predictions", max_queue_size=n_records + 1)
+    features = {"Brand": "Toyota", "Body_Type": "SUV", "Horsepower": 200.0, "Car_Age": 4}
+    record = build_record("RandomForest", True, features, 30000.0, 28000.0, "fair")
+
+    start = time.perf_counter()
+    for _ in range(n_records):
+        writer.submit(record)
+    enqueue_s = time.perf_counter() - start
+    writer.flush(timeout=120.0)
+    total_s = time.perf_counter() - start
+    writer.close()
+    return {
+        "log_enqueue_us": enqueue_s / n_records * 1e6,
+        "log_writes_per_s": writer.written / total_s,
+        "log_dropped": writer.dropped,
+    }
+
+
+def parse_rows(csv_path):
+    return int(Path(csv_path).with_suffix(".rows").read_text().split(":")[0])
+
+
+def run_size(label, only, data_dir):
+    n_rows = parse_size(label)
+    csv_path = generate_cars_csv(data_dir / f"cars_{label}.csv", n_rows)
+    result = {"rows": n_rows}
+    print(f"\n📦 {label}: {n_rows:,} صف ({csv_path})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        if "load" in only:
+            result.update(bench_load(csv_path))
+        df = load_data(csv_path)
+
+        model_path = current_model_path()
+        if "train" in only:
+            result.update(bench_train(csv_path, work_dir))
+            model_path = Path(result.pop("model_path"))
+        if "predict" in only:
+            bundle = joblib.load(model_path)
+            if "compiled" not in bundle:
+                export_compiled(bundle)
+            result.update(bench_predict(bundle, df))
+        if "recommend" in only:
+            result.update(bench_recommend(df))
+        if "logging" in only:
+            result.update(bench_logging(work_dir))
+
+    result["process_peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    for key, value in result.items():
+        print(f"  {key:<30} {value:,.4f}" if isinstance(value, float) else f"  {key:<30} {value:,}")
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s") or metric.endswith("_r2")
+
+
+def compare(current, baseline, tolerance):
+    """القياسات التي ساءت أكثر من tolerance (نسبة) مقارنة بالـ baseline."""
+    regressions = []
+    for size, metrics in current["results"].items():
+        base_metrics = baseline.get("results", {}).get(size, {})
+        for metric, value in metrics.items():
+            base = base_metrics.get(metric)
+            if not isinstance(base, (int, float)) or not base or metric in ("rows", "log_dropped"):
+                continue
+            change = (value - base) / abs(base)
+            worse = -change if higher_is_better(metric) else change
+            status = "REGRESSION" if worse > tolerance else ("improved" if worse < -tolerance else "ok")
+            print(f"  {size:<5} {metric:<30} {base:>14,.4f} -> {value:>14,.4f}  {change:+7.1%}  {status}")
+            if status == "REGRESSION":
+                regressions.append({"size": size, "metric": metric, "baseline": base,
+                                    "current": value, "change": change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite for data loading, training, inference and logging")
+    parser.add_argument("--sizes", default="10k", help="comma separated dataset sizes, e.g. 10k,1M,10M")
+    parser.add_argument("--only", default=",".join(ALL_BENCHMARKS), help="subset of " + ",".join(ALL_BENCHMARKS))
+    parser.add_argument("--skip", default="", help="benchmarks to skip")
+    parser.add_argument("--data-dir", type=Path, default=BENCH_DATA_DIR)
+    parser.add_argument("--out", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None, help="compare against a saved result file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown before failing")
+    parser.add_argument("--save-baseline", type=Path, default=None, help="also write the results to this path")
+    args = parser.parse_args()
+
+    only = [b for b in args.only.split(",") if b and b not in args.skip.split(",")]
+    report = {
+        "environment": environment(),
+        "benchmarks": only,
+        "results": {size: run_size(size, only, args.data_dir) for size in args.sizes.split(",")},
+    }
+
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = args.out or REPORTS_DIR / f"benchmarks-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\n💾 النتائج: {out}")
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"💾 الـ baseline: {args.save_baseline}")
+
+    if args.baseline:
+        print(f"\n📊 مقارنة مع {args.baseline} (الحد المسموح {args.tolerance:.0%}):")
+        regressions = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} قياس أسوأ من الـ baseline")
+            sys.exit(1)
+        print("✅ لا تراجع في الأداء")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+توليد ملفات cars.csv اصطناعية بنفس أعمدة data/cars.csv وبأي حجم (10k، 1M، 10M صف).
+السعر يعتمد على الماركة والعمر والقوة ونوع الجسم مع ضوضاء، حتى يكون للتدريب معنى.
+الكتابة على دفعات فلا يحتاج ملف 10M صف أكثر من ذاكرة دفعة واحدة.
+
+التشغيل من جذر المشروع:
+    python -m benchmarks.synthetic_data --rows 1000000 --out benchmarks/data/cars_1M.csv
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.features import CURRENT_YEAR
+
+BRAND_BASE_PRICE = {
+    "Toyota": 30000, "Kia": 24000, "Hyundai": 25000, "Nissan": 27000, "Honda": 28000,
+    "Ford": 29000, "BMW": 48000, "Mercedes": 52000, "Audi": 46000, "Tesla": 50000,
+}
+BODY_FACTOR = {"Sedan": 1.0, "SUV": 1.15, "Coupe": 1.1, "Hatchback": 0.9, "Pickup": 1.2}
+FUEL_FACTOR = {"Petrol": 1.0, "Diesel": 1.03, "Hybrid": 1.08, "Electric": 1.12}
+COUNTRIES = ["Germany", "USA", "China", "Japan", "UK", "South Korea"]
+PRICE_CATEGORIES = ["Budget", "Mid-Range", "Premium", "Luxury"]
+
+COLUMNS = ["Car_ID", "Brand", "Manufacture_Year", "Body_Type", "Fuel_Type", "Transmission",
+           "Engine_CC", "Horsepower", "Mileage_km_per_l", "Price_USD", "Manufacturing_Country",
+           "Car_Age", "Price_Category", "HP_per_CC", "Age_Category", "Efficiency_Score"]
+
+
+def parse_size(text) -> int:
+    """'10k' / '1M' / '10M' / '2500' -> عدد الصفوف."""
+    text = str(text).strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def generate_chunk(rng, start, n) -> pd.DataFrame:
+    brands = np.array(list(BRAND_BASE_PRICE))
+    bodies = np.array(list(BODY_FACTOR))
+    fuels = np.array(list(FUEL_FACTOR))
+
+    brand = rng.choice(brands, n)
+    body = rng.choice(bodies, n)
+    fuel = rng.choice(fuels, n)
+    year = rng.integers(2005, 2026, n)
+    engine_cc = rng.integers(1000, 5000, n)
+    horsepower = rng.integers(70, 600, n)
+    mileage = rng.integers(10, 31, n)
+    age = CURRENT_YEAR - year
+
+    base = pd.Series(brand).map(BRAND_BASE_PRICE).to_numpy(dtype=np.float64)
+    price = (
+        base
+        * pd.Series(body).map(BODY_FACTOR).to_numpy()
+        * pd.Series(fuel).map(FUEL_FACTOR).to_numpy()
+        * (1.0 + horsepower / 400.0)
+        * np.exp(-0.045 * age)
+        * rng.lognormal(0.0, 0.12, n)
+    )
+
+    return pd.DataFrame({
+        "Car_ID": [f"CAR_{i:08d}" for i in range(start + 1, start + n + 1)],
+        "Brand": brand,
+        "Manufacture_Year": year,
+        "Body_Type": body,
+        "Fuel_Type": fuel,
+        "Transmission": rng.choice(["Manual", "Automatic"], n),
+        "Engine_CC": engine_cc,
+        "Horsepower": horsepower,
+        "Mileage_km_per_l": mileage,
+        "Price_USD": price,
+        "Manufacturing_Country": rng.choice(COUNTRIES, n),
+        "Car_Age": age,
+        "Price_Category": rng.choice(PRICE_CATEGORIES, n),
+        "HP_per_CC": np.round(horsepower / engine_cc, 4),
+        "Age_Category": np.select([age <= 3, age <= 7, age <= 12], ["New", "Recent", "Moderate"], "Old"),
+        "Efficiency_Score": np.round((mileage - 10) / 20.0, 2),
+    }, columns=COLUMNS)
+
+
+def generate_cars_csv(path, n_rows, seed=42, chunk_size=500_000) -> Path:
+    """كتابة ملف CSV اصطناعي (يُعاد استخدامه إذا كان موجوداً بنفس عدد الصفوف)."""
+    path = Path(path)
+    marker = path.with_suffix(".rows")
+    if path.exists() and marker.exists() and marker.read_text() == f"{n_rows}:{seed}":
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    tmp_path = path.with_suffix(".csv.tmp")
+    for start in range(0, n_rows, chunk_size):
+        chunk = generate_chunk(rng, start, min(chunk_size, n_rows - start))
+        chunk.to_csv(tmp_path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    tmp_path.replace(path)
+    marker.write_text(f"{n_rows}:{seed}")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic cars.csv with the project schema")
+    parser.add_argument("--rows", default="10k", help="row count, e.g. 10k, 1M, 10M")
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(generate_cars_csv(args.out, parse_size(args.rows), args.seed))
\ No newline at end of file
@@ -0,0 +1,32 @@
+"""
+تدريب واحد في عملية مستقلة لقياس زمن التدريب وذروة الذاكرة (RSS) بدقة.
+يُشغّل من run_benchmarks مع SMARTCAR_MODEL_REGISTRY_DIR مؤقت حتى لا يتغير موديل الخدمة.
+يطبع سطر JSON واحد في النهاية.
+"""
+import json
+import resource
+import sys
+import time
+from pathlib import Path
+
+from src.data_loader import load_data
+from src.model_registry import current_model_path
+from src.train import train_price_model
+
+
+def main(csv_path):
+    df = load_data(Path(csv_path))
+    start = time.perf_counter()
+    bundle = train_price_model(df)
+    wall_s = time.perf_counter() - start
+    print(json.dumps({
+        "train_wall_s": wall_s,
+        "train_rows": len(df),
+        "train_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "train_r2": float(bundle["metrics"]["r2"]),
+        "model_path": str(current_model_path()),
+    }))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
\ No newline at end of file
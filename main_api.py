@@ -1,25 +1,147 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+import time
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 import pandas as pd
 import numpy as np
-from src.predict import load_model_bundle, predict_price
-from src.deal import evaluate_deal
-from src.config import MODEL_PATH
+from src.predict import load_model_bundle, predict_intervals
+from src.deal import evaluate_deal, evaluate_deals
+from src.explain import ExplanationUnavailableError, explain_rows
+from src.features import build_input_data, build_input_columns, default_mileage, FEATURES_NUMERIC
+from src.uncertainty import price_intervals
+from src.wire_formats import (JSON, ARROW, NDJSON, UnsupportedFormatError, media_type, negotiate, single_formats,
+                              encode, decode, read_arrow_columns, read_ndjson_columns, write_arrow, iter_ndjson)
+from src.batcher import MicroBatcher, QueueFullError
+from src.prediction_cache import prediction_cache, cache_entry_for
+from src.logging_db import log_prediction, get_writer, query_logs, label_counts, daily_diff
+from src.metrics import metrics
+from src.comparables import get_comparables_index
+from src.drift import DriftMonitor, backfill_from_logs
+from src.feature_store import source_version
+from src.model_registry import current_version, list_models, model_path_for, rollback, set_current, ModelNotFoundError
+from src.config import (DATA_PATH, MAX_BATCH_SIZE, MAX_BULK_BATCH_SIZE, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS,
+                        MICROBATCH_QUEUE_SIZE, MODEL_WATCH_INTERVAL_S, COMPARABLES_K, COMPARABLES_MAX_K,
+                        DRIFT_BACKFILL_LIMIT)
+
+def predict_with_intervals(model, rows):
+    """السعر مع حدي النطاق لكل صف (صف من 3 أرقام لكل طلب في المُجمِّع) من الموديل الذي بدأ به الطلب."""
+    preds, lower, upper, errors = predict_intervals(model, rows)
+    return np.column_stack([preds, lower, upper]), errors
+
+# مُجمِّع الطلبات: يدمج طلبات /predict المتزامنة في استدعاء واحد للموديل
+batcher = MicroBatcher(
+    predict_with_intervals,
+    max_batch_size=MICROBATCH_MAX_SIZE,
+    max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+    max_queue_size=MICROBATCH_QUEUE_SIZE,
+)
+
+def load_serving_bundle():
+    """تحميل النسخة الحالية وتسخينها بتوقع واحد قبل أن تستقبل الطلبات."""
+    # المؤشر يُقرأ مرة واحدة حتى تطابق النسخة المسجلة الملف المحمّل فعلاً
+    version = current_version()
+    new_bundle = load_model_bundle(model_path=model_path_for(version))
+    warmup = {f: 0.0 if f in FEATURES_NUMERIC else "" for f in new_bundle["features_used"]}
+    predict_intervals(new_bundle, [warmup])
+    return version, new_bundle
+
+_reload_lock = asyncio.Lock()
+
+async def reload_model_if_changed(force=False):
+    """
+    تبديل الموديل إذا تغيّر مؤشر النسخة الحالية. التحميل يتم في thread منفصل والتبديل
+    إسناد واحد للمتغير، فالطلبات الجارية تكمل على النسخة التي بدأت بها.
+    """
+    global bundle, loaded_version
+    async with _reload_lock:
+        if not force and current_version() == loaded_version:
+            return False
+        version, new_bundle = await asyncio.to_thread(load_serving_bundle)
+        bundle, loaded_version = new_bundle, version
+        # النتائج المخزنة تخص النسخة السابقة، وإحصاءات الانحراف تُقارن بمرجع النسخة الجديدة
+        prediction_cache.invalidate()
+        drift_monitor.set_reference(new_bundle.get("drift_reference"))
+        print(f"🔄 تم تحميل نسخة الموديل: {version}")
+        return True
+
+async def reload_comparables_if_changed():
+    """تحديث فهرس السيارات المشابهة إذا تغيّر ملف البيانات (الصفوف المضافة فقط تُفهرس)."""
+    global comparables_index
+    version = await asyncio.to_thread(source_version, DATA_PATH)
+    if comparables_index is not None and comparables_index.source == version:
+        return False
+    comparables_index = await asyncio.to_thread(get_comparables_index, DATA_PATH)
+    return True
+
+async def watch_model_pointer():
+    """مراقبة مؤشر السجل في الخلفية (فحص ملف صغير كل MODEL_WATCH_INTERVAL_S ثانية)."""
+    while True:
+        await asyncio.sleep(MODEL_WATCH_INTERVAL_S)
+        try:
+            await reload_model_if_changed()
+        except Exception as e:
+            # نبقى على النسخة الحالية إذا فشل تحميل الجديدة
+            print(f"⚠️ فشل تحميل نسخة الموديل الجديدة: {e}")
+        try:
+            await reload_comparables_if_changed()
+        except Exception as e:
+            print(f"⚠️ فشل تحديث فهرس السيارات المشابهة: {e}")
+        # دمج طلبات الفترة الماضية في إحصاءات الانحراف خارج مسار الطلبات
+        await asyncio.to_thread(drift_monitor.fold)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watcher = asyncio.create_task(watch_model_pointer())
+    yield
+    watcher.cancel()
+    await batcher.stop()
+    # كتابة ما تبقى من السجلات قبل الإغلاق
+    get_writer().close()
 
 # 1. إنشاء التطبيق
 app = FastAPI(
     title="SmartCar AI API",
     description="واجهة برمجة تطبيقات لتوقع أسعار السيارات وتقييم الصفقات بناءً على الذكاء الاصطناعي",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# قياس زمن كل طلب حسب المسار (قالب المسار وليس الرابط الفعلي حتى لا تتضخم التسميات)
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe_request(request.method, route.path if route else "unmatched",
+                            response.status_code, time.perf_counter() - start)
+    return response
+
+metrics.register_collector("smartcar_prediction_cache", prediction_cache.stats)
+metrics.register_collector("smartcar_log_writer", lambda: get_writer().stats())
+metrics.register_collector("smartcar_microbatch", lambda: batcher.stats())
+metrics.register_collector("smartcar_drift", lambda: drift_monitor.stats())
+
 # 2. تحميل الموديل عند التشغيل لضمان السرعة
 try:
-    bundle = load_model_bundle()
+    loaded_version, bundle = load_serving_bundle()
 except Exception as e:
-    bundle = None
+    loaded_version, bundle = None, None
     print(f"⚠️ تحذير: فشل تحميل الموديل. تأكد من تشغيل train.py أولاً. الخطأ: {e}")
 
+# مراقبة انحراف الطلبات عن بيانات تدريب الموديل المحمّل (الموديلات القديمة بدون مرجع: المراقبة متوقفة)
+drift_monitor = DriftMonitor(bundle.get("drift_reference") if bundle else None)
+
+# فهرس السيارات المشابهة (من القرص، أو بفهرسة الصفوف الجديدة فقط)
+try:
+    comparables_index = get_comparables_index(DATA_PATH)
+except Exception as e:
+    comparables_index = None
+    print(f"⚠️ تحذير: فشل بناء فهرس السيارات المشابهة. الخطأ: {e}")
+
 # 3. تعريف نموذج البيانات المدخلة (Schema)
 class CarRequest(BaseModel):
     brand: str
@@ -30,53 +152,445 @@ class CarRequest(BaseModel):
     fuel_type: str
     transmission: str
     listed_price: float = 0.0  # اختياري لتقييم الصفقة
+    mileage_km_per_l: Optional[float] = None  # اختياري؛ بدونه يُستخدم وسيط بيانات التدريب
+
+class ComparablesRequest(CarRequest):
+    k: int = Field(COMPARABLES_K, ge=1, le=COMPARABLES_MAX_K)
+    # تصفية اختيارية: السيارات المشابهة من هذه الماركات/أنواع الجسم فقط
+    brands: Optional[List[str]] = None
+    body_types: Optional[List[str]] = None
+
+class BatchRequest(BaseModel):
+    # نستقبل الصفوف كقواميس حتى لا يُرفض الطلب كاملاً بسبب صف واحد خاطئ
+    cars: List[Dict[str, Any]]
+
+def build_car_input(car: CarRequest, model) -> dict:
+    """تجهيز البيانات المدخلة لتناسب الموديل."""
+    mileage = car.mileage_km_per_l if car.mileage_km_per_l is not None else default_mileage(model)
+    return build_input_data(car.brand, car.body_type, car.year, car.horsepower,
+                            car.engine_cc, car.fuel_type, car.transmission, mileage)
+
+def imputed_fields(car: CarRequest):
+    """الميزات التي لم يرسلها العميل ومُلئت بقيمة افتراضية (لا تدخل في إحصاءات الانحراف)."""
+    return ("Mileage_km_per_l",) if car.mileage_km_per_l is None else ()
 
 # 4. نقطة النهاية (Endpoints)
 @app.get("/")
 def read_root():
     return {"status": "online", "message": "SmartCar AI API is running successfully"}
 
-@app.post("/predict")
-def get_prediction(car: CarRequest):
-    if bundle is None:
+# الطلب يُقرأ يدوياً حسب Content-Type (JSON أو MessagePack)، فنوثق شكله هنا لصفحة /docs
+PREDICT_BODY = {"requestBody": {"required": True, "content": {
+    JSON: {"schema": CarRequest.model_json_schema()},
+    "application/msgpack": {"schema": CarRequest.model_json_schema()},
+}}}
+
+def read_car(body, fmt) -> CarRequest:
+    """التحقق من جسم طلب مفرد (JSON يُحلل ويُتحقق منه مباشرة داخل pydantic)."""
+    try:
+        if fmt == JSON:
+            return CarRequest.model_validate_json(body)
+        return CarRequest.model_validate(decode(body, fmt))
+    except UnsupportedFormatError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed request body: {e}")
+
+@app.post("/predict", openapi_extra=PREDICT_BODY)
+async def get_prediction(request: Request, details: bool = True):
+    """
+    توقع سيارة واحدة. الطلب JSON أو MessagePack (Content-Type)، والرد بنفس الصيغ حسب Accept.
+    details=false يحذف car_details (إعادة المدخلات) من الرد.
+    """
+    model = bundle  # نسخة ثابتة طوال الطلب حتى لو تم تبديل الموديل أثناءه
+    if model is None:
         raise HTTPException(status_code=500, detail="Model bundle not loaded on server")
 
+    with metrics.timer("decode_request"):
+        car = read_car(await request.body(), media_type(request.headers.get("content-type")))
+
     # تجهيز البيانات المدخلة لتناسب الموديل
-    input_data = {
-        "Brand": car.brand,
-        "Body_Type": car.body_type,
-        "Year": car.year,
-        "Horsepower": car.horsepower,
-        "Engine_CC": car.engine_cc,
-        "Fuel_Type": car.fuel_type,
-        "Transmission": car.transmission,
-        "Car_Age": 2026 - car.year,
-        "HP_per_CC": car.horsepower / (car.engine_cc + 1),
-        "Mileage_km_per_l": 15.0
-    }
+    with metrics.timer("build_input"):
+        input_data = build_car_input(car, model)
+        imputed = imputed_fields(car)
 
     try:
-        # التوقع
-        predicted_price = predict_price(bundle, input_data)
+        # التوقع: من الذاكرة المؤقتة إن وُجد، وإلا عبر المُجمِّع مع باقي الطلبات المتزامنة
+        with metrics.timer("cache_lookup"):
+            canonical, cache_key = cache_entry_for(model, input_data)
+            estimate = prediction_cache.get(cache_key)
+        if estimate is None:
+            # يشمل الانتظار في طابور المُجمِّع + التوقع نفسه (preprocess و forest تُقاس داخله)
+            with metrics.timer("microbatch_wait"):
+                estimate = await batcher.submit(canonical, model)
+            prediction_cache.put(cache_key, estimate)
+        predicted_price, lower, upper = estimate
+        # مراقبة الانحراف: إضافة للمخزن المؤقت فقط (الدمج دفعات)
+        drift_monitor.observe(input_data, predicted_price, imputed)
         
         # التقييم (في حال تم تزويدنا بسعر معروض)
         deal_info = None
         if car.listed_price > 0:
-            deal = evaluate_deal(car.listed_price, predicted_price, bundle['metrics']['mae'], bundle['metrics']['r2'])
+            with metrics.timer("evaluate_deal"):
+                deal = evaluate_deal(car.listed_price, predicted_price, model['metrics']['mae'], model['metrics']['r2'],
+                                     lower=lower, upper=upper)
             deal_info = {
                 "label": deal.label,
                 "fair_range": {"lower": round(deal.lower, 2), "upper": round(deal.upper, 2)},
                 "confidence_score": f"{deal.confidence_score}%"
             }
 
-        return {
-            "car_details": car,
+        # التسجيل يضاف لطابور في الذاكرة فقط؛ الكتابة على القرص في الخلفية
+        with metrics.timer("log_enqueue"):
+            logged = {**input_data, "_imputed": list(imputed)} if imputed else input_data
+            log_prediction(model.get("model_type", "RandomForest"), model.get("use_log_target", True), logged,
+                           predicted_price, car.listed_price, deal_info["label"] if deal_info else "")
+
+        payload = {
             "ai_predicted_price": round(predicted_price, 2),
             "deal_analysis": deal_info
         }
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Server busy, retry shortly", headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"خطأ أثناء المعالجة: {str(e)}")
 
+    if details:
+        payload = {"car_details": car.model_dump(), **payload}
+    with metrics.timer("encode_response"):
+        fmt = negotiate(request.headers.get("accept"), single_formats())
+        return Response(encode(payload, fmt), media_type=fmt)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """زمن كل مرحلة وكل مسار (histograms) وعدادات الذاكرة المؤقتة والسجلات بصيغة Prometheus."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/drift")
+def get_drift():
+    """
+    انحراف طلبات التوقع عن بيانات تدريب الموديل المحمّل: PSI و KS لكل ميزة رقمية وللسعر المتوقع،
+    وتغيرات نسب الفئات للميزات النصية، وحالة عامة (stable / warning / drift).
+    """
+    return drift_monitor.report()
+
+@app.post("/drift/backfill")
+def backfill_drift(limit: int = Query(DRIFT_BACKFILL_LIMIT, ge=1), since: Optional[str] = None,
+                   model_type: Optional[str] = None, reset: bool = True):
+    """إعادة بناء إحصاءات الانحراف من سجل التوقعات (مثلاً بعد إعادة تشغيل الخدمة)."""
+    if reset:
+        drift_monitor.set_reference(bundle.get("drift_reference") if bundle else None)
+    if drift_monitor.reference is None:
+        raise HTTPException(status_code=409, detail="Loaded model has no drift reference; retrain it first")
+    added = backfill_from_logs(drift_monitor, limit, since, model_type)
+    return {"backfilled": added, **drift_monitor.report()}
+
+@app.get("/predict/stats")
+def get_batcher_stats():
+    """عمق الطابور وأحجام الدفعات لمراقبة المُجمِّع."""
+    return batcher.stats()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """عدادات الإصابة/الإخفاق/الإزاحة للذاكرة المؤقتة للتوقعات."""
+    return prediction_cache.stats()
+
+@app.get("/logs/writer")
+def get_log_writer_stats():
+    """عمق طابور السجلات والسجلات المحذوفة وتأخر الكتابة."""
+    return get_writer().stats()
+
+@app.get("/logs")
+def get_logs(limit: int = Query(50, ge=1, le=500), before_id: Optional[int] = None,
+             since: Optional[str] = None, until: Optional[str] = None,
+             deal_label: Optional[str] = None, model_type: Optional[str] = None):
+    """صفحة من سجل التوقعات؛ مرر next_before_id كـ before_id لجلب الصفحة التالية."""
+    page, next_before_id = query_logs(limit, before_id, since, until, deal_label, model_type)
+    return {"items": page.to_dict(orient="records"), "next_before_id": next_before_id}
+
+@app.get("/logs/summary/labels")
+def get_log_label_counts(since: Optional[str] = None, until: Optional[str] = None,
+                         model_type: Optional[str] = None):
+    return label_counts(since, until, model_type).to_dict(orient="records")
+
+@app.get("/logs/summary/daily")
+def get_log_daily_diff(since: Optional[str] = None, until: Optional[str] = None,
+                       deal_label: Optional[str] = None, model_type: Optional[str] = None):
+    return daily_diff(since, until, deal_label, model_type).to_dict(orient="records")
+
+# حقول CarRequest في الطلبات العمودية (Arrow IPC / NDJSON)
+CAR_NUMERIC_FIELDS = ["year", "horsepower", "engine_cc"]
+CAR_TEXT_FIELDS = ["brand", "body_type", "fuel_type", "transmission"]
+
+def score_car_columns(model, raw):
+    """
+    تقييم دفعة عمودية (اسم الحقل -> مصفوفة) كمصفوفات من البداية للنهاية: التحقق، الميزات،
+    التوقع والصفقة بدون كائن Python لكل سيارة. تُرجع أعمدة النتيجة (صف لكل سيارة بنفس الترتيب،
+    والصف غير الصالح قيمته NaN مع سبب الخطأ في error).
+    """
+    missing = [f for f in CAR_TEXT_FIELDS + CAR_NUMERIC_FIELDS if f not in raw]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"missing fields: {', '.join(missing)}")
+    n = len(raw[CAR_TEXT_FIELDS[0]])
+    if n > MAX_BULK_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BULK_BATCH_SIZE} cars)")
+
+    values, invalid = {}, {}
+    for f in CAR_NUMERIC_FIELDS:
+        values[f] = pd.to_numeric(pd.Series(raw[f]), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        invalid[f] = ~np.isfinite(values[f])
+    # السعر المعروض اختياري كما في CarRequest: المفقود أو الفارغ يساوي 0 (بدون تقييم صفقة) ولا يُبطل الصف
+    listed = pd.to_numeric(pd.Series(raw.get("listed_price", np.zeros(n))),
+                           errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    listed = np.where(np.isfinite(listed), listed, 0.0)
+    # استهلاك الوقود اختياري: المفقود يُملأ بوسيط التدريب ولا يُبطل الصف
+    mileage = pd.to_numeric(pd.Series(raw.get("mileage_km_per_l", np.full(n, np.nan))),
+                            errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    imputed_mileage = ~np.isfinite(mileage)
+    mileage = np.where(imputed_mileage, default_mileage(model), mileage)
+    for f in CAR_TEXT_FIELDS:
+        column = pd.Series(raw[f], dtype=object)
+        invalid[f] = column.isna().to_numpy()
+        values[f] = column.astype(str).to_numpy()
+    valid = ~np.logical_or.reduce(list(invalid.values()))
+
+    preds, lower, upper = (np.full(n, np.nan) for _ in range(3))
+    if valid.any():
+        columns = build_input_columns(*(values[f][valid] for f in
+                                        ["brand", "body_type", "year", "horsepower", "engine_cc", "fuel_type", "transmission"]),
+                                      mileage[valid])
+        preds[valid], lower[valid], upper[valid] = price_intervals(model, columns)
+        drift_monitor.observe_columns(columns, preds[valid], {"Mileage_km_per_l": imputed_mileage[valid]})
+
+    listed = np.where(valid, listed, 0.0)
+    deals = evaluate_deals(listed, preds, model['metrics']['mae'], model['metrics']['r2'], lower=lower, upper=upper)
+    has_deal = valid & (listed > 0)
+
+    errors = np.full(n, None, dtype=object)
+    for i in np.flatnonzero(~valid):
+        errors[i] = "invalid or missing: " + ", ".join(f for f in invalid if invalid[f][i])
+    return {
+        "index": np.arange(n),
+        "ai_predicted_price": np.round(preds, 2),
+        "deal_label": np.where(has_deal, deals.labels, None),
+        "fair_lower": np.where(has_deal, np.round(deals.lower, 2), np.nan),
+        "fair_upper": np.where(has_deal, np.round(deals.upper, 2), np.nan),
+        "confidence_score": np.where(has_deal, deals.confidence, np.nan),
+        "error": errors,
+    }
+
+def column_records(result):
+    """نتيجة score_car_columns بنفس شكل ردود JSON (نتيجة أو خطأ لكل سيارة)."""
+    columns = {name: values.tolist() for name, values in result.items()}
+    for i, price, label, low, high, confidence, error in zip(
+            columns["index"], columns["ai_predicted_price"], columns["deal_label"], columns["fair_lower"],
+            columns["fair_upper"], columns["confidence_score"], columns["error"]):
+        if error is not None:
+            yield {"index": i, "error": error}
+            continue
+        deal_info = None
+        if label is not None:
+            deal_info = {"label": label, "fair_range": {"lower": low, "upper": high},
+                         "confidence_score": f"{confidence}%"}
+        yield {"index": i, "ai_predicted_price": price, "deal_analysis": deal_info}
+
+def columnar_response(result, fmt):
+    if fmt == ARROW:
+        return Response(write_arrow(result), media_type=ARROW)
+    if fmt == NDJSON:
+        return StreamingResponse(iter_ndjson(column_records(result)), media_type=NDJSON)
+    results, errors = [], []
+    for record in column_records(result):
+        (errors if "error" in record else results).append(record)
+    return Response(encode({"results": results, "errors": errors}, JSON), media_type=JSON)
+
+def json_batch_response(model, body, details, fmt):
+    """دفعة JSON ({"cars": [...]}): التحقق من كل صف عبر CarRequest كما كان."""
+    try:
+        request = BatchRequest.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    if len(request.cars) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} cars)")
+
+    # 1. التحقق من كل صف على حدة وجمع الأخطاء بدل رفض الدفعة كاملة
+    cars, rows, errors = [], [], []
+    for i, raw in enumerate(request.cars):
+        try:
+            car = CarRequest.model_validate(raw)
+        except ValidationError as e:
+            msg = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            errors.append({"index": i, "error": msg})
+            continue
+        cars.append((i, car))
+        rows.append(build_car_input(car, model))
+
+    # 2. استدعاء واحد للموديل على كل الصفوف الصالحة
+    preds, lower, upper, row_errors = predict_intervals(model, rows)
+    predicted = np.flatnonzero(~np.isnan(preds))
+    drift_monitor.observe_rows([rows[j] for j in predicted], preds[predicted].tolist(),
+                               [imputed_fields(cars[j][1]) for j in predicted])
+    for err in row_errors:
+        errors.append({"index": cars[err["index"]][0], "error": err["error"]})
+
+    # 3. تقييم الصفقات كعمليات مصفوفات
+    listed = np.array([car.listed_price for _, car in cars], dtype=float)
+    deals = evaluate_deals(listed, preds, model['metrics']['mae'], model['metrics']['r2'], lower=lower, upper=upper)
+
+    results = []
+    for j, (i, car) in enumerate(cars):
+        if np.isnan(preds[j]):
+            continue
+        deal_info = None
+        if listed[j] > 0:
+            deal_info = {
+                "label": str(deals.labels[j]),
+                "fair_range": {"lower": round(float(deals.lower[j]), 2), "upper": round(float(deals.upper[j]), 2)},
+                "confidence_score": f"{float(deals.confidence[j])}%"
+            }
+        result = {"index": i}
+        if details:
+            result["car_details"] = car.model_dump()
+        result.update(ai_predicted_price=round(float(preds[j]), 2), deal_analysis=deal_info)
+        results.append(result)
+
+    errors.sort(key=lambda e: e["index"])
+    if fmt == NDJSON:
+        return StreamingResponse(iter_ndjson(sorted(results + errors, key=lambda r: r["index"])), media_type=NDJSON)
+    return Response(encode({"results": results, "errors": errors}, JSON), media_type=JSON)
+
+BATCH_BODY = {"requestBody": {"required": True, "content": {
+    JSON: {"schema": BatchRequest.model_json_schema()},
+    ARROW: {"schema": {"type": "string", "format": "binary"}},
+    NDJSON: {"schema": {"type": "string", "description": "one car object per line"}},
+}}}
+
+@app.post("/predict/batch", openapi_extra=BATCH_BODY)
+async def get_batch_prediction(request: Request, details: bool = True):
+    """
+    توقع دفعة سيارات. الطلب: JSON ({"cars": [...]})، أو Arrow IPC stream بعمود لكل حقل من CarRequest،
+    أو NDJSON (سيارة في كل سطر). الطلبات العمودية تذهب مباشرة لمصفوفات الميزات ولا تعيد المدخلات.
+    الرد حسب Accept: JSON، أو NDJSON (يُبث سطراً سطراً)، أو Arrow IPC (عمود لكل حقل نتيجة).
+    """
+    model = bundle
+    if model is None:
+        raise HTTPException(status_code=500, detail="Model bundle not loaded on server")
+
+    fmt = media_type(request.headers.get("content-type"))
+    body = await request.body()
+    # الطلبات العمودية ترد افتراضياً بنفس صيغتها
+    default = fmt if fmt in (ARROW, NDJSON) else JSON
+    out = negotiate(request.headers.get("accept"), [JSON, NDJSON, ARROW], default)
+
+    def run():
+        if fmt == JSON:
+            if out == ARROW:
+                raise HTTPException(status_code=406, detail="Arrow responses need a columnar (Arrow or NDJSON) request")
+            return json_batch_response(model, body, details, out)
+        try:
+            with metrics.timer("decode_request"):
+                raw = read_arrow_columns(body) if fmt == ARROW else read_ndjson_columns(body) if fmt == NDJSON else None
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=f"Malformed request body: {e}")
+        if raw is None:
+            raise HTTPException(status_code=415, detail=f"Unsupported content type: {fmt}")
+        result = score_car_columns(model, raw)
+        with metrics.timer("encode_response"):
+            return columnar_response(result, out)
+
+    # التحليل والتوقع خارج حلقة الأحداث (مثل مسارات def العادية)
+    return await asyncio.to_thread(run)
+
+@app.post("/explain")
+def explain_prediction(car: CarRequest):
+    """
+    لماذا هذا السعر؟ سعر الأساس (متوسط الموديل) ومساهمة كل ميزة بالدولار، مرتبة من الأكبر أثراً.
+    مجموع المساهمات = السعر المتوقع - سعر الأساس.
+    """
+    model = bundle
+    if model is None:
+        raise HTTPException(status_code=500, detail="Model bundle not loaded on server")
+    try:
+        results, errors = explain_rows(model, [build_car_input(car, model)])
+    except ExplanationUnavailableError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if errors:
+        raise HTTPException(status_code=400, detail=f"خطأ أثناء المعالجة: {errors[0]['error']}")
+    result = results[0]
+    del result["index"]
+    return result
+
+@app.post("/explain/batch")
+def explain_batch(request: BatchRequest):
+    """تفسير عدة سيارات في مرور واحد على الغابة (نفس شكل أخطاء /predict/batch)."""
+    model = bundle
+    if model is None:
+        raise HTTPException(status_code=500, detail="Model bundle not loaded on server")
+    if len(request.cars) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} cars)")
+
+    cars, rows, errors = [], [], []
+    for i, raw in enumerate(request.cars):
+        try:
+            car = CarRequest.model_validate(raw)
+        except ValidationError as e:
+            msg = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            errors.append({"index": i, "error": msg})
+            continue
+        cars.append(i)
+        rows.append(build_car_input(car, model))
+
+    try:
+        results, row_errors = explain_rows(model, rows)
+    except ExplanationUnavailableError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    for result in results:
+        result["index"] = cars[result["index"]]
+    errors += [{"index": cars[err["index"]], "error": err["error"]} for err in row_errors]
+    errors.sort(key=lambda e: e["index"])
+    return {"results": results, "errors": errors}
+
+@app.post("/comparables")
+def get_comparables(request: ComparablesRequest):
+    """أقرب k سيارة معروضة في السوق للسيارة المطلوبة (مع رقم الصف في cars.csv والمسافة)."""
+    index = comparables_index
+    if index is None:
+        raise HTTPException(status_code=503, detail="Comparables index not loaded on server")
+    # الموديل يلزم فقط لقيمة استهلاك الوقود الافتراضية
+    car = build_car_input(request, bundle or {})
+    with metrics.timer("comparables_search"):
+        result = index.query(car, request.k, request.brands, request.body_types)
+    return {"count": len(result), "comparables": result.round({"Distance": 4}).to_dict(orient="records")}
+
+class ActivateRequest(BaseModel):
+    version: Optional[str] = None
+
+@app.get("/models")
+def get_models():
+    """كل نسخ الموديل في السجل، والنسخة الحالية، والنسخة المحملة فعلياً في هذه العملية."""
+    return {"current": current_version(), "loaded": loaded_version, "models": list_models()}
+
+@app.post("/models/rollback")
+async def rollback_model(request: ActivateRequest = ActivateRequest()):
+    """الرجوع لنسخة محددة أو للنسخة السابقة، ثم التبديل فوراً في هذه العملية (والبقية عبر المراقبة)."""
+    try:
+        version = rollback(request.version)
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Model version not found: {e}")
+    await reload_model_if_changed()
+    return {"current": version, "loaded": loaded_version}
+
+@app.post("/models/{version}/activate")
+async def activate_model(version: str):
+    try:
+        set_current(version)
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Model version not found: {e}")
+    await reload_model_if_changed()
+    return {"current": version, "loaded": loaded_version}
+
 # لتشغيل السيرفر محلياً
 if __name__ == "__main__":
     import uvicorn
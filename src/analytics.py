@@ -1,5 +1,9 @@
 import pandas as pd
 
+# حدود فئات العمر (يستخدمها أيضاً مكعب التجميعات في market_cube)
+AGE_BINS = [0, 3, 8, 15, 100]
+AGE_LABELS = ["New (0-3y)", "Modern (4-8y)", "Used (9-15y)", "Classic (>15y)"]
+
 def dataset_kpis(df: pd.DataFrame) -> dict:
     """
     حساب المؤشرات الرئيسية للأداء مع إضافة مقاييس التشتت
@@ -53,9 +57,7 @@ def price_by_age_bracket(df: pd.DataFrame) -> pd.DataFrame:
     if "Car_Age" not in df.columns:
         return pd.DataFrame()
         
-    bins = [0, 3, 8, 15, 100]
-    labels = ["New (0-3y)", "Modern (4-8y)", "Used (9-15y)", "Classic (>15y)"]
-    df['Age_Bracket'] = pd.cut(df['Car_Age'], bins=bins, labels=labels)
+    df['Age_Bracket'] = pd.cut(df['Car_Age'], bins=AGE_BINS, labels=AGE_LABELS)
     
     return (
         df.groupby("Age_Bracket")["Price_USD"]
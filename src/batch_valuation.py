@@ -0,0 +1,255 @@
+"""
+تقييم جماعي لملف CSV كامل (مثل إعادة تقييم المخزون ليلاً) بدل استدعاء /predict لكل صف.
+
+- الملف يُقسَّم لمقاطع بايتات عند حدود الأسطر (كل مقطع BATCH_CHUNK_ROWS صفاً)، فكل عملية
+  تقرأ وتحلل مقطعها بنفسها: القراءة والتوقع والكتابة كلها تتوزع على العمليات.
+- الميزات المشتقة (Car_Age, HP_per_CC) بنفس منطق load_data، والصفقة بـ evaluate_deals (مصفوفات).
+- الكتابة تدريجية بترتيب المقاطع: CSV واحد، أو مجلد Parquet (ملف لكل مقطع).
+- ملف تقدّم <out>.progress.json يُحدَّث بعد كل مقطع؛ إعادة تشغيل نفس الأمر بعد توقف مفاجئ تكمل
+  من آخر مقطع مكتمل (إلا مع --restart أو إذا تغيّر ملف الإدخال).
+
+ملاحظة: التقسيم بالبايتات يفترض أن الحقول لا تحتوي أسطراً جديدة داخل علامات الاقتباس.
+
+التشغيل من جذر المشروع:
+    python -m src.batch_valuation data/inventory.csv --out reports/inventory_valued.csv
+    python -m src.batch_valuation data/inventory.csv --out reports/valued.parquet --workers 8
+"""
+import argparse
+import io
+import json
+import os
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.config import BATCH_CHUNK_ROWS, BATCH_WORKERS, PREDICT_BACKEND
+from src.deal import evaluate_deals
+from src.feature_store import add_derived_features
+from src.features import TARGET_COLUMN, default_mileage
+from src.predict import load_model_bundle, predict_frame_intervals
+
+# الأعمدة الرقمية الخام التي تُشتق منها الميزات
+RAW_NUMERIC_COLUMNS = ["Year", "Manufacture_Year", "Horsepower", "Engine_CC", "Mileage_km_per_l"]
+
+# حجم الكتلة عند البحث عن حدود الأسطر
+SCAN_BLOCK_SIZE = 16 << 20
+
+# يُضبط في كل عملية مرة واحدة عند بدء الـ Pool
+_worker_state = {}
+
+
+def chunk_ranges(path, chunk_rows=BATCH_CHUNK_ROWS):
+    """(سطر العناوين، قائمة (بداية، نهاية) بالبايت لكل مقطع من chunk_rows صفاً)."""
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        header = f.readline()
+        ranges, start, pos, lines = [], len(header), len(header), 0
+        while True:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n"))
+            # مواقع الأسطر التي تُغلق مقطعاً داخل هذه الكتلة
+            cut_idx = np.arange(chunk_rows - lines - 1, len(newlines), chunk_rows)
+            for cut in newlines[cut_idx]:
+                end = pos + int(cut) + 1
+                ranges.append((start, end))
+                start = end
+            lines = (lines + len(newlines)) % chunk_rows
+            pos += len(block)
+    if start < size:
+        ranges.append((start, size))
+    return header, ranges
+
+
+def _fingerprint(path, chunk_rows):
+    st = path.stat()
+    return {"input": str(path.resolve()), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "chunk_rows": chunk_rows}
+
+
+def _progress_path(out):
+    return out.with_name(f"{out.name}.progress.json")
+
+
+def _read_progress(out, fingerprint):
+    try:
+        progress = json.loads(_progress_path(out).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    return progress if progress.get("fingerprint") == fingerprint else None
+
+
+def _write_progress(out, progress):
+    path = _progress_path(out)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_text(json.dumps(progress, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def value_frame(bundle, chunk, price_column=TARGET_COLUMN):
+    """إضافة السعر المتوقع وتقييم الصفقة لدفعة (الصفوف غير الصالحة: NaN بدون تقييم)."""
+    input_columns = set(chunk.columns)
+    # قيمة غير رقمية في صف واحد لا يجب أن توقف الدفعة كاملة: تصبح NaN ويُستبعد الصف فقط
+    for column in RAW_NUMERIC_COLUMNS:
+        if column in input_columns:
+            chunk[column] = pd.to_numeric(chunk[column], errors="coerce")
+    chunk = add_derived_features(chunk)
+    if "Mileage_km_per_l" not in input_columns:
+        chunk["Mileage_km_per_l"] = default_mileage(bundle)
+    preds, lower, upper = predict_frame_intervals(bundle, chunk)
+    # عمود السنة الموحد يلزم الحساب فقط؛ لا نضيفه للناتج إن لم يكن في الإدخال
+    if "Year" not in input_columns:
+        chunk = chunk.drop(columns="Year")
+    chunk["Predicted_Price_USD"] = np.round(preds, 2)
+
+    if price_column in chunk.columns:
+        listed = pd.to_numeric(chunk[price_column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        deals = evaluate_deals(listed, preds, bundle["metrics"]["mae"], bundle["metrics"]["r2"],
+                               lower=lower, upper=upper)
+        scored = np.isfinite(preds) & np.isfinite(listed)
+        chunk["Deal_Label"] = np.where(scored, deals.labels, "")
+        chunk["Fair_Lower_USD"] = np.round(deals.lower, 2)
+        chunk["Fair_Upper_USD"] = np.round(deals.upper, 2)
+        chunk["Confidence"] = deals.confidence
+    return chunk
+
+
+def _init_worker(backend, input_path, header, out, fmt, price_column):
+    _worker_state.update(bundle=load_model_bundle(backend), input_path=input_path, header=header,
+                         out=out, fmt=fmt, price_column=price_column)
+
+
+def _score_range(task):
+    """قراءة مقطع وتقييمه. CSV: يُرجع النص الجاهز للكتابة؛ Parquet: يكتب ملف المقطع بنفسه."""
+    index, start, end = task
+    state = _worker_state
+    with open(state["input_path"], "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    chunk = pd.read_csv(io.BytesIO(state["header"] + data))
+    chunk = value_frame(state["bundle"], chunk, state["price_column"])
+    n_invalid = int(chunk["Predicted_Price_USD"].isna().sum())
+
+    if state["fmt"] == "parquet":
+        part = state["out"] / f"part-{index:05d}.parquet"
+        tmp_path = part.with_name(f"{part.name}.tmp")
+        chunk.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, part)
+        payload = None
+    else:
+        payload = chunk.to_csv(index=False, header=index == 0).encode("utf-8")
+    return index, len(chunk), n_invalid, payload
+
+
+def _output_format(out):
+    return "parquet" if out.suffix == ".parquet" else "csv"
+
+
+def run_batch(input_path, out, workers=BATCH_WORKERS, chunk_rows=BATCH_CHUNK_ROWS,
+              backend=None, price_column=TARGET_COLUMN, restart=False) -> dict:
+    input_path, out = Path(input_path), Path(out)
+    fmt = _output_format(out)
+    # الأشجار تُقرأ من ملف mmap مشترك بين العمليات بدل نسخة كاملة لكل عملية
+    backend = backend or ("shared" if PREDICT_BACKEND == "compiled" else PREDICT_BACKEND)
+    if backend == "shared":
+        from src.shared_model import ensure_shared
+        ensure_shared()
+    elif backend == "compact":
+        from src.compact_model import ensure_compact
+        ensure_compact()
+
+    header, ranges = chunk_ranges(input_path, chunk_rows)
+    fingerprint = _fingerprint(input_path, chunk_rows)
+    progress = None if restart else _read_progress(out, fingerprint)
+    if progress is None:
+        progress = {"fingerprint": fingerprint, "chunks_done": 0, "rows_done": 0,
+                    "invalid_rows": 0, "out_bytes": 0}
+        if fmt == "parquet":
+            out.mkdir(parents=True, exist_ok=True)
+            for part in out.glob("part-*.parquet"):
+                part.unlink()
+        else:
+            out.parent.mkdir(parents=True, exist_ok=True)
+            out.write_bytes(b"")
+    else:
+        print(f"↩️ استكمال من المقطع {progress['chunks_done']} ({progress['rows_done']:,} صف مكتمل)")
+
+    total = len(ranges)
+    tasks = [(i, start, end) for i, (start, end) in enumerate(ranges) if i >= progress["chunks_done"]]
+    started, rows_at_start = time.perf_counter(), progress["rows_done"]
+    print(f"🚀 {total} مقطع × {chunk_rows:,} صف على {workers} عملية ({backend}) -> {out}")
+
+    initargs = (backend, input_path, header, out, fmt, price_column)
+    csv_file = None
+    if fmt == "csv":
+        # ما كُتب بعد آخر تقدّم مسجَّل (قبل التوقف) يُحذف
+        csv_file = open(out, "r+b")
+        csv_file.truncate(progress["out_bytes"])
+        csv_file.seek(progress["out_bytes"])
+    try:
+        if workers > 1:
+            pool = Pool(workers, initializer=_init_worker, initargs=initargs)
+            results = pool.imap(_score_range, tasks)
+        else:
+            pool = None
+            _init_worker(*initargs)
+            results = map(_score_range, tasks)
+
+        for index, n_rows, n_invalid, payload in results:
+            if csv_file is not None:
+                csv_file.write(payload)
+                csv_file.flush()
+                os.fsync(csv_file.fileno())
+                progress["out_bytes"] = csv_file.tell()
+            progress["chunks_done"] = index + 1
+            progress["rows_done"] += n_rows
+            progress["invalid_rows"] += n_invalid
+            elapsed = time.perf_counter() - started
+            _write_progress(out, progress)
+
+            rate = (progress["rows_done"] - rows_at_start) / elapsed if elapsed else 0.0
+            remaining = (total - index - 1) * chunk_rows / rate if rate else float("nan")
+            print(f"  [{index + 1}/{total}] {progress['rows_done']:,} صف | {rate:,.0f} صف/ث | المتبقي ~{remaining:,.0f} ث")
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "input": str(input_path),
+        "output": str(out),
+        "rows": progress["rows_done"],
+        "invalid_rows": progress["invalid_rows"],
+        "chunks": total,
+        "workers": workers,
+        "backend": backend,
+        "seconds": elapsed,
+        "rows_per_s": (progress["rows_done"] - rows_at_start) / elapsed if elapsed else 0.0,
+    }
+    _progress_path(out).unlink(missing_ok=True)
+
+    print("\n" + "=" * 30)
+    print(f"✅ تم تقييم {summary['rows']:,} صف ({summary['invalid_rows']:,} غير صالح) في {elapsed:,.1f} ث")
+    print(f"⚡ {summary['rows_per_s']:,.0f} صف/ث على {workers} عملية")
+    print("=" * 30)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Value every car in a CSV file with the current price model")
+    parser.add_argument("input", type=Path)
+    parser.add_argument("--out", type=Path, required=True, help=".csv file or .parquet directory")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=BATCH_CHUNK_ROWS)
+    parser.add_argument("--backend", choices=["shared", "compact", "compiled", "sklearn"], default=None)
+    parser.add_argument("--price-column", default=TARGET_COLUMN, help="listed price column used for the deal label")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and start over")
+    args = parser.parse_args()
+    run_batch(args.input, args.out, args.workers, args.chunk_rows, args.backend, args.price_column, args.restart)
\ No newline at end of file
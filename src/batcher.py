@@ -0,0 +1,156 @@
+"""
+مُجمِّع طلبات غير متزامن (Micro-batching) لخدمة FastAPI.
+يجمع طلبات /predict المتزامنة في طابور ويرسلها للموديل كاستدعاء واحد
+عند امتلاء الدفعة أو انتهاء مهلة الانتظار. كل طلب يحمل الموديل الذي بدأ به (context)،
+فالدفعة التي تجمع طلبات قبل وبعد تبديل الموديل تُقسم حسبه.
+"""
+import asyncio
+import time
+
+import numpy as np
+
+
+class QueueFullError(Exception):
+    """الطابور ممتلئ؛ على الـ API الرد بـ 503 بدل انتظار غير محدود."""
+
+
+def _set_exception(future, error):
+    if future.done():
+        return
+    try:
+        future.set_exception(error)
+    except RuntimeError:  # الـ loop الخاص به أُغلق؛ لا أحد ينتظره
+        pass
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=64, max_wait_ms=2.0, max_queue_size=1000):
+        # predict_fn(context, rows) -> (preds, errors) بنفس شكل predict_prices؛
+        # كل عنصر في preds رقم واحد أو صف أرقام (مثل السعر مع حدي النطاق)
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self._queue = None
+        self._worker = None
+        self._loop = None
+
+        # مؤشرات المراقبة
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self.last_batch_size = 0
+        self.max_seen_batch_size = 0
+
+    def _ensure_started(self):
+        """تشغيل العامل عند أول طلب حتى يرتبط بالـ event loop الحالي."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._fail_pending(RuntimeError("micro-batcher restarted before this request was processed"))
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._worker = loop.create_task(self._run())
+
+    def _fail_pending(self, error):
+        """إنهاء الطلبات التي بقيت في الطابور القديم بخطأ بدل تركها معلقة للأبد."""
+        if self._queue is None:
+            return
+        old_loop = self._loop
+        while True:
+            try:
+                _, _, future = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if future.done():
+                continue
+            if old_loop is not None and not old_loop.is_closed() and old_loop is not asyncio.get_running_loop():
+                # الـ future يخص loop آخر ما زال يعمل: يُنهى من داخله
+                old_loop.call_soon_threadsafe(_set_exception, future, error)
+            else:
+                _set_exception(future, error)
+
+    async def submit(self, row, context=None):
+        """إضافة صف للطابور وانتظار نتيجته (السعر المتوقع أو صف النتائج) من الموديل context."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((row, context, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError("prediction queue is full")
+        return await future
+
+    async def _collect(self):
+        """انتظار أول عنصر ثم جمع البقية حتى الحجم الأقصى أو انتهاء المهلة."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # استدعاء واحد لكل موديل في الدفعة (عادة موديل واحد؛ اثنان فقط أثناء التبديل)
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item[1]), []).append(item)
+            for group in groups.values():
+                await self._predict_group(group)
+
+            self.batches += 1
+            self.items += len(batch)
+            self.last_batch_size = len(batch)
+            self.max_seen_batch_size = max(self.max_seen_batch_size, len(batch))
+
+    async def _predict_group(self, batch):
+        rows = [row for row, _, _ in batch]
+        try:
+            # الموديل يعمل في thread حتى لا يحجب الـ event loop
+            preds, errors = await asyncio.to_thread(self.predict_fn, batch[0][1], rows)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        row_errors = {err["index"]: err["error"] for err in errors}
+        for i, (_, _, future) in enumerate(batch):
+            if future.done():  # العميل ألغى الطلب
+                continue
+            if i in row_errors:
+                future.set_exception(ValueError(row_errors[i]))
+            elif np.ndim(preds[i]):
+                future.set_result(tuple(float(v) for v in preds[i]))
+            else:
+                future.set_result(float(preds[i]))
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._loop = None
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_size": self.max_queue_size,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "items": self.items,
+            "rejected": self.rejected,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "max_seen_batch_size": self.max_seen_batch_size,
+        }
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""
+فهرس مبني مسبقاً لجدول السيارات يستخدمه المساعد الذكي بدل فلترة الـ DataFrame في كل سؤال:
+- مصفوفات مرتبة للسعر والسنة للبحث بالمدى عبر searchsorted.
+- Bitmaps مضغوطة (packbits) لكل ماركة ونوع وقود ونوع جسم.
+- Aho-Corasick لإيجاد أسماء الماركات بالعربية والإنجليزية داخل النص بمرور واحد.
+"""
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# أسماء الماركات كما يكتبها المستخدمون بالعربية
+BRAND_ALIASES = {
+    "Toyota": ["تويوتا", "تيوتا"],
+    "Kia": ["كيا"],
+    "Hyundai": ["هيونداي", "هونداي", "هيونداى"],
+    "Nissan": ["نيسان"],
+    "Honda": ["هوندا"],
+    "Ford": ["فورد"],
+    "BMW": ["بي ام دبليو", "بي إم دبليو", "بمو"],
+    "Mercedes": ["مرسيدس", "مارسيدس", "benz"],
+    "Audi": ["أودي", "اودي"],
+    "Tesla": ["تسلا", "تيسلا"],
+}
+
+# سوابق عربية تلتصق بالكلمة ("التويوتا"، "وكيا") ولا تكسر حد الكلمة قبل الماركة
+ARABIC_PREFIXES = ("وال", "بال", "ال", "و", "ب")
+
+# طرق الترتيب المدعومة: (العمود، تصاعدي؟)
+SORT_KEYS = {
+    "price_asc": ("Price_USD", True),
+    "price_desc": ("Price_USD", False),
+    "newest": ("Year", False),
+    "horsepower": ("Horsepower", False),
+}
+
+
+class AhoCorasick:
+    """آلة Aho-Corasick بسيطة: كل الأنماط تُبحث في النص بمرور واحد."""
+
+    def __init__(self, patterns):
+        # patterns: {نص النمط: القيمة المرتبطة به}
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for text, value in patterns.items():
+            self._add(text.lower(), value)
+        self._build()
+
+    def _add(self, text, value):
+        node = 0
+        for ch in text:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = nxt
+        self.output[node].append((len(text), value))
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(ch, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find_all(self, text):
+        """كل التطابقات كـ (بداية، طول، قيمة)."""
+        matches, node = [], 0
+        for i, ch in enumerate(text.lower()):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for length, value in self.output[node]:
+                matches.append((i - length + 1, length, value))
+        return matches
+
+    @staticmethod
+    def _is_word(text, start, length, prefixes=()):
+        """التطابق كلمة كاملة: لا حرف قبله (أو سابقة من prefixes تبدأ كلمة) ولا حرف بعده."""
+        end = start + length
+        if end < len(text) and text[end].isalnum():
+            return False
+        for prefix in ("",) + tuple(prefixes):
+            begin = start - len(prefix)
+            if begin >= 0 and text[begin:start] == prefix and (begin == 0 or not text[begin - 1].isalnum()):
+                return True
+        return False
+
+    def find_first(self, text, whole_words=False, prefixes=()):
+        """
+        أول تطابق في النص (والأطول عند التساوي).
+        whole_words=True يتجاهل التطابق داخل كلمة أطول (مثل "بنز" داخل "بنزين").
+        """
+        matches = self.find_all(text)
+        if whole_words:
+            lowered = text.lower()
+            matches = [m for m in matches if self._is_word(lowered, m[0], m[1], prefixes)]
+        if not matches:
+            return None
+        return min(matches, key=lambda m: (m[0], -m[1]))[2]
+
+
+class ListingIndex:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.n = len(df)
+
+        self.price = df["Price_USD"].to_numpy(dtype=np.float64)
+        self.year = df["Year"].to_numpy(dtype=np.int64)
+        self.price_order = np.argsort(self.price, kind="stable")
+        self.price_sorted = self.price[self.price_order]
+        self.year_order = np.argsort(self.year, kind="stable")
+        self.year_sorted = self.year[self.year_order]
+
+        self._postings = {}
+        self.bitmaps = {col: self._build_bitmaps(df, col) for col in ("Brand", "Fuel_Type", "Body_Type")}
+        self._sort_values = {}
+
+        brands = list(self.bitmaps["Brand"])
+        patterns = {b.lower(): b for b in brands}
+        for brand in brands:
+            for alias in BRAND_ALIASES.get(brand, []):
+                patterns[alias.lower()] = brand
+        self.brand_matcher = AhoCorasick(patterns)
+
+    def _build_bitmaps(self, df, column):
+        codes, uniques = pd.factorize(df[column].astype(str))
+        bitmaps = {}
+        for i, value in enumerate(uniques):
+            hits = codes == i
+            bitmap = np.packbits(hits)
+            # قائمة المواقع (postings) وعددها تُحفظ بجانب الـ bitmap بنفس المفتاح لاختيار الفلتر الأضيق بسرعة
+            self._postings[(column, str(value))] = np.flatnonzero(hits).astype(np.int64)
+            bitmaps[str(value)] = bitmap
+        return bitmaps
+
+    def _range(self, sorted_values, low=None, high=None):
+        """حدود المدى [lo, hi) داخل المصفوفة المرتبة."""
+        lo = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+        hi = self.n if high is None else np.searchsorted(sorted_values, high, side="right")
+        return lo, hi
+
+    def find_brand(self, text):
+        return self.brand_matcher.find_first(text, whole_words=True, prefixes=ARABIC_PREFIXES) if text else None
+
+    @staticmethod
+    def _bits_at(bitmap, positions):
+        """قراءة بتات الـ bitmap عند مواقع محددة فقط (بدون فك الـ bitmap كاملاً)."""
+        return (bitmap[positions >> 3] >> (7 - (positions & 7))) & 1 == 1
+
+    def match_positions(self, prefs):
+        """
+        مواقع الصفوف المطابقة لكل الفلاتر.
+        نبدأ من الفلتر الأضيق (مدى مرتب أو bitmap) ثم نتحقق من البقية على مرشحيه فقط،
+        فتكون الكلفة بحجم أصغر مجموعة وليس بعدد كل السيارات.
+        """
+        ranges, bitmaps = [], []
+        if "price_max" in prefs:
+            ranges.append((self.price_order, self.price, *self._range(self.price_sorted, high=prefs["price_max"])))
+        if "year" in prefs:
+            ranges.append((self.year_order, self.year, *self._range(self.year_sorted, low=prefs["year"])))
+        if "fuel" in prefs:
+            if prefs["fuel"] not in self.bitmaps["Fuel_Type"]:
+                return np.array([], dtype=np.int64)
+            bitmaps.append(("Fuel_Type", prefs["fuel"]))
+        brand = self.find_brand(prefs.get("raw_query"))
+        if brand:
+            bitmaps.append(("Brand", brand))
+
+        if not ranges and not bitmaps:
+            return np.arange(self.n)
+
+        # حجم كل فلتر معروف مسبقاً: طول المدى أو عدد البتات المفعلة
+        sizes = [hi - lo for _, _, lo, hi in ranges] + [len(self._postings[key]) for key in bitmaps]
+        driver = int(np.argmin(sizes))
+        if driver < len(ranges):
+            order, _, lo, hi = ranges.pop(driver)
+            positions = np.sort(order[lo:hi])
+        else:
+            positions = self._postings[bitmaps.pop(driver - len(ranges))]
+
+        for order, values, lo, hi in ranges:
+            low = values[order[lo]] if lo < self.n else np.inf
+            high = values[order[hi - 1]] if hi > 0 else -np.inf
+            v = values[positions]
+            positions = positions[(v >= low) & (v <= high)]
+        for column, value in bitmaps:
+            positions = positions[self._bits_at(self.bitmaps[column][value], positions)]
+        return positions
+
+    def top_k(self, positions, top_k, sort_by=None):
+        """أفضل top_k صفاً حسب طريقة الترتيب (بدون ترتيب كل النتائج)."""
+        if sort_by is None or len(positions) <= 1:
+            return positions[:top_k]
+        column, ascending = SORT_KEYS[sort_by]
+        if column not in self._sort_values:
+            self._sort_values[column] = self.df[column].to_numpy(dtype=np.float64)
+        values = self._sort_values[column][positions]
+        keys = values if ascending else -values
+        if len(positions) > top_k:
+            part = np.argpartition(keys, top_k - 1)[:top_k]
+        else:
+            part = np.arange(len(positions))
+        return positions[part[np.argsort(keys[part], kind="stable")]]
+
+    def search(self, prefs, top_k=5, sort_by=None):
+        positions = self.match_positions(prefs)
+        if len(positions) == 0 and "price_max" in prefs:
+            # لا تطابق دقيق: أرخص السيارات ضمن الميزانية
+            hi = np.searchsorted(self.price_sorted, prefs["price_max"], side="right")
+            return self.df.iloc[self.price_order[:min(hi, top_k)]]
+        return self.df.iloc[self.top_k(positions, top_k, sort_by)]
+
+
+_index_cache = {}
+
+def get_index(df: pd.DataFrame) -> ListingIndex:
+    """فهرس واحد لكل DataFrame (نحتفظ بآخر جدول فقط حتى لا تتراكم الذاكرة)."""
+    entry = _index_cache.get("last")
+    if entry is None or entry.df is not df:
+        entry = ListingIndex(df)
+        _index_cache["last"] = entry
+    return entry
\ No newline at end of file
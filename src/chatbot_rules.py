@@ -1,5 +1,6 @@
 import re
 import pandas as pd
+from src.chatbot_index import get_index
 
 def parse_user_message(message):
     """
@@ -38,40 +39,14 @@ def parse_user_message(message):
     
     return prefs
 
-def recommend(df, prefs, top_k=5):
-    """البحث الفعلي في الـ DataFrame بناءً على التفضيلات."""
+def recommend(df, prefs, top_k=5, sort_by=None, index=None):
+    """
+    البحث الفعلي عبر فهرس مبني مسبقاً (انظر src/chatbot_index).
+    sort_by: None (ترتيب البيانات) أو price_asc / price_desc / newest / horsepower.
+    """
     if df is None or df.empty:
         return pd.DataFrame()
 
-    results = df.copy()
-
-    # فلترة السعر (الأهم)
-    if 'price_max' in prefs:
-        results = results[results['Price_USD'] <= prefs['price_max']]
-
-    # فلترة سنة الصنع
-    if 'year' in prefs:
-        results = results[results['Year'] >= prefs['year']]
-
-    # فلترة الوقود
-    if 'fuel' in prefs:
-        results = results[results['Fuel_Type'] == prefs['fuel']]
-
-    # البحث عن الماركة في النص المتبقي
-    if prefs.get('raw_query'):
-        # نبحث إذا كان أي اسم ماركة موجود في الجملة
-        brands = df['Brand'].unique()
-        found_brand = None
-        for b in brands:
-            if b.lower() in prefs['raw_query']:
-                found_brand = b
-                break
-        
-        if found_brand:
-            results = results[results['Brand'] == found_brand]
-
-    # إذا كانت النتائج فارغة جداً، نعيد أفضل السيارات تقييماً ضمن الميزانية
-    if results.empty and 'price_max' in prefs:
-        return df[df['Price_USD'] <= prefs['price_max']].sort_values(by='Price_USD', ascending=True).head(top_k)
-
-    return results.head(top_k)
\ No newline at end of file
+    if index is None:
+        index = get_index(df)
+    return index.search(prefs, top_k=top_k, sort_by=sort_by)
\ No newline at end of file
@@ -0,0 +1,410 @@
+"""
+نسخة مضغوطة من الموديل لإقلاع سريع وصور أصغر: ملف ثنائي مسطح (بدون pickle) يحوي
+الأشجار المجمعة بعد تقليمها وتقليل دقتها، ويُفتح بـ mmap مباشرة.
+
+- التقليم: اختيار جشع (greedy) لأقل عدد من الأشجار يحافظ على R² قريباً من الغابة كاملة؛
+  الأشجار المتشابهة أو قليلة الأثر لا تُختار لأنها لا تحسّن المتوسط. الاختيار على صفوف التدريب نفسها،
+  وكل صف يُقيَّم فقط بالأشجار التي لم تره في عينة bootstrap الخاصة بها (OOB).
+- الحدود (thresholds) بـ float32 مقرّبة للأسفل، فتبقى المقارنة مطابقة لـ sklearn (المدخلات float32 أصلاً).
+- قيم الأوراق بـ 16 بت (uint16 + إزاحة وخطوة)، والميزة بـ uint8، والابن الأيسر ضمني (العقدة التالية).
+
+تركيب الملف:
+    MAGIC (8 بايت) | format, header_len (uint32) | header JSON | مصفوفات خام (كل واحدة على حد 64 بايت)
+
+التشغيل من جذر المشروع (تصدير للموديل الحالي مع تقرير الدقة/الحجم/زمن التحميل):
+    python -m src.compact_model
+"""
+import json
+import os
+import struct
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble._forest import _generate_sample_indices  # نفس ما يستخدمه oob_score في sklearn
+from sklearn.metrics import mean_absolute_error, r2_score
+
+from src.compiled_model import CompiledForest, compile_pipeline
+from src.config import (COMPACT_MAX_R2_DROP, COMPACT_MIN_SELECTION_ROWS, COMPACT_MIN_TREES,
+                        MODEL_REGISTRY_DIR, REPORTS_DIR)
+from src.model_registry import compact_path_for, current_model_path
+from src.prediction_cache import model_file_token
+from src.uncertainty import calibrate_tree_predictions
+
+MAGIC = b"SCARCMPT"
+COMPACT_FORMAT_VERSION = 1
+ALIGNMENT = 64
+LEAF_LEVELS = np.iinfo(np.uint16).max
+
+# مفاتيح الـ bundle الصغيرة التي تُنسخ للـ header
+BUNDLE_META_KEYS = ["features_used", "metrics", "use_log_target", "version", "trained_at",
+                    "data_rows", "data_hash", "interval", "feature_defaults", "drift_reference"]
+
+# أقصى عدد صفوف يُستخدم في اختيار الأشجار (الكلفة: صفوف × أشجار × أشجار)
+MAX_SELECTION_ROWS = 20000
+
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def select_trees(tree_preds, y, max_r2_drop=COMPACT_MAX_R2_DROP, min_trees=COMPACT_MIN_TREES, oob=None):
+    """
+    اختيار جشع بدون تكرار: في كل خطوة نضيف الشجرة التي تقلل خطأ المتوسط أكثر،
+    ونتوقف عند أول عدد (>= min_trees) يصل فيه R² لـ (R² الغابة كاملة - max_r2_drop).
+    oob (بنفس شكل tree_preds): True حيث الصف خارج عينة الشجرة؛ كل صف يُقيَّم بمتوسط الأشجار
+    المختارة التي لم تره فقط (مثل oob_score)، فلا تُكافأ شجرة لأنها حفظت صفوف تدريبها.
+    """
+    n_rows, n_trees = tree_preds.shape
+    y = np.asarray(y, dtype=np.float64)
+    oob = np.ones((n_rows, n_trees), dtype=bool) if oob is None else oob
+    preds = np.where(oob, tree_preds, 0.0)
+    var = float(((y - y.mean()) ** 2).mean()) or 1.0
+
+    def r2(total, count, y):
+        covered = count > 0
+        err = np.where(covered, total / np.maximum(count, 1) - y, 0.0) ** 2
+        return 1.0 - err.sum(axis=0) / np.maximum(covered.sum(axis=0), 1) / var
+
+    target = r2(preds.sum(axis=1), oob.sum(axis=1), y) - max_r2_drop
+
+    chosen = []
+    available = np.ones(n_trees, dtype=bool)
+    total = np.zeros(n_rows)
+    count = np.zeros(n_rows, dtype=np.int64)
+    for k in range(1, n_trees + 1):
+        scores = r2(total[:, None] + preds, count[:, None] + oob, y[:, None])
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        chosen.append(best)
+        available[best] = False
+        total += preds[:, best]
+        count += oob[:, best]
+        if k >= min(min_trees, n_trees) and scores[best] >= target:
+            break
+    return np.sort(np.asarray(chosen, dtype=np.int64))
+
+
+def _floor_float32(values):
+    """تقريب لأقرب float32 لا يتجاوز القيمة: x32 <= t يساوي x32 <= floor32(t) لكل x32."""
+    out = values.astype(np.float32)
+    over = out.astype(np.float64) > values
+    out[over] = np.nextafter(out[over], np.float32(-np.inf))
+    return out
+
+
+def compact_arrays(compiled: CompiledForest, trees):
+    """
+    مصفوفات الأشجار المختارة بالصيغة المضغوطة + معاملات فك القيم.
+    قيم العقد الداخلية (متوسطات أوراقها، فهي داخل مدى الأوراق) تُحفظ بنفس الترميز لأن تفسير التوقع يحتاجها.
+    """
+    ends = np.append(compiled.roots[1:], len(compiled.feature))
+    children = compiled.children.reshape(-1, 2)
+
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    base = 0
+    for t in trees:
+        start, end = int(compiled.roots[t]), int(ends[t])
+        feature.append(compiled.feature[start:end])
+        threshold.append(compiled.threshold[start:end])
+        left.append(children[start:end, 0] - start + base)
+        right.append(children[start:end, 1] - start + base)
+        value.append(compiled.value[start:end])
+        roots.append(base)
+        base += end - start
+
+    threshold = np.concatenate(threshold)
+    value = np.concatenate(value)
+    left = np.concatenate(left)
+    is_leaf = ~np.isfinite(threshold)
+    own = np.arange(len(threshold))
+
+    leaf_values = value[is_leaf]
+    offset = float(leaf_values.min())
+    step = float(leaf_values.max() - offset) / LEAF_LEVELS or 1.0
+    codes = np.rint((value - offset) / step).clip(0, LEAF_LEVELS)
+
+    arrays = {
+        "feature": np.concatenate(feature).astype(np.uint8 if compiled.n_inputs <= 256 else np.uint16),
+        "threshold": _floor_float32(threshold),
+        "right": np.concatenate(right).astype(np.int32),
+        "value": codes.astype(np.uint16),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }
+    # sklearn يبني الأشجار بالعمق أولاً فالابن الأيسر هو العقدة التالية دائماً؛ نحفظه فقط إن لم يكن كذلك
+    if not (left[~is_leaf] == own[~is_leaf] + 1).all():
+        arrays["left"] = left.astype(np.int32)
+    return arrays, {"value_offset": offset, "value_step": step, "node_values": True}
+
+
+def write_compact(path, header, arrays):
+    """كتابة الملف بشكل ذري (ملف مؤقت ثم استبدال)."""
+    specs, offset = {}, 0
+    for name, arr in arrays.items():
+        specs[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset = _align(offset + arr.nbytes)
+    header = dict(header, arrays=specs)
+    # default: قيم NumPy المفردة (مثل data_rows) تُكتب كأرقام عادية
+    header_bytes = json.dumps(header, ensure_ascii=False, default=lambda v: v.item()).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<II", COMPACT_FORMAT_VERSION, len(header_bytes)) + header_bytes)
+        for name, arr in arrays.items():
+            f.seek(data_start + specs[name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_header(path) -> dict:
+    with open(path, "rb") as f:
+        prefix = f.read(len(MAGIC) + 8)
+        if len(prefix) < len(MAGIC) + 8 or prefix[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a compact model file")
+        fmt, header_len = struct.unpack("<II", prefix[len(MAGIC):])
+        if fmt != COMPACT_FORMAT_VERSION:
+            raise ValueError(f"unsupported compact model format {fmt}")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    header["data_start"] = _align(len(MAGIC) + 8 + header_len)
+    return header
+
+
+def _tree_predictions(compiled, X):
+    return compiled.tree_predictions(compiled.transform_columns(
+        {c: X[c].to_numpy() for c in compiled.numeric + compiled.categorical}))
+
+
+def oob_selection(bundle, X_train, y_train):
+    """
+    (X، y، قناع OOB) لعينة من صفوف تدريب الغابة، أو None (بدون تقليم) إذا لم يمكن إعادة إنتاج
+    عينات bootstrap (موديل محدث تدريجياً أو صفوف غير صفوف fit) أو كانت الصفوف أقل من COMPACT_MIN_SELECTION_ROWS.
+    """
+    forest = bundle["pipeline"].named_steps["regressor"]
+    n_samples = getattr(forest, "_n_samples", None)
+    if not forest.bootstrap or bundle.get("update_mode") == "incremental" or n_samples != len(X_train):
+        print("ℹ️ لا يمكن معرفة صفوف OOB لكل شجرة؛ تُحفظ كل الأشجار بدون تقليم.")
+        return None
+    if n_samples < COMPACT_MIN_SELECTION_ROWS:
+        print(f"ℹ️ صفوف التدريب ({n_samples}) أقل من {COMPACT_MIN_SELECTION_ROWS}؛ تُحفظ كل الأشجار بدون تقليم.")
+        return None
+
+    rows = np.arange(n_samples)
+    if n_samples > MAX_SELECTION_ROWS:
+        rows = np.sort(np.random.default_rng(42).choice(n_samples, MAX_SELECTION_ROWS, replace=False))
+    # إصدارات sklearn الأحدث تمرر أوزان الصفوف لتوليد العينة
+    extra = (forest._sample_weight,) if hasattr(forest, "_sample_weight") else ()
+    oob = np.empty((len(rows), len(forest.estimators_)), dtype=bool)
+    for j, tree in enumerate(forest.estimators_):
+        in_bag = _generate_sample_indices(tree.random_state, n_samples, forest._n_samples_bootstrap, *extra)
+        oob[:, j] = np.bincount(in_bag, minlength=n_samples)[rows] == 0
+    return X_train.iloc[rows], y_train.iloc[rows], oob
+
+
+def export_compact(bundle, path, X_train=None, y_train=None, X_calib=None, y_calib=None, source_token=None,
+                   max_r2_drop=COMPACT_MAX_R2_DROP, min_trees=COMPACT_MIN_TREES):
+    """
+    تصدير النسخة المضغوطة. مع صفوف تدريب الغابة (X_train, y_train بنفس ترتيب fit، السعر باللوغاريتم)
+    تُقلَّم الأشجار على توقعاتها OOB (انظر oob_selection)، وبدونها تُحفظ كل الأشجار مع تقليل الدقة فقط.
+    تشتت الأشجار المختارة غير تشتت الغابة كاملة، فنطاق السعر يُعاير من جديد على (X_calib, y_calib)؛
+    التقليم بدونها خطأ لأن النطاق المعاير على كل الأشجار لن يغطي النسبة المطلوبة.
+    """
+    compiled = bundle.get("compiled") or compile_pipeline(bundle["pipeline"], bundle["features_used"])
+    trees = np.arange(compiled.n_trees)
+    meta = {k: bundle[k] for k in BUNDLE_META_KEYS if k in bundle}
+    selection_rows = 0
+    if X_train is not None and len(X_train):
+        if X_calib is None or not len(X_calib):
+            raise ValueError("pruning needs calibration rows to recalibrate the price interval")
+        selection = oob_selection(bundle, X_train, y_train)
+    else:
+        selection = None
+    if selection is not None:
+        X_select, y_select, oob = selection
+        selection_rows = len(X_select)
+        trees = select_trees(_tree_predictions(compiled, X_select), np.asarray(y_select), max_r2_drop, min_trees, oob)
+        if len(trees) < compiled.n_trees:
+            meta["interval"] = calibrate_tree_predictions(_tree_predictions(compiled, X_calib)[:, trees], y_calib)
+
+    arrays, leaf_codec = compact_arrays(compiled, trees)
+    header = {
+        "source_token": source_token,
+        "meta": meta,
+        "numeric": compiled.numeric,
+        "categorical": compiled.categorical,
+        "mean": [float(v) for v in compiled.mean],
+        "scale": [float(v) for v in compiled.scale],
+        "categories": [[str(v) for v in c] for c in compiled.categories],
+        "max_depth": int(compiled.max_depth),
+        "n_trees_full": int(compiled.n_trees),
+        "n_trees": int(len(trees)),
+        "selection_rows": int(selection_rows),
+        **leaf_codec,
+    }
+    return write_compact(path, header, arrays)
+
+
+def load_compact(path):
+    """(header، CompiledForest) بمصفوفات مربوطة بالملف؛ فقط الأبناء وقيم الأوراق تُبنى في الذاكرة."""
+    header = read_header(path)
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        start = header["data_start"] + spec["offset"]
+        count = int(np.prod(spec["shape"]))
+        arrays[name] = np.asarray(buf[start:start + count * dtype.itemsize]).view(dtype).reshape(spec["shape"])
+
+    threshold = arrays["threshold"]
+    own = np.arange(len(threshold), dtype=np.int32)
+    is_leaf = ~np.isfinite(threshold)
+    left = arrays["left"] if "left" in arrays else np.where(is_leaf, own, own + 1).astype(np.int32)
+    children = np.stack([left, arrays["right"]], axis=1).ravel()
+    value = header["value_offset"] + arrays["value"] * header["value_step"]
+
+    compiled = CompiledForest(
+        header["numeric"], header["categorical"],
+        np.asarray(header["mean"]), np.asarray(header["scale"]),
+        [np.asarray(c).astype(str) for c in header["categories"]],
+        arrays["feature"], threshold, children, value, arrays["roots"], header["max_depth"],
+    )
+    return header, compiled
+
+
+def ensure_compact(model_path=None, path=None):
+    """
+    إعادة التصدير (بدون تقليم) فقط إذا لم يكن هناك ملف مضغوط لملف الموديل الحالي.
+    الملف المُقلَّم وقت التدريب (train_price_model --compact) يبقى كما هو.
+    """
+    model_path = model_path or current_model_path()
+    path = path or compact_path_for(model_path)
+    token = model_file_token(model_path)
+    try:
+        if read_header(path).get("source_token") == token:
+            return path
+    except (FileNotFoundError, ValueError):
+        pass
+    return export_compact(joblib.load(model_path), path, source_token=token)
+
+
+def load_compact_bundle(model_path=None):
+    """bundle للتوقع فقط من الملف المضغوط (بدون الـ Pipeline وبدون unpickle)."""
+    path = ensure_compact(model_path or current_model_path())
+    header, compiled = load_compact(path)
+    bundle = dict(header["meta"])
+    bundle["compiled"] = compiled
+    bundle["compact_path"] = str(path)
+    # الملفات القديمة تحفظ قيم الأوراق فقط (العقد الداخلية صفر)
+    bundle["compact_node_values"] = bool(header.get("node_values"))
+    return bundle
+
+
+def _timed_load(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def compact_report(model_path, path, X_eval, y_eval, repeats=3) -> dict:
+    """مقارنة الدقة (R² باللوغاريتم، MAE بالدولار) والحجم وزمن التحميل بين الموديل الكامل والمضغوط."""
+    full = joblib.load(model_path)
+    header, compiled = load_compact(path)
+    y_eval = np.asarray(y_eval, dtype=np.float64)
+
+    full_pred = full["pipeline"].predict(pd.DataFrame(X_eval, columns=full["features_used"]))
+    columns = {c: X_eval[c].to_numpy() for c in compiled.numeric + compiled.categorical}
+    compact_pred = compiled.predict(compiled.transform_columns(columns))
+
+    def accuracy(pred):
+        return r2_score(y_eval, pred), mean_absolute_error(np.expm1(y_eval), np.expm1(pred))
+
+    full_r2, full_mae = accuracy(full_pred)
+    compact_r2, compact_mae = accuracy(compact_pred)
+    full_size, compact_size = model_path.stat().st_size, path.stat().st_size
+    full_load = _timed_load(lambda: joblib.load(model_path), repeats)
+    compact_load = _timed_load(lambda: load_compact(path), repeats)
+
+    report = {
+        "model_path": str(model_path),
+        "compact_path": str(path),
+        "eval_rows": int(len(y_eval)),
+        "selection_rows": header.get("selection_rows", 0),
+        "n_trees_full": header["n_trees_full"],
+        "n_trees": header["n_trees"],
+        "full": {"r2": full_r2, "mae": full_mae, "size_bytes": full_size, "load_s": full_load},
+        "compact": {"r2": compact_r2, "mae": compact_mae, "size_bytes": compact_size, "load_s": compact_load},
+        "r2_delta": compact_r2 - full_r2,
+        "mae_delta": compact_mae - full_mae,
+        "size_ratio": full_size / compact_size,
+        "load_speedup": full_load / compact_load,
+        "max_abs_log_diff": float(np.abs(full_pred - compact_pred).max()) if len(y_eval) else 0.0,
+    }
+
+    print("\n" + "=" * 30)
+    print(f"🗜️ الأشجار: {report['n_trees_full']} -> {report['n_trees']}")
+    print(f"📊 R²: {full_r2:.4f} -> {compact_r2:.4f} ({report['r2_delta']:+.4f})")
+    print(f"💰 MAE: {full_mae:,.2f} -> {compact_mae:,.2f} دولار ({report['mae_delta']:+,.2f})")
+    print(f"📦 الحجم: {full_size / 1e6:.2f} MB -> {compact_size / 1e6:.2f} MB (x{report['size_ratio']:.1f})")
+    print(f"⚡ التحميل: {full_load * 1000:.1f} ms -> {compact_load * 1000:.1f} ms (x{report['load_speedup']:.1f})")
+    print("=" * 30)
+    return report
+
+
+def save_report(report, name):
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = REPORTS_DIR / f"compact_model_{name}.json"
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return out
+
+
+def export_compact_for(model_path, bundle, X_train, y_train, X_test, y_test,
+                       max_r2_drop=COMPACT_MAX_R2_DROP, min_trees=COMPACT_MIN_TREES):
+    """
+    تصدير مُقلَّم بجانب ملف موديل مع تقرير: الأشجار تُختار على صفوف التدريب (OOB)، وبيانات الاختبار
+    كاملة لمعايرة نطاق السعر للأشجار المختارة ولقياس كلفة الضغط (صفوف لم يرها الاختيار).
+    X_train=None يحفظ كل الأشجار.
+    """
+    path = export_compact(bundle, compact_path_for(model_path), X_train, y_train, X_test, y_test,
+                          source_token=model_file_token(model_path),
+                          max_r2_drop=max_r2_drop, min_trees=min_trees)
+    report = compact_report(model_path, path, X_test, y_test)
+    name = model_path.parent.name if model_path.parent.parent == MODEL_REGISTRY_DIR else model_path.stem
+    print(f"💾 التقرير: {save_report(report, name)}")
+    return report
+
+
+def build_compact(model_path=None, df=None, max_r2_drop=COMPACT_MAX_R2_DROP, min_trees=COMPACT_MIN_TREES):
+    """
+    تصدير مُقلَّم للموديل الحالي باستخدام نفس تقسيم train_price_model (df هي بيانات التدريب نفسها؛
+    بدونها يُقرأ المصدر، ولا يُقلَّم إن تغيّر منذ التدريب لأن صفوف fit لم تعد معروفة).
+    """
+    from src.config import DATA_PATH
+    from src.data_loader import load_data
+    from src.feature_store import source_version
+    from src.train import split_holdout
+
+    model_path = model_path or current_model_path()
+    bundle = joblib.load(model_path)
+    same_rows = df is not None or bundle.get("data_hash") == source_version(DATA_PATH)
+    if df is None:
+        df = load_data(DATA_PATH)
+    X_train, X_test, y_train, y_test = split_holdout(df)
+    if not same_rows:
+        print("ℹ️ المصدر تغيّر منذ التدريب؛ تُحفظ كل الأشجار بدون تقليم.")
+        X_train = y_train = None
+    return export_compact_for(model_path, bundle, X_train, y_train, X_test, y_test, max_r2_drop, min_trees)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export a pruned, reduced-precision model file and report its accuracy cost")
+    parser.add_argument("--max-r2-drop", type=float, default=COMPACT_MAX_R2_DROP)
+    parser.add_argument("--min-trees", type=int, default=COMPACT_MIN_TREES)
+    args = parser.parse_args()
+    build_compact(max_r2_drop=args.max_r2_drop, min_trees=args.min_trees)
\ No newline at end of file
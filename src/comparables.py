@@ -0,0 +1,230 @@
+"""
+محرك "السيارات المشابهة" (comparables): أقرب السيارات المعروضة في السوق لسيارة يتم تقييمها،
+بدل مسح الـ DataFrame كاملاً في كل طلب.
+
+- الميزات الرقمية (FEATURES_NUMERIC) مُعايَرة (z-score) في مصفوفة float32 متصلة.
+- الميزات النصية تُخزن كرموز، والصفوف مرتبة حسب (Brand, Body_Type, Fuel_Type, Transmission)
+  فكل تركيبة نصية مقطع متصل من المصفوفة، والتصفية بالماركة ونوع الجسم اختيار مقاطع فقط.
+- المسافة = مربع المسافة الرقمية + وزن ثابت لكل ميزة نصية مختلفة (CATEGORY_WEIGHTS).
+- كل مقطع مرتب حسب SORT_FEATURE ومقسوم لكتل صغيرة لكل منها صندوق (أقل/أعلى قيمة لكل ميزة):
+  وزن المقطع + المسافة للصندوق حد أدنى لكل صفوف الكتلة، فتُمسح الكتل من الأقرب ونتوقف عندما
+  يتجاوز الحد أبعد نتيجة حالية. النتيجة مطابقة للبحث الكامل لكن تمسح عادةً كتلاً قليلة فقط.
+- إضافة سيارات في نهاية الـ CSV: تُحوَّل الصفوف الجديدة فقط (بنفس المتوسط والانحراف المحفوظين)
+  وتُدمج في ترتيب المقاطع، مثل مكعب السوق.
+"""
+import os
+import uuid
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.config import COMPARABLES_BLOCK_ROWS, COMPARABLES_K
+from src.feature_store import store_paths, source_version, source_rows, load_store, load_rows_since, is_append_of
+from src.features import FEATURES_CATEGORICAL, FEATURES_NUMERIC, TARGET_COLUMN
+
+# كلفة اختلاف كل ميزة نصية (بوحدة مربع الانحراف المعياري للميزات الرقمية)
+CATEGORY_WEIGHTS = {"Brand": 4.0, "Body_Type": 2.0, "Fuel_Type": 1.0, "Transmission": 0.5}
+
+# الأعمدة الرقمية المعروضة مع كل سيارة مشابهة
+LISTING_NUMERIC = ["Year", "Horsepower", "Engine_CC", "Mileage_km_per_l", TARGET_COLUMN]
+
+# الميزة التي تُرتب حسبها الصفوف داخل كل مقطع قبل تقسيمه لكتل
+SORT_FEATURE = "Horsepower"
+
+COMPARABLES_VERSION = 1
+
+
+def comparables_path(csv_path):
+    parquet_path, _ = store_paths(csv_path)
+    return parquet_path.with_suffix(".comparables.joblib")
+
+
+def _encode(values, categories):
+    """رموز القيم النصية حسب القائمة (تُضاف القيم الجديدة في آخرها فلا تتغير الرموز القديمة)."""
+    values = pd.Series(values).astype(str)
+    known = pd.Index(categories)
+    new = [v for v in pd.unique(values) if v not in known]
+    categories = list(categories) + new
+    return pd.Index(categories).get_indexer(values).astype(np.int32), categories
+
+
+class ComparablesIndex:
+    def __init__(self, categories, mean, std, matrix, codes, values, rows, data_rows=0, source=None):
+        self.categories = categories  # {عمود نصي: قائمة القيم بترتيب الرموز}
+        self.mean = mean
+        self.std = std
+        self.matrix = matrix          # (صفوف، FEATURES_NUMERIC) float32 معايرة ومرتبة حسب المقطع
+        self.codes = codes            # (صفوف، FEATURES_CATEGORICAL) int32 بنفس الترتيب
+        self.values = values          # (صفوف، LISTING_NUMERIC) float64 للعرض
+        self.rows = rows              # رقم الصف في المصدر
+        self.data_rows = data_rows
+        self.source = source
+        self.weights = np.array([CATEGORY_WEIGHTS[c] for c in FEATURES_CATEGORICAL], dtype=np.float32)
+
+        # حدود المقاطع: كل تغيّر في رموز الأعمدة النصية يبدأ مقطعاً جديداً
+        n = len(rows)
+        changes = np.flatnonzero(np.any(codes[1:] != codes[:-1], axis=1)) + 1
+        seg_start = np.concatenate([[0], changes]).astype(np.int64) if n else changes
+        seg_end = np.concatenate([changes, [n]]).astype(np.int64) if n else changes
+        self.seg_keys = codes[seg_start]
+
+        # كل مقطع يُقسم لكتل من COMPARABLES_BLOCK_ROWS صفاً (مرتبة داخله حسب SORT_FEATURE)،
+        # ولكل كتلة صندوق (أقل/أعلى قيمة لكل ميزة) يعطي حداً أدنى لمسافة أي صف فيها
+        sizes = seg_end - seg_start
+        per_seg = -(-sizes // COMPARABLES_BLOCK_ROWS)
+        self.block_seg = np.repeat(np.arange(len(seg_start)), per_seg)
+        offsets = np.arange(len(self.block_seg)) - np.repeat(np.cumsum(per_seg) - per_seg, per_seg)
+        self.block_start = seg_start[self.block_seg] + offsets * COMPARABLES_BLOCK_ROWS
+        self.block_end = np.minimum(self.block_start + COMPARABLES_BLOCK_ROWS, seg_end[self.block_seg])
+        if n:
+            self.block_min = np.minimum.reduceat(matrix, self.block_start, axis=0)
+            self.block_max = np.maximum.reduceat(matrix, self.block_start, axis=0)
+        else:
+            self.block_min = self.block_max = np.empty((0, len(FEATURES_NUMERIC)), dtype=np.float32)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, categories=None, mean=None, std=None, **meta):
+        """بناء الفهرس من DataFrame (بعد load_data). مع mean/std: نفس معايرة فهرس موجود."""
+        numeric = df[FEATURES_NUMERIC].to_numpy(dtype=np.float64, na_value=np.nan)
+        if mean is None:
+            mean = np.nanmean(numeric, axis=0) if len(df) else np.zeros(len(FEATURES_NUMERIC))
+            std = np.nanstd(numeric, axis=0) if len(df) else np.ones(len(FEATURES_NUMERIC))
+            std = np.where(std > 0, std, 1.0)
+        # القيمة المفقودة تأخذ المتوسط (صفر بعد المعايرة) بدل استبعاد السيارة
+        matrix = np.nan_to_num((numeric - mean) / std).astype(np.float32)
+
+        categories = dict(categories or {c: [] for c in FEATURES_CATEGORICAL})
+        codes = np.empty((len(df), len(FEATURES_CATEGORICAL)), dtype=np.int32)
+        for j, column in enumerate(FEATURES_CATEGORICAL):
+            codes[:, j], categories[column] = _encode(df[column].to_numpy(), categories[column])
+
+        index = cls(categories, mean, std, matrix, codes,
+                    df[LISTING_NUMERIC].to_numpy(dtype=np.float64, na_value=np.nan),
+                    df.index.to_numpy(dtype=np.int64), **meta)
+        return index._sorted()
+
+    def _sorted(self) -> "ComparablesIndex":
+        """ترتيب الصفوف حسب المقطع ثم SORT_FEATURE داخله (حتى تكون صناديق الكتل ضيقة)."""
+        key = np.zeros(len(self.rows), dtype=np.int64)
+        for j, column in enumerate(FEATURES_CATEGORICAL):
+            key = key * (len(self.categories[column]) + 1) + self.codes[:, j]
+        order = np.lexsort((self.matrix[:, FEATURES_NUMERIC.index(SORT_FEATURE)], key))
+        return ComparablesIndex(self.categories, self.mean, self.std,
+                                np.ascontiguousarray(self.matrix[order]), np.ascontiguousarray(self.codes[order]),
+                                self.values[order], self.rows[order], self.data_rows, self.source)
+
+    def extend(self, df: pd.DataFrame, **meta) -> "ComparablesIndex":
+        """إضافة صفوف جديدة بنفس المعايرة ثم إعادة ترتيب المقاطع (بدون إعادة حساب الصفوف القديمة)."""
+        new = ComparablesIndex.from_frame(df, self.categories, self.mean, self.std)
+        return ComparablesIndex(
+            new.categories, self.mean, self.std,
+            np.concatenate([self.matrix, new.matrix]), np.concatenate([self.codes, new.codes]),
+            np.concatenate([self.values, new.values]), np.concatenate([self.rows, new.rows]),
+            **meta,
+        )._sorted()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _query_vector(self, car: dict):
+        numeric = np.array([car.get(c, np.nan) for c in FEATURES_NUMERIC], dtype=np.float64)
+        q = np.nan_to_num((numeric - self.mean) / self.std).astype(np.float32)
+        # قيمة نصية غير موجودة في السوق (-1) تختلف عن كل المقاطع
+        q_codes = np.array([self.categories[c].index(str(car.get(c))) if str(car.get(c)) in self.categories[c] else -1
+                            for c in FEATURES_CATEGORICAL], dtype=np.int32)
+        return q, q_codes
+
+    def _segment_mask(self, brands=None, body_types=None):
+        mask = np.ones(len(self.seg_keys), dtype=bool)
+        for column, wanted in (("Brand", brands), ("Body_Type", body_types)):
+            if wanted:
+                j = FEATURES_CATEGORICAL.index(column)
+                allowed = [self.categories[column].index(v) for v in wanted if v in self.categories[column]]
+                mask &= np.isin(self.seg_keys[:, j], allowed)
+        return mask
+
+    def search(self, car: dict, k=COMPARABLES_K, brands=None, body_types=None):
+        """(مواقع الصفوف في الفهرس، مربع المسافة) لأقرب k سيارة، مرتبة من الأقرب."""
+        q, q_codes = self._query_vector(car)
+        seg_penalty = ((self.seg_keys != q_codes) * self.weights).sum(axis=1)
+        blocks = np.flatnonzero(self._segment_mask(brands, body_types)[self.block_seg])
+
+        # الحد الأدنى لكل كتلة: وزن اختلاف النصوص + المسافة من السيارة لصندوق الكتلة
+        gap = np.maximum(self.block_min[blocks] - q, 0) + np.maximum(q - self.block_max[blocks], 0)
+        bound = seg_penalty[self.block_seg[blocks]] + np.einsum("ij,ij->i", gap, gap)
+        order = np.argsort(bound, kind="stable")
+
+        best_d = np.empty(0, dtype=np.float32)
+        best_i = np.empty(0, dtype=np.int64)
+        for b, block_bound in zip(blocks[order], bound[order]):
+            # كل ما تبقى من الكتل أبعد من أبعد نتيجة حالية
+            if len(best_d) == k and block_bound >= best_d[-1]:
+                break
+            start, end = self.block_start[b], self.block_end[b]
+            diff = self.matrix[start:end] - q
+            d = np.einsum("ij,ij->i", diff, diff) + seg_penalty[self.block_seg[b]]
+            cand_d = np.concatenate([best_d, d])
+            cand_i = np.concatenate([best_i, np.arange(start, end, dtype=np.int64)])
+            if len(cand_d) > k:
+                keep = np.argpartition(cand_d, k - 1)[:k]
+                cand_d, cand_i = cand_d[keep], cand_i[keep]
+            # النتائج مرتبة دائماً حتى يكون best_d[-1] أبعدها
+            ranked = np.argsort(cand_d, kind="stable")
+            best_d, best_i = cand_d[ranked], cand_i[ranked]
+        return best_i, best_d
+
+    def query(self, car: dict, k=COMPARABLES_K, brands=None, body_types=None) -> pd.DataFrame:
+        """أقرب k سيارة في السوق كجدول للعرض (مع رقم الصف في المصدر والمسافة)."""
+        positions, distances = self.search(car, k, brands, body_types)
+        columns = {"Row": self.rows[positions]}
+        for j, column in enumerate(FEATURES_CATEGORICAL):
+            columns[column] = [self.categories[column][c] for c in self.codes[positions, j]]
+        for j, column in enumerate(LISTING_NUMERIC):
+            columns[column] = self.values[positions, j]
+        columns["Distance"] = np.sqrt(distances.astype(np.float64))
+        return pd.DataFrame(columns)
+
+    def to_dict(self) -> dict:
+        state = {key: getattr(self, key) for key in
+                 ("categories", "mean", "std", "matrix", "codes", "values", "rows", "data_rows", "source")}
+        return {"version": COMPARABLES_VERSION, **state}
+
+
+def _load_index(path):
+    try:
+        state = joblib.load(path)
+    except (FileNotFoundError, EOFError, ValueError):
+        return None
+    if state.pop("version", None) != COMPARABLES_VERSION:
+        return None
+    return ComparablesIndex(**state)
+
+
+def _save_index(index, path):
+    # ملف مؤقت فريد لكل كاتب: عدة عمليات gunicorn قد تعيد بناء الفهرس في نفس الوقت
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    joblib.dump(index.to_dict(), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def get_comparables_index(csv_path) -> ComparablesIndex:
+    """
+    فهرس السيارات المشابهة لملف البيانات (نفس منطق مكعب السوق):
+    - نفس نسخة البيانات: يُحمّل من القرص.
+    - أُضيفت صفوف في نهاية الـ CSV (ولم تتغير الصفوف السابقة): تُضاف الصفوف الجديدة فقط.
+    - غير ذلك: يُعاد البناء من المخزن.
+    """
+    path = comparables_path(csv_path)
+    version = source_version(csv_path)
+    rows = source_rows(csv_path)
+    index = _load_index(path)
+    if index is not None and index.source == version:
+        return index
+
+    if index is not None and 0 < index.data_rows < rows and is_append_of(csv_path, index.source, index.data_rows):
+        index = index.extend(load_rows_since(csv_path, index.data_rows), data_rows=rows, source=version)
+    else:
+        index = ComparablesIndex.from_frame(load_store(csv_path), data_rows=rows, source=version)
+    _save_index(index, path)
+    return index
\ No newline at end of file
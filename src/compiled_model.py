@@ -0,0 +1,133 @@
+"""
+محرك توقع مُجمَّع (Compiled) لغابة RandomForest.
+يحوّل الـ Pipeline المدرب (StandardScaler + OneHotEncoder + الأشجار) إلى مصفوفات
+NumPy مسطحة، ثم يمشي على كل الأشجار معاً بعمليات مصفوفات بدون pandas ولا sklearn.
+"""
+import numpy as np
+
+
+class CompiledForest:
+    """نسخة مسطحة من الـ Pipeline تعطي نفس نتيجة pipe.predict (في فضاء اللوغاريتم)."""
+
+    def __init__(self, numeric, categorical, mean, scale, categories,
+                 feature, threshold, children, value, roots, max_depth):
+        self.numeric = list(numeric)
+        self.categorical = list(categorical)
+        self.mean = mean
+        self.scale = scale
+        self.categories = categories
+        # بداية أعمدة الـ one-hot لكل ميزة نصية داخل مصفوفة المدخلات
+        self.cat_offsets = np.cumsum([len(self.numeric)] + [len(c) for c in categories[:-1]])
+        self.n_inputs = len(self.numeric) + sum(len(c) for c in categories)
+        # كل العقد لكل الأشجار في مصفوفات متصلة؛ أبناء العقدة i في children[2i] و children[2i+1]
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def transform_columns(self, columns):
+        """
+        تحويل أعمدة خام (قاموس اسم الميزة -> مصفوفة) إلى مصفوفة مدخلات الأشجار.
+        نفس منطق ColumnTransformer: تحجيم الأرقام و one-hot للنصوص (المجهول = أصفار).
+        """
+        n_rows = len(np.atleast_1d(columns[self.numeric[0]]))
+        X = np.zeros((n_rows, self.n_inputs), dtype=np.float64)
+
+        for j, name in enumerate(self.numeric):
+            X[:, j] = (np.asarray(columns[name], dtype=np.float64) - self.mean[j]) / self.scale[j]
+
+        rows = np.arange(n_rows)
+        for j, name in enumerate(self.categorical):
+            cats = self.categories[j]
+            values = np.asarray(columns[name]).astype(str)
+            pos = np.searchsorted(cats, values)
+            pos_clipped = np.minimum(pos, len(cats) - 1)
+            known = cats[pos_clipped] == values
+            X[rows[known], self.cat_offsets[j] + pos_clipped[known]] = 1.0
+
+        # الأشجار في sklearn تقارن المدخلات بدقة float32
+        return X.astype(np.float32).astype(np.float64)
+
+    def transform_rows(self, rows):
+        """تحويل قائمة قواميس (صف لكل سيارة) إلى مصفوفة مدخلات الأشجار."""
+        columns = {name: [row[name] for row in rows] for name in self.numeric + self.categorical}
+        return self.transform_columns(columns)
+
+    def tree_predictions(self, X, chunk_size=512):
+        """قيمة كل شجرة لكل صف، بشكل (عدد الصفوف، عدد الأشجار)."""
+        out = np.empty((X.shape[0], self.n_trees), dtype=np.float64)
+        # نعالج الصفوف على دفعات صغيرة حتى تبقى مصفوفات العقد داخل الـ cache
+        for start in range(0, X.shape[0], chunk_size):
+            block = X[start:start + chunk_size]
+            flat = block.ravel()
+            row_base = (np.arange(block.shape[0], dtype=np.int32) * block.shape[1])[:, None]
+            nodes = np.broadcast_to(self.roots, (block.shape[0], self.n_trees)).copy()
+            # الأوراق تشير لنفسها، لذلك يكفي تكرار الخطوة بعدد أعمق شجرة
+            for _ in range(self.max_depth):
+                x = np.take(flat, row_base + np.take(self.feature, nodes))
+                go_right = x > np.take(self.threshold, nodes)
+                nodes = np.take(self.children, 2 * nodes + go_right)
+            out[start:start + chunk_size] = np.take(self.value, nodes)
+        return out
+
+    def predict(self, X):
+        """متوسط الأشجار، تماماً مثل RandomForestRegressor.predict."""
+        return self.tree_predictions(X).mean(axis=1)
+
+
+def compile_pipeline(pipe, features=None):
+    """استخراج المعالجة والأشجار من Pipeline مدرب وتسطيحها في مصفوفات متصلة."""
+    preprocessor = pipe.named_steps["preprocessor"]
+    forest = pipe.named_steps["regressor"]
+
+    scaler = preprocessor.named_transformers_["num"]
+    encoder = preprocessor.named_transformers_["cat"]
+    numeric = [c for name, _, cols in preprocessor.transformers_ if name == "num" for c in cols]
+    categorical = [c for name, _, cols in preprocessor.transformers_ if name == "cat" for c in cols]
+    if features is not None and set(numeric + categorical) != set(features):
+        raise ValueError("pipeline columns do not match the bundle features")
+
+    mean = np.asarray(scaler.mean_, dtype=np.float64) if scaler.with_mean else np.zeros(len(numeric))
+    scale = np.asarray(scaler.scale_, dtype=np.float64) if scaler.with_std else np.ones(len(numeric))
+    categories = [np.asarray(c).astype(str) for c in encoder.categories_]
+
+    feature, threshold, children, value, roots = [], [], [], [], []
+    base, max_depth = 0, 0
+    for est in forest.estimators_:
+        tree = est.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        own = np.arange(n) + base
+
+        # الورقة تشير لنفسها وتقارن على العمود صفر حتى لا نحتاج شرطاً داخل الحلقة
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+        left = np.where(is_leaf, own, tree.children_left + base)
+        right = np.where(is_leaf, own, tree.children_right + base)
+        children.append(np.stack([left, right], axis=1).ravel())
+        value.append(tree.value[:, 0, 0])
+        roots.append(base)
+
+        base += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    return CompiledForest(
+        numeric, categorical, mean, scale, categories,
+        np.concatenate(feature).astype(np.int32),
+        np.concatenate(threshold).astype(np.float64),
+        np.concatenate(children).astype(np.int32),
+        np.concatenate(value).astype(np.float64),
+        np.asarray(roots, dtype=np.int32), max_depth,
+    )
+
+
+def export_compiled(bundle):
+    """إضافة النسخة المجمعة للـ bundle (تُحفظ معه في نفس ملف الموديل)."""
+    bundle["compiled"] = compile_pipeline(bundle["pipeline"], bundle["features_used"])
+    return bundle
\ No newline at end of file
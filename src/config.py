@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # المسار الرئيسي للمشروع
@@ -11,6 +12,87 @@ MODEL_PATH = BASE_DIR / "models" / "price_model.pkl"
 LOG_DIR = BASE_DIR / "logs"
 LOG_DB_PATH = LOG_DIR / "predictions.db"
 
+# الحد الأقصى لعدد السيارات في طلب /predict/batch الواحد
+MAX_BATCH_SIZE = 5000
+# الحد الأقصى للطلبات العمودية (Arrow IPC / NDJSON) التي لا تمر بـ pydantic لكل صف
+MAX_BULK_BATCH_SIZE = int(os.getenv("SMARTCAR_MAX_BULK_BATCH_SIZE", "200000"))
+
+# محرك التوقع: "compiled" (أشجار مسطحة بـ NumPy)، "shared" (نفس الأشجار عبر mmap مشترك بين العمليات)،
+# "compact" (الملف المضغوط المُقلَّم، انظر compact_model.py) أو "sklearn" (الـ Pipeline الأصلي)
+PREDICT_BACKEND = os.getenv("SMARTCAR_PREDICT_BACKEND", "compiled")
+
+# إعدادات مُجمِّع طلبات /predict (قابلة للضبط لكل بيئة تشغيل)
+MICROBATCH_MAX_SIZE = int(os.getenv("SMARTCAR_MICROBATCH_MAX_SIZE", "64"))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("SMARTCAR_MICROBATCH_MAX_WAIT_MS", "2"))
+MICROBATCH_QUEUE_SIZE = int(os.getenv("SMARTCAR_MICROBATCH_QUEUE_SIZE", "1000"))
+
+# الذاكرة المؤقتة للتوقعات: "memory" داخل العملية فقط أو "sqlite" مشتركة بين العمليات
+PREDICTION_CACHE_SIZE = int(os.getenv("SMARTCAR_PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL_S = float(os.getenv("SMARTCAR_PREDICTION_CACHE_TTL_S", "3600"))
+PREDICTION_CACHE_BACKEND = os.getenv("SMARTCAR_PREDICTION_CACHE_BACKEND", "memory")
+PREDICTION_CACHE_DB_PATH = LOG_DIR / "prediction_cache.db"
+
+# كاتب السجلات في الخلفية: حجم الطابور، أقصى عدد صفوف في كل commit، ومهلة الانتظار
+LOG_QUEUE_SIZE = int(os.getenv("SMARTCAR_LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("SMARTCAR_LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL_S = float(os.getenv("SMARTCAR_LOG_FLUSH_INTERVAL_S", "0.5"))
+
+# مخزن الأعمدة (Parquet) لبيانات السوق وحجم الدفعة عند قراءة الـ CSV
+FEATURE_STORE_DIR = BASE_DIR / "data" / "store"
+USE_FEATURE_STORE = os.getenv("SMARTCAR_USE_FEATURE_STORE", "1") == "1"
+CSV_CHUNK_SIZE = int(os.getenv("SMARTCAR_CSV_CHUNK_SIZE", "200000"))
+
+# حالة التحديث التدريجي للموديل (تكتبها العملية الخلفية وتقرؤها الواجهة)
+INCREMENTAL_STATUS_PATH = BASE_DIR / "models" / "incremental_status.json"
+
+# تقارير البحث عن الموديل والمقارنات
+REPORTS_DIR = BASE_DIR / "reports"
+
+# سجل نسخ الموديل (مجلد لكل نسخة + مؤشر CURRENT) وفترة مراقبة المؤشر في الـ API
+MODEL_REGISTRY_DIR = Path(os.getenv("SMARTCAR_MODEL_REGISTRY_DIR", BASE_DIR / "models" / "registry"))
+MODEL_WATCH_INTERVAL_S = float(os.getenv("SMARTCAR_MODEL_WATCH_INTERVAL_S", "2"))
+
+# نسخة الموديل المسطحة للخدمة متعددة العمليات (مصفوفات تُقرأ بـ mmap وتتشاركها كل العمليات)
+SHARED_MODEL_PATH = BASE_DIR / "models" / "price_model.shared.joblib"
+
+# مشغّل الـ API متعدد العمليات
+SERVE_HOST = os.getenv("SMARTCAR_SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SMARTCAR_SERVE_PORT", "8000"))
+SERVE_WORKERS = int(os.getenv("SMARTCAR_SERVE_WORKERS", str(os.cpu_count() or 1)))
+SERVE_PID_PATH = LOG_DIR / "serve.pid"
+
+# قياس زمن مراحل التوقع وعرضها على /metrics (كلفته ميكروثانية تقريباً لكل مرحلة)
+METRICS_ENABLED = os.getenv("SMARTCAR_METRICS_ENABLED", "1") == "1"
+
+# النسخة المضغوطة من الموديل (أشجار مُقلَّمة بدقة مخفضة في ملف ثنائي بدون pickle):
+# أقصى انخفاض مسموح في R² عند التقليم وأقل عدد أشجار يُحتفظ به
+COMPACT_MODEL_PATH = BASE_DIR / "models" / "price_model.compact.bin"
+COMPACT_MAX_R2_DROP = float(os.getenv("SMARTCAR_COMPACT_MAX_R2_DROP", "0.005"))
+COMPACT_MIN_TREES = int(os.getenv("SMARTCAR_COMPACT_MIN_TREES", "32"))
+# أقل عدد صفوف تدريب يُختار عليه (أقل من ذلك يكون الاختيار ضجيجاً فتُحفظ كل الأشجار بدون تقليم)
+COMPACT_MIN_SELECTION_ROWS = int(os.getenv("SMARTCAR_COMPACT_MIN_SELECTION_ROWS", "1000"))
+
+# التقييم الجماعي لملفات CSV (src/batch_valuation.py): عدد الصفوف في كل دفعة وعدد العمليات
+BATCH_CHUNK_ROWS = int(os.getenv("SMARTCAR_BATCH_CHUNK_ROWS", "50000"))
+BATCH_WORKERS = int(os.getenv("SMARTCAR_BATCH_WORKERS", str(os.cpu_count() or 1)))
+
+# نسبة الأسعار الحقيقية التي يجب أن يغطيها نطاق السعر العادل لكل سيارة (معايرة وقت التدريب)
+PRICE_INTERVAL_COVERAGE = float(os.getenv("SMARTCAR_PRICE_INTERVAL_COVERAGE", "0.8"))
+
+# محرك السيارات المشابهة (src/comparables.py): عدد النتائج الافتراضي وأقصاه، وعدد الصفوف في كل كتلة
+COMPARABLES_K = int(os.getenv("SMARTCAR_COMPARABLES_K", "10"))
+COMPARABLES_MAX_K = int(os.getenv("SMARTCAR_COMPARABLES_MAX_K", "100"))
+COMPARABLES_BLOCK_ROWS = int(os.getenv("SMARTCAR_COMPARABLES_BLOCK_ROWS", "1024"))
+
+# مراقبة انحراف الطلبات عن بيانات التدريب (src/drift.py): عدد شرائح PSI، حجم المخزن المؤقت قبل الدمج،
+# أقل عدد طلبات قبل الحكم، حدا PSI للتحذير والإنذار، وأقصى عدد سجلات عند إعادة البناء من سجل التوقعات
+DRIFT_BINS = int(os.getenv("SMARTCAR_DRIFT_BINS", "10"))
+DRIFT_BUFFER_SIZE = int(os.getenv("SMARTCAR_DRIFT_BUFFER_SIZE", "1024"))
+DRIFT_MIN_SAMPLES = int(os.getenv("SMARTCAR_DRIFT_MIN_SAMPLES", "200"))
+DRIFT_PSI_WARN = float(os.getenv("SMARTCAR_DRIFT_PSI_WARN", "0.1"))
+DRIFT_PSI_ALERT = float(os.getenv("SMARTCAR_DRIFT_PSI_ALERT", "0.25"))
+DRIFT_BACKFILL_LIMIT = int(os.getenv("SMARTCAR_DRIFT_BACKFILL_LIMIT", "100000"))
+
 # إنشاء المجلدات تلقائياً
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 (BASE_DIR / "models").mkdir(parents=True, exist_ok=True)
\ No newline at end of file
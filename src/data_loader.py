@@ -1,22 +1,33 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from src.config import USE_FEATURE_STORE, CSV_CHUNK_SIZE
+from src.features import CURRENT_YEAR
+from src.quantile_sketch import sketch_csv
 
-def load_data(path: Path) -> pd.DataFrame:
-    df = pd.read_csv(path)
+def iter_filtered_chunks(path: Path, chunk_size: int = CSV_CHUNK_SIZE, bounds=None):
+    """
+    قراءة الـ CSV على دفعات بعد قص الأسعار المتطرفة، بدون تحميل الملف كاملاً:
+    المرور الأول يبني sketch للأسعار (إذا لم تُعطَ الحدود)، والثاني يُرجع الدفعات المفلترة.
+    """
+    if bounds is None:
+        bounds = sketch_csv(path, "Price_USD", chunk_size).quantile([0.01, 0.99])
+    q_low, q_hi = bounds
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        # توحيد السنة وحساب العمر
+        if "Year" not in chunk.columns and "Manufacture_Year" in chunk.columns:
+            chunk["Year"] = chunk["Manufacture_Year"]
+        chunk["Car_Age"] = CURRENT_YEAR - chunk["Year"]
+        # هندسة الميزات (تساعد جداً في رفع R2)
+        chunk["HP_per_CC"] = chunk["Horsepower"] / (chunk["Engine_CC"] + 1)
+        yield chunk[(chunk["Price_USD"] < q_hi) & (chunk["Price_USD"] > q_low)]
 
-    # توحيد السنة وحساب العمر
-    if "Year" not in df.columns and "Manufacture_Year" in df.columns:
-        df["Year"] = df["Manufacture_Year"]
-    
-    df["Car_Age"] = 2026 - df["Year"]
+def load_data(path: Path, use_store: bool = USE_FEATURE_STORE) -> pd.DataFrame:
+    # القراءة من مخزن الأعمدة (Parquet) المبني مسبقاً؛ يُعاد بناؤه فقط إذا تغيّر الـ CSV
+    if use_store:
+        from src.feature_store import load_store
+        return load_store(path)
 
-    # هندسة الميزات (تساعد جداً في رفع R2)
-    df["HP_per_CC"] = df["Horsepower"] / (df["Engine_CC"] + 1)
-
-    # تنظيف الأسعار المتطرفة (Outliers)
-    q_low = df["Price_USD"].quantile(0.01)
-    q_hi  = df["Price_USD"].quantile(0.99)
-    df = df[(df["Price_USD"] < q_hi) & (df["Price_USD"] > q_low)]
-
-    return df
\ No newline at end of file
+    # تنظيف الأسعار المتطرفة (Outliers) بحدود تقديرية من مرور واحد ثم تحميل الصفوف المقبولة فقط
+    chunks = list(iter_filtered_chunks(path))
+    return pd.concat(chunks) if chunks else pd.DataFrame()
\ No newline at end of file
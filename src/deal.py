@@ -1,4 +1,14 @@
 from dataclasses import dataclass
+import numpy as np
+from src.uncertainty import interval_confidence
+
+GREAT_DEAL_LABEL = "🔥 صفقة ممتازة (Great Deal)"
+OVERPRICED_LABEL = "⚠️ مبالغ فيه (Overpriced)"
+FAIR_PRICE_LABEL = "✅ سعر عادل (Fair Price)"
+
+# رمز كل تقييم في المصفوفات (int8) والنص المقابل له في DEAL_LABELS
+FAIR_PRICE, GREAT_DEAL, OVERPRICED = 0, 1, 2
+DEAL_LABELS = np.array([FAIR_PRICE_LABEL, GREAT_DEAL_LABEL, OVERPRICED_LABEL])
 
 @dataclass
 class DealResult:
@@ -7,18 +17,44 @@ class DealResult:
     upper: float
     confidence_score: float
 
-def evaluate_deal(listed_price, predicted_price, mae_usd, r2_score=0.0):
-    # نطاق مرن يعتمد على دقة الموديل
-    band = max(0.07 * predicted_price, 0.8 * mae_usd)
-    lower, upper = predicted_price - band, predicted_price + band
-    
-    confidence = round(max(0, r2_score * 100), 2)
-
-    if listed_price < lower:
-        label = "🔥 صفقة ممتازة (Great Deal)"
-    elif listed_price > upper:
-        label = "⚠️ مبالغ فيه (Overpriced)"
+@dataclass
+class DealBatch:
+    codes: np.ndarray       # FAIR_PRICE / GREAT_DEAL / OVERPRICED لكل سيارة
+    lower: np.ndarray
+    upper: np.ndarray
+    confidence: np.ndarray  # نسبة الثقة (0-100) لكل سيارة
+
+    @property
+    def labels(self) -> np.ndarray:
+        """النص المقابل لكل رمز (للعرض والـ API)."""
+        return DEAL_LABELS[self.codes]
+
+def evaluate_deals(listed_prices, predicted_prices, mae_usd, r2_score=0.0, lower=None, upper=None) -> DealBatch:
+    """
+    تقييم عدة سيارات دفعة واحدة كعمليات مصفوفات (بدون حلقة على الصفوف).
+    مع lower/upper (نطاق كل سيارة من تشتت الأشجار، انظر uncertainty.py) يكون النطاق والثقة
+    خاصين بكل سيارة؛ بدونهما نرجع للنطاق العام من دقة الموديل.
+    """
+    listed = np.asarray(listed_prices, dtype=float)
+    predicted = np.asarray(predicted_prices, dtype=float)
+
+    if lower is not None and upper is not None:
+        lower, upper = np.asarray(lower, dtype=float), np.asarray(upper, dtype=float)
+        confidence = interval_confidence(predicted, lower, upper)
     else:
-        label = "✅ سعر عادل (Fair Price)"
+        # نطاق مرن يعتمد على دقة الموديل
+        band = np.maximum(0.07 * predicted, 0.8 * mae_usd)
+        lower, upper = predicted - band, predicted + band
+        confidence = np.full(predicted.shape, round(max(0, r2_score * 100), 2))
+
+    codes = np.full(predicted.shape, FAIR_PRICE, dtype=np.int8)
+    codes[listed < lower] = GREAT_DEAL
+    codes[listed > upper] = OVERPRICED
+    return DealBatch(codes, lower, upper, confidence)
 
-    return DealResult(label, lower, upper, confidence)
\ No newline at end of file
+def evaluate_deal(listed_price, predicted_price, mae_usd, r2_score=0.0, lower=None, upper=None):
+    """تقييم سيارة واحدة (نفس منطق evaluate_deals)."""
+    interval = {} if lower is None or upper is None else {"lower": [lower], "upper": [upper]}
+    deals = evaluate_deals([listed_price], [predicted_price], mae_usd, r2_score, **interval)
+    return DealResult(str(deals.labels[0]), float(deals.lower[0]), float(deals.upper[0]),
+                      float(deals.confidence[0]))
\ No newline at end of file
@@ -0,0 +1,285 @@
+"""
+مراقبة انحراف الطلبات (drift): هل ما زالت السيارات التي تصل لـ /predict تشبه البيانات التي تدرب عليها الموديل؟
+
+- المرجع (drift_reference) يُبنى وقت التدريب من صفوف الاختبار ويُحفظ في الـ bundle: KLL sketch لكل ميزة رقمية
+  وللسعر المتوقع (log1p) لنفس الصفوف، وعدد كل قيمة للميزات النصية. كله قابل للدمج، فالتحديث التدريجي يدمج فيه
+  صفوف الاختبار الجديدة.
+- المراقب يحتفظ بنفس البنية لحركة الطلبات بذاكرة ثابتة: sketch وعدّادات شرائح (حدودها عُشيرات المرجع)
+  لكل ميزة رقمية، وعدّاد لكل فئة معروفة + خانة واحدة للفئات غير المعروفة.
+- الطلب يضيف صفه لمخزن مؤقت فقط؛ الدمج في الـ sketches يتم دفعات (عند امتلاء المخزن، أو من حلقة المراقبة،
+  أو قبل القراءة).
+- المقاييس: PSI على الشرائح، KS بين الـ sketch الحي والمرجع، وأكبر تغيرات نسب الفئات.
+- القيم التي لم يرسلها العميل (تُملأ بوسيط التدريب) لا تدخل التوزيع، وتُعد في imputed.
+"""
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.config import (DRIFT_BINS, DRIFT_BUFFER_SIZE, DRIFT_MIN_SAMPLES, DRIFT_PSI_WARN, DRIFT_PSI_ALERT,
+                        DRIFT_BACKFILL_LIMIT)
+from src.features import FEATURES_NUMERIC, FEATURES_CATEGORICAL
+from src.logging_db import feature_logs
+from src.metrics import metrics
+from src.quantile_sketch import KLLSketch
+
+DRIFT_REFERENCE_VERSION = 1
+
+# اسم السعر المتوقع بين الميزات المراقَبة (يُراقب في فضاء log1p مثل هدف الموديل)
+PREDICTION = "predicted_price"
+
+# خانة الفئات التي لم تظهر في بيانات التدريب
+UNSEEN = "__unseen__"
+
+# أصغر نسبة في حساب PSI حتى لا يكون اللوغاريتم لانهائياً عند شريحة فارغة
+PSI_EPSILON = 1e-4
+
+# معامل القيمة الحرجة لـ KS عند مستوى دلالة 5%
+KS_COEFFICIENT_05 = 1.358
+
+
+def _sketch(values) -> dict:
+    return KLLSketch().update(np.asarray(values, dtype=np.float64)).to_dict()
+
+
+def build_reference(X, predicted_log) -> dict:
+    """مرجع التوزيعات من ميزات الصفوف X والسعر المتوقع (لوغاريتم) لنفس الصفوف وبنفس الترتيب."""
+    if len(X) != len(predicted_log):
+        raise ValueError("features and predictions must come from the same rows")
+    return {
+        "version": DRIFT_REFERENCE_VERSION,
+        "rows": int(len(X)),
+        "numeric": {f: _sketch(X[f]) for f in FEATURES_NUMERIC},
+        "categorical": {f: {str(k): int(v) for k, v in X[f].astype(str).value_counts().items()}
+                        for f in FEATURES_CATEGORICAL},
+        "prediction": _sketch(predicted_log),
+    }
+
+
+def merge_reference(reference, X, predicted_log) -> dict:
+    """دمج صفوف جديدة في مرجع موجود (التحديث التدريجي)؛ الموديلات القديمة بدون مرجع تبدأ من الصفوف الجديدة."""
+    new = build_reference(X, predicted_log)
+    if not reference or reference.get("version") != DRIFT_REFERENCE_VERSION:
+        return new
+
+    def merged(a, b):
+        return KLLSketch.from_dict(a).merge(KLLSketch.from_dict(b)).to_dict()
+
+    categorical = {}
+    for f in FEATURES_CATEGORICAL:
+        counts = dict(reference["categorical"].get(f, {}))
+        for value, count in new["categorical"][f].items():
+            counts[value] = counts.get(value, 0) + count
+        categorical[f] = counts
+    return {
+        "version": DRIFT_REFERENCE_VERSION,
+        "rows": reference["rows"] + new["rows"],
+        "numeric": {f: merged(reference["numeric"][f], new["numeric"][f]) for f in FEATURES_NUMERIC},
+        "categorical": categorical,
+        "prediction": merged(reference["prediction"], new["prediction"]),
+    }
+
+
+def reference_defaults(reference) -> dict:
+    """وسيط كل ميزة رقمية في المرجع (يُستخدم بدل القيم التي لا يرسلها العميل)."""
+    return {f: round(float(KLLSketch.from_dict(state).quantile(0.5)), 4) for f, state in reference["numeric"].items()}
+
+
+def population_stability_index(expected, actual) -> float:
+    expected = np.maximum(np.asarray(expected, dtype=np.float64), PSI_EPSILON)
+    actual = np.maximum(np.asarray(actual, dtype=np.float64), PSI_EPSILON)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks_statistic(reference: KLLSketch, live: KLLSketch) -> float:
+    """أكبر فرق بين دالتي التوزيع التراكمي، مقيّماً عند كل قيم الـ sketchين."""
+    points = np.unique(np.concatenate(reference.levels + live.levels))
+    return float(np.max(np.abs(reference.cdf(points) - live.cdf(points))))
+
+
+def drift_level(psi) -> str:
+    if psi is None:
+        return "unknown"
+    if psi >= DRIFT_PSI_ALERT:
+        return "drift"
+    return "warning" if psi >= DRIFT_PSI_WARN else "stable"
+
+
+class DriftMonitor:
+    def __init__(self, reference=None, buffer_size=DRIFT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()       # المخزن المؤقت
+        self._fold_lock = threading.Lock()  # الـ sketches والعدّادات
+        self.set_reference(reference)
+
+    def set_reference(self, reference):
+        """مرجع جديد (عند تبديل الموديل) يبدأ إحصاءات الطلبات من الصفر."""
+        with self._fold_lock, self._lock:
+            self._buffer = []
+            self.reference = reference if reference and reference.get("version") == DRIFT_REFERENCE_VERSION else None
+            self.observed = 0
+            self.imputed = dict.fromkeys(FEATURES_NUMERIC, 0)
+            self._edges, self._ref_sketch, self._ref_bins = {}, {}, {}
+            self._live_sketch, self._live_bins = {}, {}
+            self._categories, self._ref_shares, self._live_counts = {}, {}, {}
+            if self.reference is None:
+                return
+
+            states = dict(self.reference["numeric"])
+            states[PREDICTION] = self.reference["prediction"]
+            for name, state in states.items():
+                ref = KLLSketch.from_dict(state)
+                # الشريحة i: القيم في (edges[i-1], edges[i]]
+                edges = np.unique(ref.quantile(np.linspace(0.0, 1.0, DRIFT_BINS + 1)[1:-1]))
+                self._edges[name] = edges
+                self._ref_sketch[name] = ref
+                self._ref_bins[name] = np.diff(np.concatenate([[0.0], ref.cdf(edges), [1.0]]))
+                self._live_sketch[name] = KLLSketch()
+                self._live_bins[name] = np.zeros(len(edges) + 1, dtype=np.int64)
+
+            for f, counts in self.reference["categorical"].items():
+                categories = sorted(counts)
+                ref_counts = np.array([counts[c] for c in categories] + [0], dtype=np.float64)
+                self._categories[f] = categories
+                self._ref_shares[f] = ref_counts / max(ref_counts.sum(), 1.0)
+                self._live_counts[f] = np.zeros(len(categories) + 1, dtype=np.int64)
+
+    def observe(self, row, predicted_price, imputed=()):
+        """صف طلب واحد (قاموس الميزات كما دخل الموديل): إضافة للمخزن المؤقت فقط."""
+        self.observe_rows([row], [predicted_price], [imputed])
+
+    def observe_rows(self, rows, predicted_prices, imputed=None):
+        if self.reference is None:
+            return
+        imputed = imputed or [()] * len(rows)
+        with self._lock:
+            self._buffer.extend(zip(rows, predicted_prices, imputed))
+            full = len(self._buffer) >= self.buffer_size
+        if full:
+            self.fold()
+
+    def observe_columns(self, columns, predicted_prices, imputed=None):
+        """دفعة عمودية (اسم الميزة -> مصفوفة) تُدمج مباشرة؛ imputed: اسم الميزة -> قناع الصفوف المملوءة."""
+        if self.reference is None or len(predicted_prices) == 0:
+            return
+        numeric = {f: np.array(columns[f], dtype=np.float64) for f in FEATURES_NUMERIC}
+        for f, mask in (imputed or {}).items():
+            numeric[f][np.asarray(mask, dtype=bool)] = np.nan
+        numeric[PREDICTION] = np.log1p(np.asarray(predicted_prices, dtype=np.float64))
+        self._fold_arrays(numeric, {f: columns[f] for f in FEATURES_CATEGORICAL})
+
+    def fold(self):
+        """دمج المخزن المؤقت في الـ sketches والعدّادات كعمليات مصفوفات."""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        rows, prices, imputed = zip(*batch)
+        numeric = {f: np.array([row.get(f, np.nan) for row in rows], dtype=np.float64) for f in FEATURES_NUMERIC}
+        for i, names in enumerate(imputed):
+            for f in names:
+                numeric[f][i] = np.nan
+        numeric[PREDICTION] = np.log1p(np.array(prices, dtype=np.float64))
+        self._fold_arrays(numeric, {f: [str(row.get(f)) for row in rows] for f in FEATURES_CATEGORICAL})
+
+    def _fold_arrays(self, numeric, categorical):
+        with metrics.timer("drift_fold"), self._fold_lock:
+            if self.reference is None:
+                return
+            for name, values in numeric.items():
+                known = values[np.isfinite(values)]
+                if name in self.imputed:
+                    self.imputed[name] += len(values) - len(known)
+                self._live_sketch[name].update(known)
+                edges = self._edges[name]
+                self._live_bins[name] += np.bincount(np.searchsorted(edges, known, side="left"),
+                                                     minlength=len(edges) + 1)
+            for f, values in categorical.items():
+                categories = self._categories[f]
+                codes = pd.Categorical(np.asarray(values, dtype=str), categories=categories).codes
+                # الفئات غير المعروفة (الرمز -1) في الخانة الأخيرة
+                self._live_counts[f] += np.bincount(np.where(codes < 0, len(categories), codes),
+                                                    minlength=len(categories) + 1)
+            self.observed += len(numeric[PREDICTION])
+
+    def _numeric_drift(self, name):
+        n = int(self._live_bins[name].sum())
+        result = {"observed": n}
+        if name in self.imputed:
+            result["imputed"] = self.imputed[name]
+        if n == 0:
+            return {**result, "psi": None, "ks": None, "status": drift_level(None)}
+
+        ref, live = self._ref_sketch[name], self._live_sketch[name]
+        psi = population_stability_index(self._ref_bins[name], self._live_bins[name] / n)
+        to_value = np.expm1 if name == PREDICTION else float
+        return {
+            **result,
+            "psi": round(psi, 4),
+            "ks": round(ks_statistic(ref, live), 4),
+            "ks_critical": round(KS_COEFFICIENT_05 * np.sqrt((ref.n + n) / (ref.n * n)), 4),
+            "reference_median": round(float(to_value(ref.quantile(0.5))), 4),
+            "live_median": round(float(to_value(live.quantile(0.5))), 4),
+            "status": drift_level(psi),
+        }
+
+    def _categorical_drift(self, f, top=3):
+        counts = self._live_counts[f]
+        n = int(counts.sum())
+        if n == 0:
+            return {"observed": 0, "psi": None, "status": drift_level(None)}
+        live, ref = counts / n, self._ref_shares[f]
+        psi = population_stability_index(ref, live)
+        labels = self._categories[f] + [UNSEEN]
+        shifts = [{"value": labels[i], "reference_share": round(float(ref[i]), 4), "live_share": round(float(live[i]), 4)}
+                  for i in np.argsort(-np.abs(live - ref), kind="stable")[:top]]
+        return {"observed": n, "psi": round(psi, 4), "unseen_share": round(float(live[-1]), 4),
+                "top_shifts": shifts, "status": drift_level(psi)}
+
+    def report(self) -> dict:
+        """PSI و KS لكل ميزة وللسعر المتوقع، وحالة عامة (أسوأ ميزة) بعد DRIFT_MIN_SAMPLES طلباً."""
+        self.fold()
+        with self._fold_lock:
+            if self.reference is None:
+                return {"status": "no_reference", "observed": 0}
+            features = {name: self._numeric_drift(name) for name in FEATURES_NUMERIC}
+            features.update({f: self._categorical_drift(f) for f in FEATURES_CATEGORICAL})
+            prediction = self._numeric_drift(PREDICTION)
+            observed = self.observed
+
+        psis = [v["psi"] for v in [prediction, *features.values()] if v["psi"] is not None]
+        max_psi = max(psis) if psis else None
+        status = drift_level(max_psi) if observed >= DRIFT_MIN_SAMPLES else "insufficient_data"
+        return {
+            "status": status,
+            "observed": observed,
+            "reference_rows": self.reference["rows"],
+            "max_psi": max_psi,
+            "thresholds": {"psi_warn": DRIFT_PSI_WARN, "psi_alert": DRIFT_PSI_ALERT, "min_samples": DRIFT_MIN_SAMPLES},
+            "prediction": prediction,
+            "features": features,
+        }
+
+    def stats(self) -> dict:
+        """أرقام مسطحة لـ /metrics (PSI و KS لكل ميزة)."""
+        buffered = len(self._buffer)
+        report = self.report()
+        stats = {"observed": report["observed"], "buffered": buffered, "max_psi": report.get("max_psi")}
+        for name, values in [(PREDICTION, report.get("prediction", {})), *report.get("features", {}).items()]:
+            stats[f"psi_{name}"] = values.get("psi")
+            stats[f"ks_{name}"] = values.get("ks")
+        return stats
+
+
+def backfill_from_logs(monitor, limit=DRIFT_BACKFILL_LIMIT, since=None, model_type=None) -> int:
+    """إدخال أحدث سجلات التوقع (جدول predictions) في المراقب، مثلاً بعد إعادة تشغيل الخدمة."""
+    logs = feature_logs(limit, since, model_type)
+    rows, imputed = [], []
+    for text in logs["features_json"]:
+        row = json.loads(text)
+        imputed.append(row.pop("_imputed", ()))
+        rows.append(row)
+    monitor.observe_rows(rows, logs["predicted_price"].tolist(), imputed)
+    monitor.fold()
+    return len(rows)
\ No newline at end of file
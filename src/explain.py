@@ -1,20 +1,152 @@
-# src/predict.py
-import joblib
+"""
+تفسير كل توقع: كم أضافت (أو أنقصت) كل ميزة من السعر، بطريقة مسار القرار (decision path / Saabas).
+
+في كل شجرة، الانتقال من عقدة لابنها يغيّر القيمة المتوقعة بمقدار (قيمة الابن - قيمة العقدة)،
+وهذا التغيير يُنسب لميزة التقسيم في العقدة. مجموع التغييرات على المسار = الورقة - الجذر، فيكون:
+    التوقع (لوغاريتم) = متوسط الجذور (الأساس) + مجموع مساهمات الميزات   (تماماً، بدون تقريب)
+
+- لكل عقدة تُحسب مسبقاً مرة واحدة: مقدار التغيير عند دخولها، والميزة الأصلية للتقسيم الذي أدى
+  إليها (أعمدة الـ one-hot تُجمع على عمودها النصي الأصلي).
+- المشي على الأشجار نفس مشي CompiledForest.tree_predictions (كل الأشجار وكل الصفوف معاً)،
+  مع إضافة التغيير لكل (صف، ميزة) في كل خطوة.
+- التحويل للدولار: التوقع بالدولار = expm1(الأساس + المجموع)، فتُضرب كل مساهمة لوغاريتمية في
+  المتوسط اللوغاريتمي لـ (1 + السعر) و (1 + سعر الأساس)، ومجموع المساهمات بالدولار يساوي
+  السعر المتوقع - سعر الأساس بالضبط.
+"""
 import numpy as np
-import pandas as pd
-from src.config import MODEL_PATH
 
-def load_model_bundle():
-    return joblib.load(MODEL_PATH)
+from src.compiled_model import compile_pipeline
+from src.metrics import metrics
+from src.predict import _validate_rows
+
+
+class ExplanationUnavailableError(Exception):
+    pass
+
+
+def _forest(bundle):
+    """الغابة المسطحة للـ bundle (مع backend=sklearn تُبنى مرة وتُحفظ في الـ bundle المحمّل)."""
+    if "compact_path" in bundle and not bundle.get("compact_node_values"):
+        raise ExplanationUnavailableError(
+            "compact model file has no internal node values; re-export it (python -m src.compact_model)")
+    forest = bundle.get("compiled")
+    if forest is None:
+        forest = bundle.get("explain_forest")
+        if forest is None:
+            forest = bundle["explain_forest"] = compile_pipeline(bundle["pipeline"], bundle["features_used"])
+    return forest
+
+
+def path_statistics(forest):
+    """
+    (التغيير عند دخول كل عقدة، رقم الميزة الأصلية التي أدت إليها) لكل عقد الغابة.
+    تُحسب مرة واحدة لكل غابة وتُحفظ معها.
+    """
+    stats = getattr(forest, "_path_stats", None)
+    if stats is not None:
+        return stats
+
+    n_nodes = len(forest.threshold)
+    own = np.arange(n_nodes)
+    kids = np.asarray(forest.children).reshape(-1, 2)
+    # الأوراق تشير لنفسها؛ الأبناء الحقيقيون فقط لهم أب
+    real = kids != own[:, None]
+    parent = np.full(n_nodes, -1, dtype=np.int64)
+    parent[kids[real]] = np.repeat(own, 2)[real.ravel()]
+
+    # عمود مدخلات الأشجار -> الميزة الأصلية (الأرقام أولاً ثم كل عمود نصي بأعمدة الـ one-hot الخاصة به)
+    origin_of_input = np.concatenate([
+        np.arange(len(forest.numeric)),
+        np.repeat(len(forest.numeric) + np.arange(len(forest.categorical)), [len(c) for c in forest.categories]),
+    ])
+
+    has_parent = parent >= 0
+    value = np.asarray(forest.value, dtype=np.float64)
+    delta = np.zeros(n_nodes, dtype=np.float64)
+    delta[has_parent] = value[has_parent] - value[parent[has_parent]]
+    origin = np.zeros(n_nodes, dtype=np.int32)
+    origin[has_parent] = origin_of_input[np.asarray(forest.feature)[parent[has_parent]]]
+
+    forest._path_stats = (delta, origin)
+    return forest._path_stats
 
-def predict_price(bundle, input_dict):
-    pipe = bundle["pipeline"]
+
+def explain_log(forest, X, chunk_size=512):
+    """(الأساس، مساهمة كل ميزة أصلية لكل صف) في فضاء اللوغاريتم؛ الأساس + المجموع = forest.predict(X)."""
+    delta, origin = path_statistics(forest)
+    n_features = len(forest.numeric) + len(forest.categorical)
+    contributions = np.empty((X.shape[0], n_features), dtype=np.float64)
+
+    for start in range(0, X.shape[0], chunk_size):
+        block = X[start:start + chunk_size]
+        n_rows = block.shape[0]
+        flat = block.ravel()
+        row_base = (np.arange(n_rows, dtype=np.int32) * block.shape[1])[:, None]
+        out_base = (np.arange(n_rows, dtype=np.int64) * n_features)[:, None]
+        nodes = np.broadcast_to(forest.roots, (n_rows, forest.n_trees)).copy()
+        totals = np.zeros(n_rows * n_features, dtype=np.float64)
+        for _ in range(forest.max_depth):
+            x = np.take(flat, row_base + np.take(forest.feature, nodes))
+            go_right = x > np.take(forest.threshold, nodes)
+            nxt = np.take(forest.children, 2 * nodes + go_right)
+            # الورقة تشير لنفسها: لا تغيير بعد الوصول إليها
+            step = np.where(nxt != nodes, np.take(delta, nxt), 0.0)
+            totals += np.bincount((out_base + np.take(origin, nxt)).ravel(), step.ravel(),
+                                  minlength=n_rows * n_features)
+            nodes = nxt
+        contributions[start:start + chunk_size] = totals.reshape(n_rows, n_features) / forest.n_trees
+
+    base = float(np.mean(np.take(forest.value, forest.roots)))
+    return base, contributions
+
+
+def to_dollars(base_log, contributions_log):
+    """
+    (السعر المتوقع، سعر الأساس، المساهمات بالدولار) من الأساس والمساهمات في فضاء log1p.
+    المعامل هو المتوسط اللوغاريتمي (a - b) / (ln a - ln b) لـ a = 1 + السعر و b = 1 + الأساس.
+    """
+    total_log = base_log + contributions_log.sum(axis=1)
+    gap = total_log - base_log
+    predicted, base_price = np.expm1(total_log), float(np.expm1(base_log))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = np.where(np.abs(gap) > 1e-12, (predicted - base_price) / gap, np.exp(total_log))
+    return predicted, base_price, contributions_log * factor[:, None]
+
+
+def explain_columns(bundle, columns):
+    """(السعر المتوقع، سعر الأساس، مصفوفة المساهمات بالدولار، أسماء الميزات) لأعمدة صالحة."""
+    forest = _forest(bundle)
+    with metrics.timer("preprocess"):
+        X = forest.transform_columns(columns)
+    with metrics.timer("explain"):
+        base_log, contributions = explain_log(forest, X)
+    predicted, base_price, dollars = to_dollars(base_log, contributions)
+    return predicted, base_price, dollars, forest.numeric + forest.categorical
+
+
+def explain_rows(bundle, rows):
+    """
+    تفسير عدة سيارات في مرور واحد على الغابة. تُرجع (قائمة نتيجة لكل صف صالح، الأخطاء).
+    كل نتيجة: السعر المتوقع، سعر الأساس، ومساهمة كل ميزة أصلية مرتبة من الأكبر أثراً.
+    """
     features = bundle["features_used"]
-    
-    # تأمين المدخلات
-    row = {k: input_dict.get(k, 0 if isinstance(v, (int, float)) else "Unknown") 
-           for k, v in input_dict.items() if k in features}
-    
-    X = pd.DataFrame([row])
-    pred = pipe.predict(X)[0]
-    return float(np.expm1(pred)) # إعادة القيمة من لوغاريتم لدولار
\ No newline at end of file
+    valid_idx, valid_rows, errors = _validate_rows(rows, features)
+    if not valid_rows:
+        return [], errors
+
+    columns = {f: [row[f] for row in valid_rows] for f in features}
+    predicted, base_price, dollars, names = explain_columns(bundle, columns)
+
+    results = []
+    for j, (i, row) in enumerate(zip(valid_idx, valid_rows)):
+        order = np.argsort(-np.abs(dollars[j]), kind="stable")
+        results.append({
+            "index": i,
+            "ai_predicted_price": round(float(predicted[j]), 2),
+            "base_price": round(base_price, 2),
+            "contributions": [
+                {"feature": names[k], "value": row[names[k]], "contribution_usd": round(float(dollars[j, k]), 2)}
+                for k in order
+            ],
+        })
+    return results, errors
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""
+مخزن أعمدة (Parquet) لبيانات السوق بدل إعادة قراءة cars.csv في كل تشغيل.
+يُبنى المخزن مرة واحدة (قراءة الـ CSV على دفعات) ويُعاد بناؤه فقط عند تغيّر بصمة الملف.
+الميزات المشتقة (Year, Car_Age, HP_per_CC) وحدود الأسعار المتطرفة تُحسب أثناء البناء،
+والحدود تُقدّر بـ KLL sketch يُحفظ في الـ manifest بدل جمع كل الأسعار في الذاكرة.
+عند إعادة البناء يُفحص هل الملف الجديد هو القديم نفسه مع صفوف ملحقة فقط (أول بايتاته لم تتغير)،
+وتُحفظ النسخ التي يمتد منها في appended_to؛ الطبقات المبنية فوق المخزن لا تدمج الصفوف الجديدة إلا بعد هذا الفحص.
+"""
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.config import FEATURE_STORE_DIR, CSV_CHUNK_SIZE
+from src.features import CURRENT_YEAR
+from src.quantile_sketch import KLLSketch
+
+# الأعمدة النصية التي تُخزن كـ categorical
+CATEGORICAL_COLUMNS = ["Brand", "Body_Type", "Fuel_Type", "Transmission"]
+
+# نسب القص للأسعار المتطرفة (نفس منطق load_data الأصلي)
+PRICE_QUANTILES = (0.01, 0.99)
+
+STORE_VERSION = 2
+
+# أقصى عدد نسخ سابقة محفوظة في appended_to
+MAX_APPEND_HISTORY = 50
+
+
+def file_hash(path, block_size=1 << 20) -> str:
+    """بصمة محتوى الملف (تُقرأ على كتل حتى لا يدخل الملف كاملاً للذاكرة)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def prefix_hash(path, size, block_size=1 << 20) -> str:
+    """بصمة أول size بايت من الملف (بنفس طريقة file_hash)."""
+    h = hashlib.blake2b(digest_size=16)
+    remaining = size
+    with open(path, "rb") as f:
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            h.update(block)
+            remaining -= len(block)
+    return h.hexdigest()
+
+
+def _appends_to(csv_path, previous) -> list:
+    """
+    النسخ السابقة التي يمتد منها الملف الحالي بإلحاق صفوف فقط: النسخة السابقة مباشرة
+    (إذا لم تتغير بايتاتها وانتهت عند نهاية سطر) وكل ما كانت هي تمتد منه.
+    """
+    if previous is None or previous.get("version") != STORE_VERSION:
+        return []
+    old_size = previous["source_size"]
+    if csv_path.stat().st_size <= old_size or prefix_hash(csv_path, old_size) != previous["source_hash"]:
+        return []
+    # الصف الأخير القديم يجب ألا يكون قد اكتمل بالإضافة
+    with open(csv_path, "rb") as f:
+        f.seek(old_size - 1)
+        boundary = f.read(2)
+    if boundary[:1] not in (b"\n", b"\r") and boundary[1:] not in (b"\n", b"\r"):
+        return []
+    entry = {"hash": previous["source_hash"], "rows": previous["rows"]}
+    return (previous.get("appended_to", []) + [entry])[-MAX_APPEND_HISTORY:]
+
+
+def store_paths(csv_path):
+    """مسارات المخزن لكل ملف CSV (الاسم + بصمة قصيرة للمسار حتى لا تتصادم الملفات المتشابهة)."""
+    tag = hashlib.blake2b(str(csv_path.resolve()).encode("utf-8"), digest_size=4).hexdigest()
+    name = f"{csv_path.stem}-{tag}"
+    return FEATURE_STORE_DIR / f"{name}.parquet", FEATURE_STORE_DIR / f"{name}.manifest.json"
+
+
+def add_derived_features(chunk: pd.DataFrame) -> pd.DataFrame:
+    """نفس هندسة الميزات في load_data: توحيد السنة، العمر، والقوة لكل سي سي."""
+    if "Year" not in chunk.columns and "Manufacture_Year" in chunk.columns:
+        chunk["Year"] = chunk["Manufacture_Year"]
+    chunk["Car_Age"] = CURRENT_YEAR - chunk["Year"]
+    chunk["HP_per_CC"] = chunk["Horsepower"] / (chunk["Engine_CC"] + 1)
+    return chunk
+
+
+def _tmp_path(path):
+    """ملف مؤقت فريد بجانب الهدف: عدة عمليات/threads قد تعيد البناء معاً، فلا تكتب إحداها فوق ملف الأخرى."""
+    return path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+
+
+def _write_manifest(manifest_path, manifest):
+    """كتابة ذرية (ملف مؤقت ثم os.replace) حتى لا يقرأ أحد manifest نصف مكتوب."""
+    tmp_path = _tmp_path(manifest_path)
+    tmp_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp_path, manifest_path)
+
+
+def _read_manifest(manifest_path):
+    try:
+        return json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def is_fresh(csv_path) -> bool:
+    """هل المخزن مبني من نفس محتوى الـ CSV الحالي؟"""
+    parquet_path, manifest_path = store_paths(csv_path)
+    manifest = _read_manifest(manifest_path)
+    if manifest is None or manifest.get("version") != STORE_VERSION or not parquet_path.exists():
+        return False
+
+    st = csv_path.stat()
+    if manifest["source_size"] == st.st_size and manifest["source_mtime_ns"] == st.st_mtime_ns:
+        return True
+    # تغيّر وقت التعديل فقط؟ نتأكد من المحتوى قبل إعادة البناء
+    if manifest["source_size"] == st.st_size and manifest["source_hash"] == file_hash(csv_path):
+        manifest["source_mtime_ns"] = st.st_mtime_ns
+        _write_manifest(manifest_path, manifest)
+        return True
+    return False
+
+
+def build_store(csv_path, chunk_size=CSV_CHUNK_SIZE) -> dict:
+    """
+    قراءة الـ CSV على دفعات وكتابتها كـ Parquet مع الميزات المشتقة.
+    الصفوف تُخزن كاملة، وحدود الأسعار تُحفظ في الـ manifest ليُطبق القص عند التحميل.
+    """
+    FEATURE_STORE_DIR.mkdir(parents=True, exist_ok=True)
+    parquet_path, manifest_path = store_paths(csv_path)
+    appended_to = _appends_to(csv_path, _read_manifest(manifest_path))
+    tmp_path = _tmp_path(parquet_path)
+
+    writer, schema, rows = None, None, 0
+    sketch = KLLSketch()
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size,
+                                 dtype={c: "string" for c in CATEGORICAL_COLUMNS}):
+            chunk = add_derived_features(chunk)
+            sketch.update(chunk["Price_USD"].to_numpy(dtype=np.float64))
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(tmp_path, schema)
+            writer.write_table(table.cast(schema))
+            rows += len(chunk)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    if writer is not None:
+        writer.close()
+
+    q_low, q_hi = (float(q) for q in sketch.quantile(PRICE_QUANTILES))
+
+    st = csv_path.stat()
+    manifest = {
+        "version": STORE_VERSION,
+        "source": str(csv_path),
+        "source_size": st.st_size,
+        "source_mtime_ns": st.st_mtime_ns,
+        "source_hash": file_hash(csv_path),
+        "rows": rows,
+        "price_bounds": [q_low, q_hi],
+        "price_sketch": sketch.to_dict(),
+        "appended_to": appended_to,
+    }
+    os.replace(tmp_path, parquet_path)
+    _write_manifest(manifest_path, manifest)
+    return manifest
+
+
+def load_store(csv_path, columns=None) -> pd.DataFrame:
+    """تحميل البيانات من المخزن (وبناؤه أولاً إذا كان قديماً) مع قص الأسعار المتطرفة."""
+    if not is_fresh(csv_path):
+        build_store(csv_path)
+    parquet_path, manifest_path = store_paths(csv_path)
+    manifest = _read_manifest(manifest_path)
+
+    table = pq.read_table(parquet_path, columns=columns,
+                          read_dictionary=[c for c in CATEGORICAL_COLUMNS if columns is None or c in columns])
+    df = table.to_pandas()
+
+    q_low, q_hi = manifest["price_bounds"]
+    return df[(df["Price_USD"] < q_hi) & (df["Price_USD"] > q_low)]
+
+
+def source_version(csv_path) -> str:
+    """بصمة نسخة البيانات الحالية (تستخدمها الطبقات المبنية فوق المخزن)."""
+    if not is_fresh(csv_path):
+        build_store(csv_path)
+    return _read_manifest(store_paths(csv_path)[1])["source_hash"]
+
+def price_sketch(csv_path) -> KLLSketch:
+    """الـ sketch المحفوظ لأسعار المصدر (لحساب نِسب مئوية أخرى بدون قراءة البيانات)."""
+    if not is_fresh(csv_path):
+        build_store(csv_path)
+    return KLLSketch.from_dict(_read_manifest(store_paths(csv_path)[1])["price_sketch"])
+
+def source_rows(csv_path) -> int:
+    """عدد الصفوف الخام في المصدر (قبل قص الأسعار)."""
+    if not is_fresh(csv_path):
+        build_store(csv_path)
+    return int(_read_manifest(store_paths(csv_path)[1])["rows"])
+
+
+def is_append_of(csv_path, old_source, old_rows) -> bool:
+    """
+    هل المصدر الحالي هو نسخة البيانات old_source (بعدد صفوفها old_rows) مع صفوف ملحقة في النهاية فقط؟
+    إذا لا (تعدّلت صفوف قديمة مثلاً) يجب إعادة البناء كاملاً بدل دمج load_rows_since.
+    """
+    if not is_fresh(csv_path):
+        build_store(csv_path)
+    manifest = _read_manifest(store_paths(csv_path)[1])
+    return any(a["hash"] == old_source and a["rows"] == old_rows for a in manifest.get("appended_to", []))
+
+
+def load_rows_since(csv_path, start_row) -> pd.DataFrame:
+    """
+    تحميل الصفوف المضافة بعد start_row فقط (الـ CSV يُفترض أنه يُلحق به في النهاية).
+    نقرأ فقط مجموعات الصفوف (row groups) التي تحتوي صفوفاً جديدة.
+    """
+    if not is_fresh(csv_path):
+        build_store(csv_path)
+    parquet_path, manifest_path = store_paths(csv_path)
+    manifest = _read_manifest(manifest_path)
+
+    pf = pq.ParquetFile(parquet_path)
+    groups, first_row, offset = [], None, 0
+    for i in range(pf.num_row_groups):
+        n = pf.metadata.row_group(i).num_rows
+        if offset + n > start_row:
+            groups.append(i)
+            if first_row is None:
+                first_row = offset
+        offset += n
+    if not groups:
+        return pd.DataFrame(columns=pf.schema_arrow.names)
+
+    table = pf.read_row_groups(groups).slice(start_row - first_row)
+    df = table.to_pandas()
+    df.index = pd.RangeIndex(start_row, start_row + len(df))
+
+    q_low, q_hi = manifest["price_bounds"]
+    return df[(df["Price_USD"] < q_hi) & (df["Price_USD"] > q_low)]
\ No newline at end of file
@@ -1,3 +1,5 @@
+import numpy as np
+
 # الميزات الرقمية
 FEATURES_NUMERIC = ['Engine_CC', 'Horsepower', 'Mileage_km_per_l', 'Car_Age', 'HP_per_CC']
 
@@ -5,4 +7,54 @@ FEATURES_NUMERIC = ['Engine_CC', 'Horsepower', 'Mileage_km_per_l', 'Car_Age', 'H
 FEATURES_CATEGORICAL = ['Brand', 'Body_Type', 'Fuel_Type', 'Transmission']
 
 # العمود المستهدف
-TARGET_COLUMN = "Price_USD"
\ No newline at end of file
+TARGET_COLUMN = "Price_USD"
+
+# سنة الأساس لحساب عمر السيارة
+CURRENT_YEAR = 2026
+
+# قيمة افتراضية لاستهلاك الوقود عندما لا يرسلها المستخدم
+DEFAULT_MILEAGE_KM_PER_L = 15.0
+
+
+def default_mileage(bundle) -> float:
+    """استهلاك الوقود عندما لا يرسله المستخدم: وسيط بيانات تدريب الموديل (أو القيمة الثابتة للموديلات القديمة)."""
+    return bundle.get("feature_defaults", {}).get("Mileage_km_per_l", DEFAULT_MILEAGE_KM_PER_L)
+
+
+def build_input_data(brand, body_type, year, horsepower, engine_cc, fuel_type,
+                     transmission, mileage_km_per_l=DEFAULT_MILEAGE_KM_PER_L) -> dict:
+    """تجهيز قاموس الميزات بنفس الترتيب والمسميات التي تدرب عليها الموديل."""
+    return {
+        "Brand": brand,
+        "Body_Type": body_type,
+        "Year": year,
+        "Horsepower": horsepower,
+        "Engine_CC": engine_cc,
+        "Fuel_Type": fuel_type,
+        "Transmission": transmission,
+        "Car_Age": CURRENT_YEAR - year,
+        "HP_per_CC": horsepower / (engine_cc + 1),
+        "Mileage_km_per_l": mileage_km_per_l
+    }
+
+
+def build_input_columns(brand, body_type, year, horsepower, engine_cc, fuel_type,
+                        transmission, mileage_km_per_l=None) -> dict:
+    """نفس build_input_data لأعمدة كاملة (مصفوفات) بدون بناء قاموس لكل سيارة."""
+    year = np.asarray(year, dtype=np.float64)
+    horsepower = np.asarray(horsepower, dtype=np.float64)
+    engine_cc = np.asarray(engine_cc, dtype=np.float64)
+    if mileage_km_per_l is None:
+        mileage_km_per_l = np.full(len(year), DEFAULT_MILEAGE_KM_PER_L)
+    return {
+        "Brand": brand,
+        "Body_Type": body_type,
+        "Year": year,
+        "Horsepower": horsepower,
+        "Engine_CC": engine_cc,
+        "Fuel_Type": fuel_type,
+        "Transmission": transmission,
+        "Car_Age": CURRENT_YEAR - year,
+        "HP_per_CC": horsepower / (engine_cc + 1),
+        "Mileage_km_per_l": np.asarray(mileage_km_per_l, dtype=np.float64)
+    }
\ No newline at end of file
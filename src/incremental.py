@@ -0,0 +1,180 @@
+"""
+تحديث تدريجي للموديل: تدريب أشجار جديدة على السيارات المضافة فقط منذ آخر نسخة،
+واستبدال أقدم الأشجار بها (Tree replacement) حتى يبقى حجم الغابة ثابتاً.
+كلفة التحديث تتناسب مع حجم البيانات الجديدة وليس مع التاريخ كاملاً.
+"""
+import json
+import math
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import r2_score, mean_absolute_error
+
+from src.config import BASE_DIR, DATA_PATH, INCREMENTAL_STATUS_PATH
+from src.features import FEATURES_NUMERIC, FEATURES_CATEGORICAL, TARGET_COLUMN
+from src.feature_store import is_append_of, load_rows_since, load_store, source_rows, source_version
+from src.model_registry import current_model_path
+from src.compiled_model import export_compiled
+from src.uncertainty import calibrate_interval
+from src.drift import merge_reference, reference_defaults
+from src.prediction_cache import prediction_cache
+from src.train import save_bundle, train_price_model
+
+# أقل عدد من الصفوف الجديدة يستحق تحديثاً
+MIN_NEW_ROWS = 20
+
+# حجم عينة التاريخ القديم (كنسبة من الصفوف الجديدة) لتقليل نسيان الأنماط القديمة
+REPLAY_RATIO = 1.0
+
+# أقل عدد من الصفوف الجديدة المحجوزة للتقييم؛ أقل من ذلك تبقى مقاييس ونطاق النسخة السابقة
+MIN_EVAL_ROWS = 30
+
+
+def _write_status(**status):
+    status["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    INCREMENTAL_STATUS_PATH.write_text(json.dumps(status, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def read_status() -> dict:
+    """آخر حالة للتحديث التدريجي (تعرضها الواجهة)."""
+    try:
+        return json.loads(INCREMENTAL_STATUS_PATH.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {"state": "idle"}
+
+
+def _is_running(status) -> bool:
+    """هل العملية المسجلة في الحالة ما زالت تعمل؟ (حتى لا تعلق الحالة بعد توقف مفاجئ)"""
+    if status.get("state") != "running" or "pid" not in status:
+        return False
+    try:
+        os.kill(status["pid"], 0)
+    except OSError:
+        return False
+    return True
+
+
+def trees_to_replace(n_new_rows, n_total_rows, n_estimators):
+    """عدد الأشجار الجديدة: بنسبة البيانات الجديدة من الكل، بين 10 ونصف الغابة."""
+    share = n_new_rows / max(n_total_rows, 1)
+    return int(min(max(math.ceil(n_estimators * share), 10), n_estimators // 2))
+
+
+def incremental_update(seed=None):
+    """
+    تدريب أشجار جديدة على الصفوف المضافة منذ آخر نسخة ونشر bundle جديد بشكل ذري.
+    تُرجع الـ bundle الجديد أو None إذا لم توجد بيانات جديدة كافية.
+    إذا تعدّلت صفوف سابقة (وليس إلحاقاً في النهاية فقط) يُعاد التدريب كاملاً.
+    """
+    bundle = joblib.load(current_model_path())
+    start_row = bundle.get("data_rows")
+    if start_row is None:
+        print("⚠️ الموديل الحالي لا يحتوي data_rows؛ شغّل train.py مرة واحدة أولاً.")
+        return None
+
+    total_rows = source_rows(DATA_PATH)
+    if total_rows > start_row and not is_append_of(DATA_PATH, bundle.get("data_hash"), start_row):
+        print("ℹ️ تعدّلت صفوف سابقة منذ آخر نسخة؛ إعادة تدريب كاملة بدل التحديث التدريجي.")
+        return train_price_model()
+
+    new_df = load_rows_since(DATA_PATH, start_row)
+    if len(new_df) < MIN_NEW_ROWS:
+        print(f"ℹ️ لا توجد بيانات جديدة كافية ({len(new_df)} صف).")
+        return None
+
+    pipe = bundle["pipeline"]
+    preprocessor = pipe.named_steps["preprocessor"]
+    forest = pipe.named_steps["regressor"]
+    version = bundle.get("version", 1) + 1
+    seed = version if seed is None else seed
+
+    # الاختبار من الصفوف الجديدة فقط: صفوف التاريخ (الـ replay) رأتها الأشجار القديمة الباقية،
+    # فتقييمها يضخّم R² ويضيّق نطاق السعر
+    new_train, test_df = train_test_split(new_df, test_size=0.2, random_state=seed)
+
+    # عينة صغيرة من التاريخ بحجم البيانات الجديدة (وليس التاريخ كاملاً) للتدريب فقط
+    n_replay = int(len(new_df) * REPLAY_RATIO)
+    history = load_store(DATA_PATH, columns=FEATURES_NUMERIC + FEATURES_CATEGORICAL + [TARGET_COLUMN])
+    history = history[history.index < start_row]
+    if n_replay and len(history):
+        history = history.sample(n=min(n_replay, len(history)), random_state=seed)
+        train_df = pd.concat([new_train, history])
+    else:
+        train_df = new_train
+
+    X_train = train_df[FEATURES_NUMERIC + FEATURES_CATEGORICAL]
+    y_train = np.log1p(train_df[TARGET_COLUMN])
+    X_test = test_df[FEATURES_NUMERIC + FEATURES_CATEGORICAL]
+    y_test = np.log1p(test_df[TARGET_COLUMN])
+
+    # المعالج (Scaler + OneHot) يبقى كما هو حتى تبقى الأشجار القديمة والجديدة على نفس المدخلات
+    n_new = trees_to_replace(len(new_df), total_rows, len(forest.estimators_))
+    new_forest = clone(forest).set_params(n_estimators=n_new, random_state=seed, warm_start=False)
+    print(f"🚀 تدريب {n_new} شجرة جديدة على {len(X_train)} عينة ({len(new_df)} صف جديد)...")
+    new_forest.fit(preprocessor.transform(X_train), y_train)
+
+    # استبدال أقدم الأشجار بالجديدة
+    forest.estimators_ = forest.estimators_[n_new:] + new_forest.estimators_
+    forest.n_estimators = len(forest.estimators_)
+
+    y_pred_log = pipe.predict(X_test)
+    evaluated = len(X_test) >= MIN_EVAL_ROWS
+    if evaluated:
+        bundle["metrics"] = {"r2": r2_score(y_test, y_pred_log),
+                             "mae": mean_absolute_error(np.expm1(y_test), np.expm1(y_pred_log))}
+    else:
+        print(f"ℹ️ صفوف التقييم الجديدة ({len(X_test)}) أقل من {MIN_EVAL_ROWS}؛ تبقى مقاييس ونطاق النسخة السابقة.")
+
+    bundle.update({
+        "data_rows": total_rows,
+        "data_hash": source_version(DATA_PATH),
+        "version": version,
+        "trained_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "update_mode": "incremental",
+    })
+    bundle.pop("category_lookup", None)
+    export_compiled(bundle)
+    if evaluated:
+        bundle["interval"] = calibrate_interval(bundle, X_test, y_test)
+    # صفوف الاختبار (جديدة كلها) تُدمج في مرجع الانحراف؛ صفوف الـ replay موجودة فيه أصلاً
+    bundle["drift_reference"] = merge_reference(bundle.get("drift_reference"), X_test, y_pred_log)
+    bundle["feature_defaults"] = reference_defaults(bundle["drift_reference"])
+    save_bundle(bundle)
+    prediction_cache.invalidate()
+
+    print(f"✅ نسخة {version}: R² {bundle['metrics']['r2']:.4f} | MAE {bundle['metrics']['mae']:,.2f} دولار")
+    return bundle
+
+
+def _worker():
+    _write_status(state="running", pid=os.getpid())
+    try:
+        bundle = incremental_update()
+        if bundle is None:
+            _write_status(state="skipped", message="no new listings")
+        else:
+            _write_status(state="done", version=bundle["version"],
+                          r2=bundle["metrics"]["r2"], mae=bundle["metrics"]["mae"])
+    except Exception as e:
+        _write_status(state="failed", message=str(e))
+        raise
+
+
+def start_incremental_update():
+    """تشغيل التحديث في عملية منفصلة حتى لا تتجمد واجهة Streamlit."""
+    if _is_running(read_status()):
+        return None
+    process = subprocess.Popen([sys.executable, "-m", "src.incremental"], cwd=BASE_DIR)
+    _write_status(state="running", pid=process.pid)
+    return process
+
+
+if __name__ == "__main__":
+    _worker()
\ No newline at end of file
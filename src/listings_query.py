@@ -0,0 +1,146 @@
+"""
+خدمة استعلام السيارات لتبويب الاستكشاف: تصفية وترتيب وترقيم صفحات بدون نسخ أو فلترة الجدول
+كاملاً في كل تفاعل.
+
+- كل عمود تصفية نصي يُخزن كرموز (قيم مرتبة أبجدياً)، والسعر كرقم شريحة من PRICE_BUCKETS.
+- مكعب عدّادات (ماركة × وقود × جسم × ناقل حركة × شريحة سعر) يُبنى مرة واحدة: عدد النتائج وعدّادات
+  كل خيار (facets) لأي تركيبة فلاتر تُحسب من المكعب بحجم عدد الخلايا وليس عدد السيارات.
+- مواقع الصفوف مجمعة حسب خلية المكعب ومرتبة داخل كل خلية (مرة لكل طريقة فرز من SORT_KEYS):
+  الصفحة = أول (offset + حجم الصفحة) صفاً من كل خلية مطابقة فقط، ثم ترتيب هذه المرشحات.
+  الكلفة بعدد الخلايا المطابقة × عمق الصفحة وليس بعدد السيارات.
+"""
+import numpy as np
+import pandas as pd
+
+from src.chatbot_index import SORT_KEYS
+
+# أعمدة التصفية النصية (لكل منها عدّادات خيارات)
+FACET_COLUMNS = ["Brand", "Fuel_Type", "Body_Type", "Transmission"]
+
+# حدود شرائح السعر (تصفية السعر في الاستكشاف تكون على هذه الحدود)
+PRICE_BUCKETS = [0, 10_000, 20_000, 30_000, 40_000, 50_000, 75_000, 100_000, 150_000, np.inf]
+
+
+def price_bucket_labels():
+    def fmt(v):
+        return "∞" if np.isinf(v) else f"${v / 1000:,.0f}k"
+    return [f"{fmt(lo)} - {fmt(hi)}" for lo, hi in zip(PRICE_BUCKETS[:-1], PRICE_BUCKETS[1:])]
+
+
+class ListingsQuery:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.n = len(df)
+        self.options = {}
+        self.codes = {}
+        for column in FACET_COLUMNS:
+            codes, uniques = pd.factorize(df[column].astype(str), sort=True)
+            self.codes[column] = codes.astype(np.int16)
+            self.options[column] = list(uniques)
+
+        price = df["Price_USD"].to_numpy(dtype=np.float64)
+        n_buckets = len(PRICE_BUCKETS) - 1
+        self.codes["Price_Bucket"] = np.clip(np.searchsorted(PRICE_BUCKETS, price, side="right") - 1,
+                                             0, n_buckets - 1).astype(np.int16)
+        self.options["Price_Bucket"] = price_bucket_labels()
+
+        self.dims = FACET_COLUMNS + ["Price_Bucket"]
+        shape = tuple(len(self.options[d]) for d in self.dims)
+        cells = np.ravel_multi_index([self.codes[d] for d in self.dims], shape) if self.n else np.array([], dtype=np.int64)
+        self.cells = cells
+        self.cube = np.bincount(cells, minlength=int(np.prod(shape))).reshape(shape)
+        self.cell_start = np.concatenate([[0], np.cumsum(self.cube.ravel())[:-1]])
+        self._values = {}
+        self._orders = {}
+        self._grouped = {}
+
+    def _allowed(self, filters):
+        """
+        لكل بُعد: مصفوفة منطقية بالخيارات المسموحة. None (أو غياب البعد) = بدون تصفية،
+        والقائمة الفارغة = لا شيء مسموح.
+        """
+        allowed = {}
+        for dim in self.dims:
+            wanted = filters.get(dim)
+            mask = np.ones(len(self.options[dim]), dtype=bool)
+            if wanted is not None:
+                if dim == "Price_Bucket":
+                    mask[:] = False
+                    mask[list(wanted)] = True
+                else:
+                    mask = np.isin(self.options[dim], list(wanted))
+            allowed[dim] = mask
+        return allowed
+
+    def _cube_sum(self, allowed, keep=None):
+        """مجموع خلايا المكعب المسموحة (مع إبقاء البعد keep لعدّادات خياراته)."""
+        sub = self.cube
+        for axis, dim in enumerate(self.dims):
+            if dim != keep:
+                sub = np.compress(allowed[dim], sub, axis=axis)
+        axes = tuple(i for i, dim in enumerate(self.dims) if dim != keep)
+        return sub.sum(axis=axes)
+
+    def count(self, filters) -> int:
+        return int(self._cube_sum(self._allowed(filters)))
+
+    def facets(self, filters) -> dict:
+        """عدد السيارات لكل خيار في كل بُعد، مع تطبيق فلاتر الأبعاد الأخرى فقط."""
+        allowed = self._allowed(filters)
+        result = {}
+        for dim in self.dims:
+            others = {**allowed, dim: np.ones(len(self.options[dim]), dtype=bool)}
+            result[dim] = pd.Series(self._cube_sum(others, keep=dim), index=self.options[dim])
+        return result
+
+    def _sort_values(self, sort_by):
+        if sort_by not in self._values:
+            column, ascending = SORT_KEYS[sort_by]
+            values = self.df[column].to_numpy(dtype=np.float64)
+            self._values[sort_by] = values if ascending else -values
+        return self._values[sort_by]
+
+    def _order(self, sort_by):
+        """ترتيب كل السوق (بدون فلاتر)."""
+        if sort_by not in self._orders:
+            self._orders[sort_by] = np.argsort(self._sort_values(sort_by), kind="stable")
+        return self._orders[sort_by]
+
+    def _grouped_order(self, sort_by):
+        """المواقع مجمعة حسب خلية المكعب، ومرتبة داخل كل خلية (بترتيب المصدر إذا لم يُطلب فرز)."""
+        if sort_by not in self._grouped:
+            if sort_by is None:
+                self._grouped[sort_by] = np.argsort(self.cells, kind="stable")
+            else:
+                self._grouped[sort_by] = np.lexsort((self._sort_values(sort_by), self.cells))
+        return self._grouped[sort_by]
+
+    def page(self, filters, page=0, page_size=50, sort_by=None) -> pd.DataFrame:
+        """صفوف الصفحة المطلوبة فقط (page تبدأ من صفر)."""
+        offset = page * page_size
+        need = offset + page_size
+        allowed = self._allowed(filters)
+
+        if all(allowed[dim].all() for dim in self.dims):
+            positions = self._order(sort_by)[offset:need] if sort_by \
+                else np.arange(offset, min(need, self.n))
+            return self.df.iloc[positions]
+
+        # الخلايا المطابقة: حاصل ضرب الخيارات المسموحة في كل بُعد (وغير الفارغة)
+        mask = allowed[self.dims[0]]
+        for dim in self.dims[1:]:
+            mask = np.multiply.outer(mask, allowed[dim])
+        counts = self.cube.ravel()
+        cells = np.flatnonzero(mask.ravel() & (counts > 0))
+
+        # أول need صفاً من كل خلية (أي صف بعدها لا يمكن أن يدخل الصفحة)
+        lengths = np.minimum(counts[cells], need)
+        starts = self.cell_start[cells]
+        gather = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        candidates = self._grouped_order(sort_by)[gather]
+
+        if sort_by is None:
+            candidates = np.sort(candidates)
+        else:
+            candidates = candidates[np.lexsort((candidates, self._sort_values(sort_by)[candidates]))]
+        return self.df.iloc[candidates[offset:need]]
\ No newline at end of file
@@ -1,63 +1,303 @@
+import atexit
 import json
+import queue
 import sqlite3
+import threading
+import time
 import pandas as pd
 from datetime import datetime
-from src.config import LOG_DB_PATH, LOG_DIR
+from src.config import LOG_DB_PATH, LOG_DIR, LOG_QUEUE_SIZE, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL_S
+from src.metrics import metrics
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT,
+    model_type TEXT,
+    use_log_target INTEGER,
+    features_json TEXT,
+    predicted_price REAL,
+    listed_price REAL,
+    diff_amount REAL, -- ميزة إضافية: الفرق بين السعرين
+    deal_label TEXT
+)
+"""
+
+# فهارس لاستعلامات صفحة السجلات (ترقيم بالـ id + فلاتر الوقت والتقييم ونوع الموديل)
+CREATE_INDEXES_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_{table}_created_at ON {table}(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_label_id ON {table}(deal_label, id)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_model_id ON {table}(model_type, id)",
+]
+
+def ensure_schema(con, table):
+    """إنشاء الجدول وفهارسه إن لم تكن موجودة."""
+    con.execute(CREATE_TABLE_SQL.format(table=table))
+    for sql in CREATE_INDEXES_SQL:
+        con.execute(sql.format(table=table))
+    con.commit()
+
+INSERT_SQL = """
+INSERT INTO {table}(created_at, model_type, use_log_target, features_json,
+                    predicted_price, listed_price, diff_amount, deal_label)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class PredictionLogWriter:
+    """
+    كاتب سجلات في الخلفية: الطلبات تضيف السجل لطابور في الذاكرة فقط، وthread واحد
+    يكتبها دفعات عبر executemany على اتصال دائم بوضع WAL.
+    """
+
+    def __init__(self, db_path, table="predictions", max_queue_size=LOG_QUEUE_SIZE,
+                 batch_size=LOG_BATCH_SIZE, flush_interval_s=LOG_FLUSH_INTERVAL_S):
+        self.db_path = db_path
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        # مؤشرات المراقبة
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_lag_ms = 0.0
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name=f"log-writer-{self.table}", daemon=True)
+                    self._thread.start()
+
+    def _connect(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(self.db_path)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        ensure_schema(con, self.table)
+        return con
+
+    def submit(self, record) -> bool:
+        """إضافة سجل بدون انتظار؛ إذا امتلأ الطابور يُحذف السجل ويُحسب في dropped."""
+        if self._closed:
+            self.dropped += 1
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.monotonic(), record))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, con, batch):
+        records = [rec for _, rec in batch if rec is not None]
+        if records:
+            try:
+                with metrics.timer("log_write"):
+                    con.executemany(INSERT_SQL.format(table=self.table), records)
+                    con.commit()
+                self.written += len(records)
+                self.batches += 1
+                self.last_lag_ms = (time.monotonic() - batch[0][0]) * 1000.0
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"⚠️ فشل كتابة السجلات: {e}")
+        for _, rec in batch:
+            self._queue.task_done()
+
+    def _run(self):
+        con = self._connect()
+        try:
+            while True:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval_s)
+                except queue.Empty:
+                    continue
+                batch = self._drain(first)
+                self._write(con, batch)
+                # السجل الفارغ (None) إشارة إيقاف
+                if any(rec is None for _, rec in batch):
+                    break
+        finally:
+            con.close()
+
+    def flush(self, timeout=5.0):
+        """انتظار كتابة كل ما في الطابور (يُستخدم قبل القراءة وعند الإيقاف)."""
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def close(self, timeout=5.0):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            # انتظار محدود لمكان في الطابور الممتلئ؛ إذا لم يفرغ نتركه (thread من نوع daemon)
+            try:
+                self._queue.put((time.monotonic(), None), timeout=timeout)
+            except queue.Full:
+                print(f"⚠️ طابور السجلات ممتلئ عند الإغلاق؛ {self._queue.qsize()} سجل قد لا يُكتب")
+                return
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+            "last_lag_ms": round(self.last_lag_ms, 3),
+        }
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer(db_path=LOG_DB_PATH, table="predictions") -> PredictionLogWriter:
+    """كاتب واحد مشترك لكل (ملف، جدول) داخل العملية (وكاتب جديد بعد إغلاق السابق، مثلاً عند إعادة تشغيل lifespan)."""
+    key = (str(db_path), table)
+    with _writers_lock:
+        if key not in _writers or _writers[key]._closed:
+            _writers[key] = PredictionLogWriter(db_path, table)
+        return _writers[key]
+
+@atexit.register
+def close_writers():
+    """كتابة ما تبقى في الطوابير عند إغلاق العملية."""
+    for writer in list(_writers.values()):
+        writer.close()
+
+def build_record(model_type, use_log_target, features, predicted_price, listed_price, deal_label):
+    """تجهيز صف السجل مع حساب الفرق السعري تلقائياً."""
+    return (
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"), # تنسيق وقت أسهل للقراءة
+        model_type,
+        1 if use_log_target else 0,
+        json.dumps(features, ensure_ascii=False),
+        float(predicted_price),
+        float(listed_price),
+        float(predicted_price - listed_price),
+        str(deal_label)
+    )
 
 def _connect():
     """تأكيد وجود المجلد وفتح الاتصال بقاعدة البيانات."""
     LOG_DIR.mkdir(parents=True, exist_ok=True)
     return sqlite3.connect(LOG_DB_PATH)
 
+_schema_ready = False
+
 def init_db():
-    """إنشاء الجدول بتصميم يدعم التحليل المتقدم."""
+    """إنشاء الجدول والفهارس مرة واحدة لكل عملية."""
+    global _schema_ready
+    if _schema_ready:
+        return
     with _connect() as con:
-        cur = con.cursor()
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS predictions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            created_at TEXT,
-            model_type TEXT,
-            use_log_target INTEGER,
-            features_json TEXT,
-            predicted_price REAL,
-            listed_price REAL,
-            diff_amount REAL, -- ميزة إضافية: الفرق بين السعرين
-            deal_label TEXT
-        )
-        """)
-        con.commit()
+        ensure_schema(con, "predictions")
+    _schema_ready = True
 
 def log_prediction(model_type: str, use_log_target: bool, features: dict,
                    predicted_price: float, listed_price: float, deal_label: str):
-    """تسجيل العملية مع حساب الفرق السعري تلقائياً."""
-    init_db()
-    
-    # حساب الفرق لسهولة التحليل لاحقاً
-    diff_amount = float(predicted_price - listed_price)
-    
-    with _connect() as con:
-        cur = con.cursor()
-        cur.execute("""
-        INSERT INTO predictions(created_at, model_type, use_log_target, features_json,
-                                predicted_price, listed_price, diff_amount, deal_label)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"), # تنسيق وقت أسهل للقراءة
-            model_type,
-            1 if use_log_target else 0,
-            json.dumps(features, ensure_ascii=False),
-            float(predicted_price),
-            float(listed_price),
-            diff_amount,
-            str(deal_label)
-        ))
-        con.commit()
+    """تسجيل العملية بدون انتظار الكتابة على القرص (يتم في الخلفية)."""
+    return get_writer().submit(
+        build_record(model_type, use_log_target, features, predicted_price, listed_price, deal_label))
 
 def read_logs() -> pd.DataFrame:
     """قراءة السجلات وإرجاعها كـ DataFrame لتسهيل عرضها في analytics."""
+    get_writer().flush()
     init_db()
     with _connect() as con:
         # استخدام Pandas للقراءة مباشرة يجعل التعامل مع البيانات أسهل بكثير
         df = pd.read_sql_query("SELECT * FROM predictions ORDER BY id DESC", con)
-    return df
\ No newline at end of file
+    return df
+
+def _filters(since=None, until=None, deal_label=None, model_type=None):
+    """بناء شروط WHERE المشتركة بين الاستعلامات."""
+    clauses, params = [], []
+    if since:
+        clauses.append("created_at >= ?")
+        params.append(str(since))
+    if until:
+        clauses.append("created_at < ?")
+        params.append(str(until))
+    if deal_label:
+        clauses.append("deal_label = ?")
+        params.append(deal_label)
+    if model_type:
+        clauses.append("model_type = ?")
+        params.append(model_type)
+    return clauses, params
+
+def _query(sql, params):
+    get_writer().flush(timeout=1.0)
+    init_db()
+    with _connect() as con:
+        return pd.read_sql_query(sql, con, params=params)
+
+def query_logs(limit=50, before_id=None, since=None, until=None, deal_label=None, model_type=None):
+    """
+    صفحة واحدة من السجلات (الأحدث أولاً) بترقيم keyset على الـ id.
+    تُرجع (DataFrame، before_id للصفحة التالية أو None إذا انتهت السجلات).
+    """
+    clauses, params = _filters(since, until, deal_label, model_type)
+    if before_id is not None:
+        clauses.append("id < ?")
+        params.append(int(before_id))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    df = _query(f"SELECT * FROM predictions {where} ORDER BY id DESC LIMIT ?", params + [int(limit) + 1])
+
+    next_before_id = None
+    if len(df) > limit:
+        df = df.iloc[:limit]
+        next_before_id = int(df["id"].iloc[-1])
+    return df, next_before_id
+
+def feature_logs(limit=50000, since=None, model_type=None) -> pd.DataFrame:
+    """الميزات (features_json) والسعر المتوقع لأحدث السجلات، لإعادة بناء إحصاءات مراقبة الانحراف."""
+    clauses, params = _filters(since, None, None, model_type)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return _query(f"SELECT features_json, predicted_price FROM predictions {where} ORDER BY id DESC LIMIT ?",
+                  params + [int(limit)])
+
+def label_counts(since=None, until=None, model_type=None) -> pd.DataFrame:
+    """عدد العمليات لكل تقييم صفقة (محسوب داخل SQLite)."""
+    clauses, params = _filters(since, until, None, model_type)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return _query(f"""
+        SELECT deal_label, COUNT(*) AS count
+        FROM predictions {where}
+        GROUP BY deal_label ORDER BY count DESC
+    """, params)
+
+def daily_diff(since=None, until=None, deal_label=None, model_type=None) -> pd.DataFrame:
+    """متوسط فرق السعر (diff_amount) وعدد العمليات لكل يوم."""
+    clauses, params = _filters(since, until, deal_label, model_type)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return _query(f"""
+        SELECT substr(created_at, 1, 10) AS day, COUNT(*) AS count, AVG(diff_amount) AS mean_diff_amount
+        FROM predictions {where}
+        GROUP BY day ORDER BY day
+    """, params)
\ No newline at end of file
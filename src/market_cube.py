@@ -0,0 +1,259 @@
+"""
+مكعب تجميعات السوق (Brand × Body_Type × فئة العمر × الوقود) تُبنى منه مؤشرات الـ Dashboard
+بدل إعادة حسابها من كل الصفوف في كل تحديث للصفحة.
+لكل خلية: العدد، المجموع، مجموع المربعات، أقل/أعلى سعر، و histogram لوغاريتمي للأسعار
+(خطأ نسبي ~1% في الوسيط والنِسب المئوية). كل هذه القيم قابلة للدمج، لذلك إضافة سيارات
+جديدة تعني تجميعها فقط ودمجها مع المكعب الموجود.
+"""
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.analytics import AGE_BINS, AGE_LABELS
+from src.feature_store import store_paths, source_version, source_rows, load_store, load_rows_since, is_append_of
+
+# أبعاد المكعب
+CUBE_DIMENSIONS = ["Brand", "Body_Type", "Age_Bracket", "Fuel_Type"]
+
+# فئة الأعمار خارج حدود AGE_BINS
+OTHER_AGE_LABEL = "Other"
+
+# histogram لوغاريتمي: كل خانة أعرض من السابقة بنسبة 2% (أي خطأ نسبي ~1% عند أخذ منتصفها)
+HIST_GAMMA = 1.02
+HIST_MIN_PRICE = 100.0
+HIST_BINS = int(np.ceil(np.log(1e8 / HIST_MIN_PRICE) / np.log(HIST_GAMMA))) + 1
+
+# عدد النقاط المعروضة في رسم القوة/السعر لكل نوع جسم
+SCATTER_POINTS_PER_BODY = 400
+
+CUBE_VERSION = 1
+
+
+def cube_path(csv_path):
+    parquet_path, _ = store_paths(csv_path)
+    return parquet_path.with_suffix(".cube.joblib")
+
+
+def age_bracket(car_age) -> pd.Series:
+    """فئة العمر لكل سيارة؛ الأعمار خارج الحدود تذهب لفئة Other حتى تبقى في المؤشرات العامة."""
+    brackets = pd.cut(car_age, bins=AGE_BINS, labels=AGE_LABELS)
+    return brackets.cat.add_categories([OTHER_AGE_LABEL]).fillna(OTHER_AGE_LABEL).astype(str)
+
+
+def price_bins(prices) -> np.ndarray:
+    """رقم خانة الـ histogram لكل سعر."""
+    ratio = np.maximum(np.asarray(prices, dtype=np.float64), HIST_MIN_PRICE) / HIST_MIN_PRICE
+    return np.minimum(np.floor(np.log(ratio) / np.log(HIST_GAMMA)).astype(np.int64), HIST_BINS - 1)
+
+
+def bin_price(bins) -> np.ndarray:
+    """السعر الممثل لكل خانة (المنتصف الهندسي)."""
+    return HIST_MIN_PRICE * HIST_GAMMA ** (np.asarray(bins) + 0.5)
+
+
+def _row_priority(positions) -> np.ndarray:
+    """أولوية ثابتة لكل صف (hash لموقعه) لاختيار عينة bottom-k قابلة للدمج."""
+    x = np.asarray(positions, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    x ^= x >> np.uint64(31)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    return x ^ (x >> np.uint64(29))
+
+
+class MarketCube:
+    def __init__(self, keys, count, total, total_sq, price_min, price_max, hist, scatter,
+                 data_rows=0, source=None):
+        self.keys = keys.reset_index(drop=True)
+        self.count = count
+        self.total = total
+        self.total_sq = total_sq
+        self.price_min = price_min
+        self.price_max = price_max
+        self.hist = hist
+        self.scatter = scatter
+        self.data_rows = data_rows
+        self.source = source
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, **meta):
+        """تجميع DataFrame (بعد load_data) إلى خلايا المكعب."""
+        frame = pd.DataFrame({
+            "Brand": df["Brand"].astype(str).to_numpy(),
+            "Body_Type": df["Body_Type"].astype(str).to_numpy(),
+            "Age_Bracket": age_bracket(df["Car_Age"]).to_numpy(),
+            "Fuel_Type": df["Fuel_Type"].astype(str).to_numpy(),
+        })
+        price = df["Price_USD"].to_numpy(dtype=np.float64)
+        codes, keys = pd.MultiIndex.from_frame(frame).factorize()
+        n_cells = len(keys)
+
+        hist = np.zeros((n_cells, HIST_BINS), dtype=np.int64)
+        np.add.at(hist, (codes, price_bins(price)), 1)
+        price_min = np.full(n_cells, np.inf)
+        price_max = np.full(n_cells, -np.inf)
+        np.minimum.at(price_min, codes, price)
+        np.maximum.at(price_max, codes, price)
+
+        scatter = df[["Horsepower", "Price_USD", "Body_Type", "Year"]].copy()
+        scatter["Body_Type"] = scatter["Body_Type"].astype(str)
+        scatter["_priority"] = _row_priority(df.index.to_numpy())
+        return cls(
+            keys=keys.to_frame(index=False).set_axis(CUBE_DIMENSIONS, axis=1),
+            count=np.bincount(codes, minlength=n_cells).astype(np.int64),
+            total=np.bincount(codes, weights=price, minlength=n_cells),
+            total_sq=np.bincount(codes, weights=price * price, minlength=n_cells),
+            price_min=price_min,
+            price_max=price_max,
+            hist=hist,
+            scatter=_bottom_k(scatter),
+            **meta,
+        )
+
+    def merge(self, other: "MarketCube") -> "MarketCube":
+        """دمج مكعبين (الخلايا المشتركة تُجمع، والجديدة تُضاف)."""
+        keys = pd.concat([self.keys, other.keys], ignore_index=True)
+        codes, merged_keys = pd.MultiIndex.from_frame(keys).factorize()
+        n_cells = len(merged_keys)
+
+        def combine(a, b, ufunc, fill):
+            out = np.full((n_cells,) + a.shape[1:], fill, dtype=a.dtype)
+            ufunc.at(out, codes, np.concatenate([a, b]))
+            return out
+
+        return MarketCube(
+            keys=merged_keys.to_frame(index=False).set_axis(CUBE_DIMENSIONS, axis=1),
+            count=combine(self.count, other.count, np.add, 0),
+            total=combine(self.total, other.total, np.add, 0.0),
+            total_sq=combine(self.total_sq, other.total_sq, np.add, 0.0),
+            price_min=combine(self.price_min, other.price_min, np.minimum, np.inf),
+            price_max=combine(self.price_max, other.price_max, np.maximum, -np.inf),
+            hist=combine(self.hist, other.hist, np.add, 0),
+            scatter=_bottom_k(pd.concat([self.scatter, other.scatter])),
+            data_rows=max(self.data_rows, other.data_rows),
+            source=other.source or self.source,
+        )
+
+    # --- الاستعلامات (نفس أشكال نتائج src.analytics) ---
+
+    def _mask(self, **filters):
+        mask = np.ones(len(self.keys), dtype=bool)
+        for column, value in filters.items():
+            if value is not None:
+                mask &= (self.keys[column] == value).to_numpy()
+        return mask
+
+    def quantile(self, q, **filters) -> float:
+        """النسبة المئوية للسعر من الـ histogram (مع قص النتيجة بين أقل وأعلى سعر حقيقي)."""
+        mask = self._mask(**filters)
+        hist = self.hist[mask].sum(axis=0)
+        n = hist.sum()
+        if n == 0:
+            return float("nan")
+        rank = q * (n - 1)
+        b = int(np.searchsorted(np.cumsum(hist), rank, side="right"))
+        return float(np.clip(bin_price(b), self.price_min[mask].min(), self.price_max[mask].max()))
+
+    def kpis(self, **filters) -> dict:
+        mask = self._mask(**filters)
+        n = int(self.count[mask].sum())
+        total = float(self.total[mask].sum())
+        total_sq = float(self.total_sq[mask].sum())
+        mean = total / n if n else float("nan")
+        var = (total_sq - n * mean * mean) / (n - 1) if n > 1 else float("nan")
+        return {
+            "count": n,
+            "mean_price": mean,
+            "median_price": self.quantile(0.5, **filters),
+            "min_price": float(self.price_min[mask].min()) if n else float("nan"),
+            "max_price": float(self.price_max[mask].max()) if n else float("nan"),
+            "std_dev_price": float(np.sqrt(max(var, 0.0))) if n > 1 else float("nan"),
+        }
+
+    def _group(self, column) -> pd.DataFrame:
+        grouped = pd.DataFrame({
+            column: self.keys[column],
+            "count": self.count,
+            "total": self.total,
+        }).groupby(column, sort=False)[["count", "total"]].sum()
+        grouped["mean"] = grouped["total"] / grouped["count"]
+        return grouped
+
+    def price_by_brand(self, top_n: int = 10) -> pd.DataFrame:
+        return (
+            self._group("Brand")[["mean", "count"]]
+            .sort_values(by="mean", ascending=False)
+            .head(top_n)
+            .reset_index()
+            .rename(columns={"mean": "Avg_Price_USD", "count": "Car_Count"})
+        )
+
+    def price_by_body(self) -> pd.DataFrame:
+        return (
+            self._group("Body_Type")["mean"]
+            .sort_values(ascending=False)
+            .reset_index()
+            .rename(columns={"mean": "Avg_Price_USD"})
+        )
+
+    def price_by_age_bracket(self) -> pd.DataFrame:
+        grouped = self._group("Age_Bracket").reindex(AGE_LABELS)
+        return (
+            grouped["mean"]
+            .rename_axis("Age_Bracket")
+            .reset_index()
+            .rename(columns={"mean": "Avg_Price_USD"})
+        )
+
+    def scatter_sample(self) -> pd.DataFrame:
+        """عينة ثابتة لرسم القوة/السعر (بحد أقصى SCATTER_POINTS_PER_BODY لكل نوع جسم)."""
+        return self.scatter.drop(columns="_priority")
+
+    def to_dict(self) -> dict:
+        return {"version": CUBE_VERSION, **self.__dict__}
+
+
+def _bottom_k(scatter: pd.DataFrame, k=SCATTER_POINTS_PER_BODY) -> pd.DataFrame:
+    """أصغر k أولوية لكل نوع جسم: نفس النتيجة سواء بُنيت العينة مرة واحدة أو على دفعات."""
+    return (
+        scatter.sort_values("_priority", kind="stable")
+        .groupby("Body_Type", sort=False)
+        .head(k)
+    )
+
+
+def _load_cube(path):
+    try:
+        state = joblib.load(path)
+    except (FileNotFoundError, EOFError, ValueError):
+        return None
+    if state.pop("version", None) != CUBE_VERSION:
+        return None
+    return MarketCube(**state)
+
+
+def _save_cube(cube, path):
+    tmp_path = path.with_suffix(".tmp")
+    joblib.dump(cube.to_dict(), tmp_path)
+    tmp_path.replace(path)
+
+
+def get_market_cube(csv_path) -> MarketCube:
+    """
+    المكعب الحالي لملف البيانات:
+    - نفس نسخة البيانات: يُحمّل من القرص.
+    - أُضيفت صفوف في نهاية الـ CSV (ولم تتغير الصفوف السابقة): تُجمع الصفوف الجديدة فقط وتُدمج.
+    - غير ذلك: يُعاد البناء من المخزن.
+    """
+    path = cube_path(csv_path)
+    version = source_version(csv_path)
+    rows = source_rows(csv_path)
+    cube = _load_cube(path)
+    if cube is not None and cube.source == version:
+        return cube
+
+    if cube is not None and 0 < cube.data_rows < rows and is_append_of(csv_path, cube.source, cube.data_rows):
+        new_rows = load_rows_since(csv_path, cube.data_rows)
+        cube = cube.merge(MarketCube.from_frame(new_rows, data_rows=rows, source=version))
+    else:
+        cube = MarketCube.from_frame(load_store(csv_path), data_rows=rows, source=version)
+    _save_cube(cube, path)
+    return cube
\ No newline at end of file
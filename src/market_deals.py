@@ -0,0 +1,104 @@
+"""
+تقييم كل سيارات السوق مسبقاً (السعر المتوقع + التقييم لكل صف) لعرض "أفضل الصفقات" فوراً.
+
+النتيجة تُحفظ بجانب مخزن الأعمدة (Parquet) مرتبة حسب نسبة الخصم، ومعها بصمة نسخة البيانات
+وبصمة ملف الموديل:
+- نفس البيانات ونفس الموديل: تُقرأ من القرص كما هي.
+- أُضيفت سيارات في نهاية الـ CSV (ونفس الموديل): تُقيَّم الصفوف الجديدة فقط وتُدمج.
+- تغيّر الموديل أو تعدّلت صفوف قديمة: يُعاد تقييم السوق كاملاً (توقع جماعي واحد).
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.deal import GREAT_DEAL, evaluate_deals
+from src.feature_store import store_paths, source_version, source_rows, load_store, load_rows_since, is_append_of
+from src.features import TARGET_COLUMN
+from src.predict import predict_frame_intervals
+
+# أعمدة السيارة المحفوظة مع التقييم (حتى لا يحتاج العرض لدمج مع بيانات السوق)
+LISTING_COLUMNS = ["Brand", "Body_Type", "Year", "Fuel_Type", "Transmission", "Horsepower", TARGET_COLUMN]
+
+DEALS_VERSION = 2
+
+
+def deals_paths(csv_path):
+    parquet_path, _ = store_paths(csv_path)
+    return parquet_path.with_suffix(".deals.parquet"), parquet_path.with_suffix(".deals.json")
+
+
+def score_market(bundle, frame) -> pd.DataFrame:
+    """سعر متوقع وتقييم لكل صف (index = رقم الصف في المصدر)، مرتبة من الأكبر خصماً."""
+    preds, lower, upper = predict_frame_intervals(bundle, frame)
+    listed = frame[TARGET_COLUMN].to_numpy(dtype=np.float64)
+    deals = evaluate_deals(listed, preds, bundle["metrics"]["mae"], bundle["metrics"]["r2"],
+                           lower=lower, upper=upper)
+
+    scored = frame[[c for c in LISTING_COLUMNS if c in frame.columns]].copy()
+    for column in ("Brand", "Body_Type", "Fuel_Type", "Transmission"):
+        if column in scored.columns:
+            scored[column] = scored[column].astype(str)
+    scored["Predicted_Price_USD"] = preds
+    scored["Fair_Lower_USD"] = deals.lower
+    scored["Fair_Upper_USD"] = deals.upper
+    scored["Deal_Code"] = deals.codes
+    scored["Confidence"] = deals.confidence
+    scored["Discount_USD"] = preds - listed
+    scored["Discount_Pct"] = (preds - listed) / preds * 100.0
+    scored = scored[np.isfinite(preds)]
+    return _sorted(scored)
+
+
+def _sorted(scored):
+    return scored.sort_values("Discount_Pct", ascending=False, kind="stable")
+
+
+def _read_meta(meta_path):
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    return meta if meta.get("version") == DEALS_VERSION else None
+
+
+def _save(scored, meta, csv_path):
+    parquet_path, meta_path = deals_paths(csv_path)
+    tmp_path = parquet_path.with_name(f"{parquet_path.name}.{os.getpid()}.tmp")
+    scored.to_parquet(tmp_path)
+    os.replace(tmp_path, parquet_path)
+    meta_path.write_text(json.dumps(dict(meta, version=DEALS_VERSION), indent=2), encoding="utf-8")
+
+
+def get_market_deals(csv_path, bundle, model_token) -> pd.DataFrame:
+    """تقييم كل السوق للموديل الحالي (من القرص، أو بتقييم الصفوف الجديدة فقط، أو كاملاً)."""
+    parquet_path, meta_path = deals_paths(csv_path)
+    version = source_version(csv_path)
+    rows = source_rows(csv_path)
+    meta = _read_meta(meta_path)
+
+    if meta is not None and meta["model_token"] == model_token and parquet_path.exists():
+        if meta["source"] == version:
+            return pd.read_parquet(parquet_path)
+        if 0 < meta["data_rows"] < rows and is_append_of(csv_path, meta["source"], meta["data_rows"]):
+            new_rows = score_market(bundle, load_rows_since(csv_path, meta["data_rows"]))
+            scored = _sorted(pd.concat([pd.read_parquet(parquet_path), new_rows]))
+            _save(scored, {"source": version, "data_rows": rows, "model_token": model_token}, csv_path)
+            return scored
+
+    scored = score_market(bundle, load_store(csv_path))
+    _save(scored, {"source": version, "data_rows": rows, "model_token": model_token}, csv_path)
+    return scored
+
+
+def great_deals(scored, brands=None, body_types=None, min_discount_pct=0.0, limit=50) -> pd.DataFrame:
+    """أفضل الصفقات بعد التصفية؛ الترتيب محسوب مسبقاً فيكفي قناع وقص."""
+    mask = scored["Deal_Code"].to_numpy() == GREAT_DEAL
+    if min_discount_pct:
+        mask &= scored["Discount_Pct"].to_numpy() >= min_discount_pct
+    if brands:
+        mask &= scored["Brand"].isin(brands).to_numpy()
+    if body_types:
+        mask &= scored["Body_Type"].isin(body_types).to_numpy()
+    return scored[mask].head(limit)
\ No newline at end of file
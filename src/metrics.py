@@ -0,0 +1,139 @@
+"""
+قياس زمن كل مرحلة في مسار التوقع (histograms) وعرضها بصيغة Prometheus على /metrics.
+خفيف بما يكفي ليبقى مفعلاً دائماً: كل قياس هو perf_counter مرتين وعدّاد داخل lock.
+المقاييس الأخرى (الذاكرة المؤقتة، طابور السجلات، المُجمِّع) تُقرأ عند الطلب من دوال مسجلة.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from src.config import METRICS_ENABLED
+
+# حدود الـ buckets بالثواني (من 50 ميكروثانية حتى 10 ثوانٍ)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # الأخيرة = +Inf
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += value
+            self.count += 1
+
+    def quantile(self, q):
+        """تقدير تقريبي من الـ buckets (الحد الأعلى للـ bucket الذي يقع فيه الترتيب)."""
+        if self.count == 0:
+            return float("nan")
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.stages = {}
+        self.requests = {}
+        self.gauges = {}
+        self.collectors = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, family, key):
+        hist = family.get(key)
+        if hist is None:
+            with self._lock:
+                hist = family.setdefault(key, Histogram())
+        return hist
+
+    def observe(self, stage, seconds):
+        if self.enabled:
+            self._histogram(self.stages, stage).observe(seconds)
+
+    def observe_request(self, method, path, status, seconds):
+        if self.enabled:
+            self._histogram(self.requests, (method, path, str(status))).observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def set_gauge(self, name, value, help_text=""):
+        self.gauges[name] = (float(value), help_text)
+
+    def register_collector(self, prefix, fn):
+        """دالة تُرجع قاموس أرقام (مثل stats()) تُعرض كـ gauges باسم prefix_key."""
+        self.collectors[prefix] = fn
+
+    def stage_summary(self):
+        """ملخص لكل مرحلة (للوحة التشخيص في الواجهة)."""
+        rows = []
+        for stage, hist in sorted(self.stages.items()):
+            rows.append({
+                "stage": stage,
+                "count": hist.count,
+                "mean_ms": hist.total / hist.count * 1000.0 if hist.count else 0.0,
+                "p50_ms": hist.quantile(0.5) * 1000.0,
+                "p95_ms": hist.quantile(0.95) * 1000.0,
+                "p99_ms": hist.quantile(0.99) * 1000.0,
+            })
+        return rows
+
+    def render_prometheus(self) -> str:
+        lines = []
+
+        def histogram_lines(name, labelled):
+            for labels, hist in labelled:
+                cumulative = 0
+                for bound, n in zip(hist.buckets + (float("inf"),), hist.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.total!r}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        lines += ["# HELP smartcar_stage_duration_seconds Time spent in each prediction stage.",
+                  "# TYPE smartcar_stage_duration_seconds histogram"]
+        histogram_lines("smartcar_stage_duration_seconds",
+                        ((f'stage="{stage}"', hist) for stage, hist in sorted(self.stages.items())))
+
+        lines += ["# HELP smartcar_http_request_duration_seconds HTTP request latency by route.",
+                  "# TYPE smartcar_http_request_duration_seconds histogram"]
+        histogram_lines("smartcar_http_request_duration_seconds",
+                        ((f'method="{m}",path="{p}",status="{s}"', hist)
+                         for (m, p, s), hist in sorted(self.requests.items())))
+
+        for name, (value, help_text) in sorted(self.gauges.items()):
+            lines += [f"# HELP {name} {help_text or name}", f"# TYPE {name} gauge", f"{name} {value!r}"]
+
+        for prefix, fn in sorted(self.collectors.items()):
+            try:
+                stats = fn()
+            except Exception:
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                lines += [f"# TYPE {name} gauge", f"{name} {float(value)!r}"]
+        return "\n".join(lines) + "\n"
+
+
+# سجل واحد لكل عملية
+metrics = MetricsRegistry()
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+سجل نسخ الموديل: كل تدريب يُحفظ في مجلد خاص بنسخته مع ملف وصف (المقاييس، الميزات،
+بصمة بيانات التدريب، وقت الإنشاء)، والنسخة المستخدمة يحددها ملف مؤشر واحد (CURRENT)
+يُستبدل بشكل ذري. لا يُكتب فوق ملف موديل قيد الاستخدام أبداً، والتراجع هو تحريك المؤشر فقط.
+
+models/registry/
+    CURRENT                 -> "v0003"
+    v0001/bundle.pkl, v0001/meta.json
+    v0002/...
+"""
+import json
+import os
+from datetime import datetime
+
+import joblib
+
+from src.config import COMPACT_MODEL_PATH, MODEL_PATH, MODEL_REGISTRY_DIR, SHARED_MODEL_PATH
+
+POINTER_NAME = "CURRENT"
+BUNDLE_NAME = "bundle.pkl"
+META_NAME = "meta.json"
+SHARED_NAME = "shared.joblib"
+COMPACT_NAME = "compact.bin"
+
+
+class ModelNotFoundError(LookupError):
+    pass
+
+
+def _pointer_path():
+    return MODEL_REGISTRY_DIR / POINTER_NAME
+
+
+def _atomic_write_text(path, text):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def current_version():
+    """اسم النسخة الحالية أو None إذا كان السجل فارغاً."""
+    try:
+        return _pointer_path().read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_dir(version):
+    return MODEL_REGISTRY_DIR / version
+
+
+def model_path_for(version):
+    """ملف الموديل لنسخة معيّنة، أو MODEL_PATH القديم إذا كان السجل فارغاً (version=None)."""
+    if version is None:
+        return MODEL_PATH
+    return version_dir(version) / BUNDLE_NAME
+
+
+def current_model_path():
+    """ملف الموديل الذي يجب تحميله: النسخة الحالية في السجل، أو MODEL_PATH القديم إذا كان السجل فارغاً."""
+    return model_path_for(current_version())
+
+
+def shared_path_for(model_path):
+    """مكان النسخة المشتركة (mmap) لملف موديل معيّن."""
+    if model_path.parent.parent == MODEL_REGISTRY_DIR:
+        return model_path.parent / SHARED_NAME
+    return SHARED_MODEL_PATH
+
+
+def compact_path_for(model_path):
+    """مكان النسخة المضغوطة لملف موديل معيّن."""
+    if model_path.parent.parent == MODEL_REGISTRY_DIR:
+        return model_path.parent / COMPACT_NAME
+    return COMPACT_MODEL_PATH
+
+
+def _next_version():
+    existing = [int(p.name[1:]) for p in MODEL_REGISTRY_DIR.glob("v[0-9]*") if p.name[1:].isdigit()]
+    return f"v{max(existing, default=0) + 1:04d}"
+
+
+def register_bundle(bundle, activate=True) -> str:
+    """حفظ الـ bundle كنسخة جديدة (ملفاته تُكتب كاملة قبل تحريك المؤشر)."""
+    MODEL_REGISTRY_DIR.mkdir(parents=True, exist_ok=True)
+    while True:
+        version = _next_version()
+        try:
+            version_dir(version).mkdir()
+            break
+        except FileExistsError:  # عملية أخرى حجزت نفس الرقم
+            continue
+
+    folder = version_dir(version)
+    meta = {
+        "version": version,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "metrics": {k: float(v) for k, v in bundle.get("metrics", {}).items()},
+        "features_used": list(bundle.get("features_used", [])),
+        "data_hash": bundle.get("data_hash"),
+        "data_rows": bundle.get("data_rows"),
+        "update_mode": bundle.get("update_mode", "full"),
+        "parent": current_version(),
+    }
+    # ملف الوصف أولاً؛ وجود bundle.pkl يعني أن النسخة مكتملة
+    _atomic_write_text(folder / META_NAME, json.dumps(meta, ensure_ascii=False, indent=2))
+    joblib.dump(bundle, folder / f"{BUNDLE_NAME}.tmp")
+    os.replace(folder / f"{BUNDLE_NAME}.tmp", folder / BUNDLE_NAME)
+
+    if activate:
+        set_current(version)
+    return version
+
+
+def read_meta(version) -> dict:
+    try:
+        return json.loads((version_dir(version) / META_NAME).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        raise ModelNotFoundError(version)
+
+
+def list_models() -> list:
+    """كل النسخ المسجلة (الأحدث أولاً) مع تحديد النسخة الحالية."""
+    if not MODEL_REGISTRY_DIR.exists():
+        return []
+    current = current_version()
+    models = []
+    for folder in sorted(MODEL_REGISTRY_DIR.glob("v[0-9]*"), reverse=True):
+        if not (folder / BUNDLE_NAME).exists():
+            continue  # نسخة لم يكتمل حفظها
+        meta = read_meta(folder.name)
+        meta["current"] = folder.name == current
+        models.append(meta)
+    return models
+
+
+def set_current(version):
+    """تحريك المؤشر لنسخة موجودة (استبدال ذري: القارئ يرى القديم أو الجديد فقط)."""
+    if not (version_dir(version) / BUNDLE_NAME).exists():
+        raise ModelNotFoundError(version)
+    _atomic_write_text(_pointer_path(), version)
+    return version
+
+
+def rollback(version=None):
+    """
+    الرجوع لنسخة معيّنة، أو (بدون تحديد) للنسخة التي بُنيت عليها النسخة الحالية
+    وإلا لأحدث نسخة أقدم منها.
+    """
+    if version is None:
+        current = current_version()
+        if current is None:
+            raise ModelNotFoundError("registry is empty")
+        version = read_meta(current).get("parent")
+        if version is None or not (version_dir(version) / BUNDLE_NAME).exists():
+            older = [m["version"] for m in list_models() if m["version"] < current]
+            if not older:
+                raise ModelNotFoundError(f"no version before {current}")
+            version = older[0]
+    return set_current(version)
\ No newline at end of file
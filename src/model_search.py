@@ -0,0 +1,234 @@
+"""
+بحث متوازي عن أفضل موديل (RandomForest / HistGradientBoosting / XGBoost) مع k-fold CV.
+لكل مرشح نسجل R² و MAE وزمن التدريب وحجم الموديل على القرص وزمن التوقع لصف واحد
+ولدفعة كاملة، ثم نكتب تقرير Pareto (الدقة مقابل زمن التوقع) لاختيار موديل الخدمة.
+زمن التوقع يُقاس بعد انتهاء الـ pool، مرشحاً بعد الآخر وبـ n_jobs=1 مثل الخدمة، حتى لا يتأثر بتدريب المرشحين الآخرين.
+
+التشغيل:
+    python -m src.model_search --folds 5 --workers 4
+"""
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
+from sklearn.metrics import r2_score, mean_absolute_error
+from sklearn.model_selection import KFold
+from sklearn.pipeline import Pipeline
+
+from src.config import DATA_PATH, REPORTS_DIR
+from src.data_loader import load_data
+from src.features import FEATURES_NUMERIC, FEATURES_CATEGORICAL, TARGET_COLUMN
+from src.train import build_preprocessor
+
+try:
+    from xgboost import XGBRegressor
+except ImportError:  # XGBoost اختياري
+    XGBRegressor = None
+
+# شبكة المعاملات لكل عائلة موديلات
+SEARCH_SPACE = {
+    "RandomForest": {
+        "n_estimators": [100, 300],
+        "max_depth": [12, 20, None],
+        "min_samples_split": [5],
+    },
+    "HistGradientBoosting": {
+        "max_iter": [200, 500],
+        "learning_rate": [0.05, 0.1],
+        "max_depth": [None, 8],
+    },
+    "XGBoost": {
+        "n_estimators": [300, 600],
+        "max_depth": [6, 8],
+        "learning_rate": [0.05, 0.1],
+    },
+}
+
+# نسخة مختصرة للتجارب السريعة
+QUICK_SPACE = {
+    "RandomForest": {"n_estimators": [100], "max_depth": [20], "min_samples_split": [5]},
+    "HistGradientBoosting": {"max_iter": [200], "learning_rate": [0.1], "max_depth": [None]},
+    "XGBoost": {"n_estimators": [300], "max_depth": [6], "learning_rate": [0.1]},
+}
+
+
+def build_model(family, params, n_jobs=1):
+    """Pipeline بنفس المعالجة المستخدمة في train_price_model."""
+    if family == "RandomForest":
+        regressor = RandomForestRegressor(random_state=42, n_jobs=n_jobs, **params)
+        preprocessor = build_preprocessor()
+    elif family == "HistGradientBoosting":
+        regressor = HistGradientBoostingRegressor(random_state=42, **params)
+        preprocessor = build_preprocessor(dense=True)
+    elif family == "XGBoost":
+        regressor = XGBRegressor(random_state=42, n_jobs=n_jobs, **params)
+        preprocessor = build_preprocessor()
+    else:
+        raise ValueError(f"unknown model family: {family}")
+    return Pipeline(steps=[("preprocessor", preprocessor), ("regressor", regressor)])
+
+
+def candidates(space):
+    """كل توليفات المعاملات لكل عائلة متاحة."""
+    for family, grid in space.items():
+        if family == "XGBoost" and XGBRegressor is None:
+            continue
+        keys = list(grid)
+        for values in itertools.product(*(grid[k] for k in keys)):
+            yield family, dict(zip(keys, values))
+
+
+def _latency_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(times))
+
+
+def evaluate_candidate(family, params, X, y_log, folds, n_jobs, model_dir):
+    """
+    تقييم مرشح واحد (يعمل داخل عملية من الـ pool): الدقة بـ CV ثم الموديل النهائي يُحفظ في model_dir
+    لقياس الحجم، وزمن توقعه يُقاس لاحقاً في measure_latency.
+    """
+    r2s, maes, fit_times = [], [], []
+    for train_idx, test_idx in KFold(n_splits=folds, shuffle=True, random_state=42).split(X):
+        model = build_model(family, params, n_jobs)
+        start = time.perf_counter()
+        model.fit(X.iloc[train_idx], y_log.iloc[train_idx])
+        fit_times.append(time.perf_counter() - start)
+
+        pred_log = model.predict(X.iloc[test_idx])
+        r2s.append(r2_score(y_log.iloc[test_idx], pred_log))
+        maes.append(mean_absolute_error(np.expm1(y_log.iloc[test_idx]), np.expm1(pred_log)))
+
+    # الموديل النهائي على كل البيانات لقياس الحجم وزمن التوقع
+    model = build_model(family, params, n_jobs)
+    model.fit(X, y_log)
+    model_path = os.path.join(model_dir, f"{uuid.uuid4().hex}.joblib")
+    joblib.dump(model, model_path)
+
+    return {
+        "family": family,
+        "params": params,
+        "r2_mean": float(np.mean(r2s)),
+        "r2_std": float(np.std(r2s)),
+        "mae_mean": float(np.mean(maes)),
+        "fit_time_s": float(np.mean(fit_times)),
+        "model_size_mb": os.path.getsize(model_path) / 1e6,
+        "model_path": model_path,
+    }
+
+
+def measure_latency(result, X, batch_size=1000):
+    """زمن التوقع لصف واحد ولدفعة بـ n_jobs=1 (مثل الخدمة)؛ يُستدعى لمرشح واحد في كل مرة بعد انتهاء الـ pool."""
+    model_path = result.pop("model_path")
+    model = joblib.load(model_path)
+    os.remove(model_path)
+    regressor = model.named_steps["regressor"]
+    if "n_jobs" in regressor.get_params():
+        regressor.set_params(n_jobs=1)
+
+    single = X.iloc[[0]]
+    batch = X.sample(n=batch_size, replace=True, random_state=0)
+    batch_ms = _latency_ms(lambda: model.predict(batch), 5)
+    result.update({
+        "single_row_ms": _latency_ms(lambda: model.predict(single), 30),
+        "batch_ms": batch_ms,
+        "batch_per_row_us": batch_ms * 1000.0 / batch_size,
+    })
+    return result
+
+
+def pareto_front(results, accuracy_key="r2_mean", latency_key="single_row_ms"):
+    """المرشحون الذين لا يوجد من هو أدق منهم وأسرع في نفس الوقت."""
+    front = []
+    for r in results:
+        dominated = any(
+            o[accuracy_key] >= r[accuracy_key] and o[latency_key] <= r[latency_key]
+            and (o[accuracy_key] > r[accuracy_key] or o[latency_key] < r[latency_key])
+            for o in results
+        )
+        if not dominated:
+            front.append(r)
+    return sorted(front, key=lambda r: r[latency_key])
+
+
+def run_search(df=None, folds=5, workers=None, quick=False):
+    if df is None:
+        df = load_data(DATA_PATH)
+    X = df[FEATURES_NUMERIC + FEATURES_CATEGORICAL]
+    y_log = np.log1p(df[TARGET_COLUMN])
+
+    # نوزع الأنوية: عدة مرشحين بالتوازي، وكل مرشح يأخذ n_jobs من الأنوية المتبقية
+    cores = os.cpu_count() or 1
+    workers = workers or max(1, min(cores, 4))
+    n_jobs = max(1, cores // workers)
+
+    todo = list(candidates(QUICK_SPACE if quick else SEARCH_SPACE))
+    print(f"🔎 {len(todo)} مرشح | {folds}-fold CV | {workers} عملية × {n_jobs} n_jobs")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="model_search-") as model_dir:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(evaluate_candidate, family, params, X, y_log, folds, n_jobs, model_dir):
+                       (family, params) for family, params in todo}
+            for future in as_completed(futures):
+                family, params = futures[future]
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"⚠️ فشل {family} {params}: {e}")
+
+        # زمن التوقع بعد انتهاء كل التدريب: مرشح واحد في كل مرة على جهاز هادئ
+        print("⏱️ قياس زمن التوقع (n_jobs=1)...")
+        for r in results:
+            measure_latency(r, X)
+            print(f"  {r['family']:<22} R² {r['r2_mean']:.4f} | MAE {r['mae_mean']:>9,.0f} | "
+                  f"{r['single_row_ms']:.2f} ms/row | {r['model_size_mb']:.1f} MB")
+
+    front = pareto_front(results)
+    for r in results:
+        r["pareto"] = r in front
+    return sorted(results, key=lambda r: -r["r2_mean"]), front
+
+
+def write_report(results, front):
+    """حفظ التقرير كاملاً (JSON) وجدول مختصر (CSV) في مجلد reports."""
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    json_path = REPORTS_DIR / f"model_search-{stamp}.json"
+    csv_path = REPORTS_DIR / f"model_search-{stamp}.csv"
+
+    json_path.write_text(json.dumps({"results": results, "pareto_front": front}, indent=2), encoding="utf-8")
+    table = pd.DataFrame(results)
+    table["params"] = table["params"].map(json.dumps)
+    table.to_csv(csv_path, index=False)
+    return json_path, csv_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel model search with a Pareto accuracy/latency report")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--quick", action="store_true", help="one configuration per model family")
+    args = parser.parse_args()
+
+    results, front = run_search(folds=args.folds, workers=args.workers, quick=args.quick)
+    json_path, csv_path = write_report(results, front)
+
+    print("\n🏁 Pareto front (R² مقابل زمن التوقع لصف واحد):")
+    for r in front:
+        print(f"  {r['family']:<22} {json.dumps(r['params'])} | R² {r['r2_mean']:.4f} | {r['single_row_ms']:.2f} ms/row")
+    print(f"💾 التقرير: {json_path}\n💾 الجدول: {csv_path}")
\ No newline at end of file
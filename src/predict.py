@@ -1,20 +1,183 @@
 # src/predict.py
+import time
 import joblib
 import numpy as np
 import pandas as pd
-from src.config import MODEL_PATH
+from src.config import PREDICT_BACKEND
+from src.features import FEATURES_NUMERIC
+from src.compiled_model import export_compiled
+from src.prediction_cache import prediction_cache, cache_entry_for, model_file_token
+from src.model_registry import current_model_path
+from src.metrics import metrics
+from src.uncertainty import price_intervals
 
-def load_model_bundle():
-    return joblib.load(MODEL_PATH)
+def load_model_bundle(backend=PREDICT_BACKEND, model_path=None):
+    """
+    تحميل الموديل. مع backend="compiled" نستخدم النسخة المجمعة من الأشجار
+    (ونبنيها عند التحميل إذا كان الملف قديماً ولا يحتويها).
+    مع backend="shared" تُربط الأشجار المجمعة من ملف mmap مشترك بين العمليات (بدون الـ Pipeline).
+    مع backend="compact" تُقرأ الأشجار المُقلَّمة من الملف الثنائي المضغوط (بدون unpickle).
+    model_path: ملف نسخة محددة (الافتراضي: النسخة الحالية في السجل).
+    """
+    model_path = model_path or current_model_path()
+    # بصمة الملف قبل قراءته: تدخل في مفاتيح الذاكرة المؤقتة لنتائج هذا الموديل
+    token = model_file_token(model_path)
+    start = time.perf_counter()
+    if backend == "shared":
+        from src.shared_model import load_shared_bundle
+        bundle = load_shared_bundle(model_path)
+    elif backend == "compact":
+        from src.compact_model import load_compact_bundle
+        bundle = load_compact_bundle(model_path)
+    else:
+        bundle = joblib.load(model_path)
+        if backend == "compiled":
+            if "compiled" not in bundle:
+                export_compiled(bundle)
+        else:
+            bundle.pop("compiled", None)
+    bundle["model_token"] = token
+    elapsed = time.perf_counter() - start
+    metrics.observe("model_load", elapsed)
+    metrics.set_gauge("smartcar_model_last_load_seconds", elapsed, "Duration of the most recent model load.")
+    return bundle
+
+def _predict_log(bundle, rows):
+    """توقع (في فضاء اللوغاريتم) لقائمة صفوف عبر الـ backend المتاح في الـ bundle."""
+    compiled = bundle.get("compiled")
+    if compiled is not None:
+        with metrics.timer("preprocess"):
+            X = compiled.transform_rows(rows)
+        with metrics.timer("forest"):
+            return compiled.predict(X)
+    with metrics.timer("pipeline"):
+        return bundle["pipeline"].predict(pd.DataFrame(rows, columns=bundle["features_used"]))
 
 def predict_price(bundle, input_dict):
-    pipe = bundle["pipeline"]
     features = bundle["features_used"]
     
     # تأمين المدخلات
     row = {k: input_dict.get(k, 0 if isinstance(v, (int, float)) else "Unknown") 
            for k, v in input_dict.items() if k in features}
     
-    X = pd.DataFrame([row])
-    pred = pipe.predict(X)[0]
-    return float(np.expm1(pred)) # إعادة القيمة من لوغاريتم لدولار
\ No newline at end of file
+    pred = _predict_log(bundle, [row])[0]
+    return float(np.expm1(pred)) # إعادة القيمة من لوغاريتم لدولار
+
+def cached_predict_interval(bundle, input_dict, cache=prediction_cache):
+    """
+    (السعر المتوقع، الحد الأدنى، الحد الأعلى) لسيارة واحدة عبر الذاكرة المؤقتة
+    (المفتاح هو المدخلات بعد التوحيد).
+    """
+    canonical, key = cache_entry_for(bundle, input_dict)
+    entry = cache.get(key)
+    if entry is None:
+        preds, lower, upper, _ = predict_intervals(bundle, [canonical])
+        entry = (float(preds[0]), float(lower[0]), float(upper[0]))
+        cache.put(key, entry)
+    return entry
+
+def _validate_row(row, features):
+    """التحقق من صف واحد وإرجاع (الصف النظيف، رسالة الخطأ)."""
+    if not isinstance(row, dict):
+        return None, "row must be an object"
+
+    missing = [f for f in features if f not in row or row[f] is None]
+    if missing:
+        return None, f"missing features: {', '.join(missing)}"
+
+    clean = {}
+    for f in features:
+        value = row[f]
+        if f in FEATURES_NUMERIC:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return None, f"{f} must be numeric"
+            if not np.isfinite(value):
+                return None, f"{f} must be finite"
+        else:
+            value = str(value)
+        clean[f] = value
+    return clean, None
+
+def _validate_rows(rows, features):
+    """(أرقام الصفوف الصالحة، الصفوف النظيفة، الأخطاء مع رقم كل صف)."""
+    errors = []
+    valid_idx, valid_rows = [], []
+    for i, row in enumerate(rows):
+        clean, err = _validate_row(row, features)
+        if err:
+            errors.append({"index": i, "error": err})
+        else:
+            valid_idx.append(i)
+            valid_rows.append(clean)
+    return valid_idx, valid_rows, errors
+
+def predict_prices(bundle, rows):
+    """
+    توقع أسعار عدة سيارات باستدعاء واحد لـ pipe.predict.
+    تُرجع (مصفوفة الأسعار، قائمة الأخطاء)؛ الصفوف غير الصالحة تأخذ NaN
+    ويُذكر سببها في الأخطاء مع رقم الصف.
+    """
+    valid_idx, valid_rows, errors = _validate_rows(rows, bundle["features_used"])
+
+    preds = np.full(len(rows), np.nan)
+    if valid_rows:
+        preds[valid_idx] = np.expm1(_predict_log(bundle, valid_rows))
+    return preds, errors
+
+def predict_intervals(bundle, rows):
+    """
+    نفس predict_prices مع نطاق سعر لكل سيارة من تشتت الأشجار (مرور واحد على الغابة).
+    تُرجع (الأسعار، الحدود الدنيا، الحدود العليا، الأخطاء).
+    """
+    features = bundle["features_used"]
+    valid_idx, valid_rows, errors = _validate_rows(rows, features)
+
+    preds, lower, upper = (np.full(len(rows), np.nan) for _ in range(3))
+    if valid_rows:
+        columns = {f: [row[f] for row in valid_rows] for f in features}
+        preds[valid_idx], lower[valid_idx], upper[valid_idx] = price_intervals(bundle, columns)
+    return preds, lower, upper, errors
+
+def _frame_columns(bundle, frame):
+    """أعمدة الميزات من DataFrame + قناع الصفوف الصالحة (بدون قيم ناقصة أو غير رقمية)."""
+    features = bundle["features_used"]
+    missing = [f for f in features if f not in frame.columns]
+    if missing:
+        raise ValueError(f"missing features: {', '.join(missing)}")
+
+    columns, valid = {}, np.ones(len(frame), dtype=bool)
+    for f in features:
+        if f in FEATURES_NUMERIC:
+            values = pd.to_numeric(frame[f], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            valid &= np.isfinite(values)
+        else:
+            valid &= frame[f].notna().to_numpy()
+            values = frame[f].astype(str).to_numpy()
+        columns[f] = values
+    return {f: values[valid] for f, values in columns.items()}, valid
+
+def predict_frame(bundle, frame):
+    """
+    توقع أسعار DataFrame كامل مباشرة من أعمدته (بدون تحويل كل صف لقاموس)، للمعالجة الجماعية.
+    الصفوف ذات القيم الناقصة أو غير الرقمية تأخذ NaN.
+    """
+    columns, valid = _frame_columns(bundle, frame)
+    preds = np.full(len(frame), np.nan)
+    if valid.any():
+        compiled = bundle.get("compiled")
+        if compiled is not None:
+            pred_log = compiled.predict(compiled.transform_columns(columns))
+        else:
+            pred_log = bundle["pipeline"].predict(pd.DataFrame(columns, columns=bundle["features_used"]))
+        preds[valid] = np.expm1(pred_log)
+    return preds
+
+def predict_frame_intervals(bundle, frame):
+    """نفس predict_frame مع نطاق سعر لكل صف: (الأسعار، الحدود الدنيا، الحدود العليا)."""
+    columns, valid = _frame_columns(bundle, frame)
+    preds, lower, upper = (np.full(len(frame), np.nan) for _ in range(3))
+    if valid.any():
+        preds[valid], lower[valid], upper[valid] = price_intervals(bundle, columns)
+    return preds, lower, upper
\ No newline at end of file
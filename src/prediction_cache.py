@@ -0,0 +1,229 @@
+"""
+ذاكرة مؤقتة (LRU + TTL) لنتائج التوقع.
+المفتاح هو قاموس الميزات بعد توحيده (تقريب الأرقام وتوحيد حالة الأحرف) مع بصمة ملف الموديل
+الذي حسب النتيجة، وتُمسح الذاكرة تلقائياً عند تغيّر ملف الموديل أو بعد إعادة التدريب.
+يمكن إضافة طبقة SQLite مشتركة لتتشارك عدة عمليات uvicorn نفس النتائج.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from src.config import (PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_S,
+                        PREDICTION_CACHE_BACKEND, PREDICTION_CACHE_DB_PATH)
+from src.features import FEATURES_NUMERIC
+from src.model_registry import current_model_path
+
+# عدد الخانات المعنوية المعتمدة للأرقام في المفتاح وفي التوقع نفسه
+NUMERIC_SIGNIFICANT_DIGITS = 6
+
+
+def model_file_token(path=None) -> str:
+    """بصمة ملف الموديل الحالي (المسار + وقت التعديل + الحجم)؛ تتغير عند أي حفظ جديد أو تحريك للمؤشر."""
+    path = path or current_model_path()
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return "missing"
+    return f"{path.parent.name}-{st.st_mtime_ns}-{st.st_size}"
+
+
+def canonicalize_input(input_dict, features, category_lookup=None):
+    """
+    توحيد المدخلات: تقريب الأرقام لخانات معنوية ثابتة وتوحيد كتابة النصوص حسب فئات الموديل
+    (مثلاً "kia " -> "Kia"). يُستخدم الناتج للمفتاح وللتوقع معاً حتى تبقى النتيجة متسقة.
+    """
+    canonical = {}
+    for f in features:
+        value = input_dict.get(f)
+        if f in FEATURES_NUMERIC:
+            canonical[f] = float(f"{float(value):.{NUMERIC_SIGNIFICANT_DIGITS}g}")
+        else:
+            text = str(value).strip()
+            lookup = (category_lookup or {}).get(f, {})
+            canonical[f] = lookup.get(text.casefold(), text.casefold())
+    return canonical
+
+
+def category_lookup_for(bundle):
+    """خريطة (نص بأحرف صغيرة -> الكتابة الأصلية) لكل ميزة نصية في الموديل."""
+    compiled = bundle.get("compiled")
+    if compiled is not None:
+        names, categories = compiled.categorical, compiled.categories
+    else:
+        pre = bundle["pipeline"].named_steps["preprocessor"]
+        names = [c for name, _, cols in pre.transformers_ if name == "cat" for c in cols]
+        categories = pre.named_transformers_["cat"].categories_
+    return {name: {str(c).casefold(): str(c) for c in cats} for name, cats in zip(names, categories)}
+
+
+def make_key(canonical: dict) -> str:
+    return json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+
+
+def cache_entry_for(bundle, input_dict):
+    """
+    إرجاع (المدخلات الموحدة، مفتاح الذاكرة) لصف واحد. المفتاح يبدأ ببصمة الموديل (model_token من
+    load_model_bundle)، فطلب بدأ على النسخة السابقة وكتب نتيجته بعد التبديل لا يُقرأ للنسخة الجديدة.
+    """
+    if "category_lookup" not in bundle:
+        bundle["category_lookup"] = category_lookup_for(bundle)
+    canonical = canonicalize_input(input_dict, bundle["features_used"], bundle["category_lookup"])
+    return canonical, f"{bundle.get('model_token', '')}|{make_key(canonical)}"
+
+
+class _SQLiteBackend:
+    """
+    طبقة مشتركة بين العمليات؛ كل صف مربوط ببصمة الموديل ووقت انتهاء.
+    القيمة تُخزن كـ JSON لأنها قد تكون صفاً (السعر مع حدي النطاق) وليس رقماً واحداً.
+    """
+
+    def __init__(self, db_path, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(db_path, check_same_thread=False, timeout=1.0)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("""
+        CREATE TABLE IF NOT EXISTS prediction_cache_v2 (
+            key TEXT PRIMARY KEY,
+            model_token TEXT,
+            value TEXT,
+            expires_at REAL
+        )
+        """)
+        self._con.commit()
+        self._puts = 0
+
+    def get(self, key, token, now):
+        with self._lock:
+            row = self._con.execute(
+                "SELECT value FROM prediction_cache_v2 WHERE key = ? AND model_token = ? AND expires_at > ?",
+                (key, token, now)).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        return tuple(value) if isinstance(value, list) else value
+
+    def put(self, key, token, value, expires_at):
+        with self._lock:
+            self._con.execute("INSERT OR REPLACE INTO prediction_cache_v2 VALUES (?, ?, ?, ?)",
+                              (key, token, json.dumps(value), expires_at))
+            self._puts += 1
+            # تنظيف دوري للصفوف المنتهية أو الزائدة عن الحد
+            if self._puts % 1000 == 0:
+                self._con.execute("DELETE FROM prediction_cache_v2 WHERE expires_at <= ? OR model_token != ?",
+                                  (time.time(), token))
+                self._con.execute("""
+                DELETE FROM prediction_cache_v2 WHERE key IN (
+                    SELECT key FROM prediction_cache_v2 ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                )""", (self.max_entries,))
+            self._con.commit()
+
+    def clear(self):
+        with self._lock:
+            self._con.execute("DELETE FROM prediction_cache_v2")
+            self._con.commit()
+
+
+class PredictionCache:
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE, ttl_s=PREDICTION_CACHE_TTL_S,
+                 backend=PREDICTION_CACHE_BACKEND, db_path=PREDICTION_CACHE_DB_PATH,
+                 token_fn=model_file_token, token_check_interval_s=1.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._shared = _SQLiteBackend(db_path, max_entries) if backend == "sqlite" else None
+
+        self._token_fn = token_fn
+        self._token = token_fn()
+        self._token_checked_at = time.monotonic()
+        self._token_check_interval_s = token_check_interval_s
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_model_token(self):
+        """فحص بصمة الموديل مرة كل ثانية على الأكثر، ومسح الذاكرة إذا تغيرت."""
+        now = time.monotonic()
+        if now - self._token_checked_at < self._token_check_interval_s:
+            return
+        self._token_checked_at = now
+        token = self._token_fn()
+        if token != self._token:
+            self._token = token
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            self._check_model_token()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+            token = self._token
+
+        if self._shared is not None:
+            value = self._shared.get(key, token, now)
+            if value is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                    self._store(key, value, now + self.ttl_s)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key, value):
+        expires_at = time.time() + self.ttl_s
+        with self._lock:
+            self._store(key, value, expires_at)
+            token = self._token
+        if self._shared is not None:
+            self._shared.put(key, token, value, expires_at)
+
+    def invalidate(self):
+        """مسح كل النتائج (يُستدعى بعد إعادة التدريب)."""
+        with self._lock:
+            self._entries.clear()
+            self._token = self._token_fn()
+            self.invalidations += 1
+        if self._shared is not None:
+            self._shared.clear()
+
+    def stats(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "backend": "sqlite" if self._shared is not None else "memory",
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# نسخة مشتركة داخل العملية الواحدة (الـ API والواجهة)
+prediction_cache = PredictionCache()
\ No newline at end of file
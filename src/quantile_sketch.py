@@ -0,0 +1,130 @@
+"""
+KLL sketch لتقدير النِسب المئوية (quantiles) بمرور واحد على البيانات وبذاكرة ثابتة تقريباً.
+يُستخدم لحساب حدود قص الأسعار المتطرفة بدون تحميل الملف كاملاً للذاكرة.
+الـ sketches قابلة للدمج: كل عملية تبني sketch لجزء من البيانات ثم تُدمج في النهاية.
+عندما يكون عدد القيم أقل من سعة الـ sketch تكون النتائج مطابقة تماماً لـ pandas.quantile.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.config import CSV_CHUNK_SIZE
+
+# حجم المستوى الأعلى (k): خطأ الترتيب النسبي تقريباً 1.7 / k
+DEFAULT_K = 400
+
+# نسبة تناقص السعة بين مستوى وآخر أقل منه
+CAPACITY_RATIO = 2.0 / 3.0
+
+
+class KLLSketch:
+    def __init__(self, k=DEFAULT_K, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * CAPACITY_RATIO ** depth)))
+
+    def update(self, values):
+        """إضافة دفعة قيم (القيم المفقودة تُتجاهل)."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                items = np.sort(items)
+                # عدد زوجي يُضغط (نصفه يصعد للمستوى التالي بوزن مضاعف) والعنصر الزائد يبقى
+                keep = items[:len(items) % 2]
+                pairs = items[len(keep):]
+                offset = int(self._rng.integers(2))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], pairs[offset::2]])
+                self.levels[level] = keep
+                # السعات تتغير عند إضافة مستوى جديد، لذلك نعيد الفحص من البداية
+                level = 0
+                continue
+            level += 1
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """دمج sketch آخر (مثلاً من عملية أو جزء آخر من البيانات)."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _weighted_items(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=np.int64)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """
+        تقدير النسبة المئوية q (رقم أو مصفوفة) بنفس الاستيفاء الخطي الذي يستخدمه pandas:
+        الترتيب q*(n-1) بين أقرب قيمتين.
+        """
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else float("nan")
+        values, cum_weights = self._weighted_items()
+        total = cum_weights[-1]
+        rank = np.asarray(q, dtype=np.float64) * (total - 1)
+        lo = np.floor(rank)
+        v_lo = values[np.searchsorted(cum_weights, lo, side="right")]
+        v_hi = values[np.minimum(np.searchsorted(cum_weights, lo + 1, side="right"), len(values) - 1)]
+        result = v_lo + (rank - lo) * (v_hi - v_lo)
+        return float(result) if np.ndim(result) == 0 else result
+
+    def cdf(self, x):
+        """تقدير نسبة القيم الأصغر من أو تساوي x (رقم أو مصفوفة)."""
+        if self.n == 0:
+            return np.full(np.shape(x), np.nan) if np.ndim(x) else float("nan")
+        values, cum_weights = self._weighted_items()
+        idx = np.searchsorted(values, x, side="right")
+        result = np.where(idx > 0, cum_weights[np.maximum(idx - 1, 0)], 0) / cum_weights[-1]
+        return float(result) if np.ndim(result) == 0 else result
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "n": self.n, "levels": [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, state) -> "KLLSketch":
+        sketch = cls(k=state["k"])
+        sketch.n = int(state["n"])
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in state["levels"]]
+        return sketch
+
+
+def sketch_csv(path, column="Price_USD", chunk_size=CSV_CHUNK_SIZE, k=DEFAULT_K) -> KLLSketch:
+    """مرور واحد على الـ CSV على دفعات (يُقرأ العمود المطلوب فقط)."""
+    sketch = KLLSketch(k=k)
+    for chunk in pd.read_csv(path, usecols=[column], chunksize=chunk_size):
+        sketch.update(chunk[column].to_numpy(dtype=np.float64))
+    return sketch
+
+
+def sketch_csv_shards(paths, column="Price_USD", workers=None, k=DEFAULT_K) -> KLLSketch:
+    """sketch لكل ملف (shard) في عملية منفصلة ثم دمجها في sketch واحد."""
+    merged = KLLSketch(k=k)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for sketch in pool.map(sketch_csv, paths, [column] * len(paths),
+                               [CSV_CHUNK_SIZE] * len(paths), [k] * len(paths)):
+            merged.merge(sketch)
+    return merged
\ No newline at end of file
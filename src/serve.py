@@ -0,0 +1,87 @@
+"""
+تشغيل الـ API بعدة عمليات تتشارك نفس نسخة الموديل (mmap) بدل نسخة خاصة لكل عملية.
+
+التشغيل:
+    python -m src.serve --workers 4          # gunicorn + UvicornWorker إن وُجد، وإلا uvicorn --workers
+    python -m src.serve --reload             # تصدير الموديل الجديد وإعادة تشغيل العمليات بهدوء
+    python -m src.serve --backend compact    # الملف المضغوط المُقلَّم بدل النسخة المشتركة الكاملة
+
+إعادة التحميل: نرسل SIGHUP للعملية الرئيسية؛ كل من gunicorn و uvicorn يستبدلان العمليات
+واحدة تلو الأخرى، والعملية الجديدة تربط الملف المشترك خلال أجزاء من الثانية.
+"""
+import argparse
+import os
+import shutil
+import signal
+import sys
+
+from src.config import BASE_DIR, SERVE_HOST, SERVE_PORT, SERVE_WORKERS, SERVE_PID_PATH
+from src.shared_model import ensure_shared
+from src.compact_model import ensure_compact
+
+APP = "main_api:app"
+
+# كلا الملفين يُفتحان بـ mmap فتتشارك العمليات نفس الصفحات
+EXPORTERS = {"shared": ensure_shared, "compact": ensure_compact}
+
+
+def _worker_class():
+    try:
+        import uvicorn_worker  # noqa: F401
+        return "uvicorn_worker.UvicornWorker"
+    except ImportError:
+        return "uvicorn.workers.UvicornWorker"
+
+
+def serve(workers=SERVE_WORKERS, host=SERVE_HOST, port=SERVE_PORT, server="auto", backend="shared"):
+    # التصدير مرة واحدة هنا حتى لا تتسابق العمليات على إنشائه عند الإقلاع
+    EXPORTERS[backend]()
+    os.environ["SMARTCAR_PREDICT_BACKEND"] = backend
+    os.chdir(BASE_DIR)
+
+    if server in ("auto", "gunicorn") and shutil.which("gunicorn"):
+        print(f"🚀 gunicorn: {workers} عملية على {host}:{port}")
+        os.execvp("gunicorn", [
+            "gunicorn", APP,
+            "--workers", str(workers),
+            "--worker-class", _worker_class(),
+            "--bind", f"{host}:{port}",
+            "--pid", str(SERVE_PID_PATH),
+        ])
+
+    import uvicorn
+    print(f"🚀 uvicorn: {workers} عملية على {host}:{port}")
+    SERVE_PID_PATH.write_text(str(os.getpid()), encoding="utf-8")
+    try:
+        uvicorn.run(APP, host=host, port=port, workers=workers)
+    finally:
+        SERVE_PID_PATH.unlink(missing_ok=True)
+
+
+def reload_workers(backend="shared"):
+    """تحديث النسخة المشتركة من ملف الموديل الحالي ثم إرسال إشارة إعادة التحميل للخادم."""
+    EXPORTERS[backend]()
+    try:
+        pid = int(SERVE_PID_PATH.read_text(encoding="utf-8").strip())
+        os.kill(pid, signal.SIGHUP)
+    except (FileNotFoundError, ValueError, ProcessLookupError):
+        print("⚠️ لا يوجد خادم يعمل (لم يُعثر على ملف الـ pid).")
+        return False
+    print(f"🔄 تم إرسال إشارة إعادة التحميل للعملية {pid}")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-worker API server with a shared memory-mapped model")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--server", choices=["auto", "gunicorn", "uvicorn"], default="auto")
+    parser.add_argument("--backend", choices=sorted(EXPORTERS), default="shared",
+                        help="model file the workers map: full compiled forest or the pruned compact file")
+    parser.add_argument("--reload", action="store_true", help="re-export the model and signal running workers")
+    args = parser.parse_args()
+
+    if args.reload:
+        sys.exit(0 if reload_workers(args.backend) else 1)
+    serve(args.workers, args.host, args.port, args.server, args.backend)
\ No newline at end of file
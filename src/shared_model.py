@@ -0,0 +1,88 @@
+"""
+نسخة الموديل للخدمة متعددة العمليات: مصفوفات الغابة المجمعة فقط (بدون sklearn Pipeline)
+في ملف joblib غير مضغوط يُفتح بـ mmap للقراءة فقط. كل عمليات الـ API تربط نفس الصفحات
+من ذاكرة النظام بدل نسخة خاصة لكل عملية، والتحميل لا يحتاج فك pickle للأشجار.
+"""
+import os
+
+import joblib
+import numpy as np
+
+from src.compiled_model import CompiledForest, compile_pipeline
+from src.model_registry import current_model_path, shared_path_for
+
+SHARED_FORMAT_VERSION = 1
+
+# مفاتيح الـ bundle الصغيرة التي تُنسخ كما هي
+BUNDLE_META_KEYS = ["features_used", "metrics", "use_log_target", "version", "trained_at", "data_rows",
+                    "interval", "feature_defaults", "drift_reference"]
+
+# المصفوفات الكبيرة في CompiledForest (هي التي تُقرأ بـ mmap)
+FOREST_ARRAYS = ["feature", "threshold", "children", "value", "roots"]
+
+
+def forest_state(compiled: CompiledForest) -> dict:
+    state = {name: np.ascontiguousarray(getattr(compiled, name)) for name in FOREST_ARRAYS}
+    state.update({
+        "numeric": list(compiled.numeric),
+        "categorical": list(compiled.categorical),
+        "mean": np.asarray(compiled.mean),
+        "scale": np.asarray(compiled.scale),
+        "categories": [np.asarray(c) for c in compiled.categories],
+        "max_depth": int(compiled.max_depth),
+    })
+    return state
+
+
+def forest_from_state(state) -> CompiledForest:
+    # np.asarray يحول np.memmap لمصفوفة عادية فوق نفس الذاكرة (بدون نسخ)
+    return CompiledForest(
+        state["numeric"], state["categorical"], np.asarray(state["mean"]), np.asarray(state["scale"]),
+        [np.asarray(c) for c in state["categories"]],
+        *(np.asarray(state[name]) for name in FOREST_ARRAYS),
+        max_depth=state["max_depth"],
+    )
+
+
+def export_shared(bundle, path, source_token=None):
+    """كتابة النسخة المشتركة بشكل ذري (ملف مؤقت ثم استبدال)."""
+    compiled = bundle.get("compiled") or compile_pipeline(bundle["pipeline"], bundle["features_used"])
+    state = {
+        "format": SHARED_FORMAT_VERSION,
+        "source_token": source_token,
+        "meta": {k: bundle[k] for k in BUNDLE_META_KEYS if k in bundle},
+        "forest": forest_state(compiled),
+    }
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    joblib.dump(state, tmp_path)  # بدون ضغط حتى يعمل mmap_mode
+    os.replace(tmp_path, path)
+    return path
+
+
+def _source_token(model_path):
+    st = model_path.stat()
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def ensure_shared(model_path=None, path=None):
+    """إعادة تصدير النسخة المشتركة فقط إذا تغيّر ملف الموديل الأصلي منذ آخر تصدير."""
+    model_path = model_path or current_model_path()
+    path = path or shared_path_for(model_path)
+    token = _source_token(model_path)
+    try:
+        current = joblib.load(path, mmap_mode="r")
+        if current.get("format") == SHARED_FORMAT_VERSION and current.get("source_token") == token:
+            return path
+    except (FileNotFoundError, EOFError, ValueError, KeyError):
+        pass
+    return export_shared(joblib.load(model_path), path, source_token=token)
+
+
+def load_shared_bundle(model_path=None):
+    """bundle للتوقع فقط: مصفوفات الأشجار مربوطة بالملف (read-only) ومشتركة بين العمليات."""
+    path = ensure_shared(model_path or current_model_path())
+    state = joblib.load(path, mmap_mode="r")
+    bundle = dict(state["meta"])
+    bundle["compiled"] = forest_from_state(state["forest"])
+    bundle["shared_path"] = str(path)
+    return bundle
\ No newline at end of file
@@ -1,6 +1,6 @@
+from datetime import datetime
 import pandas as pd
 import numpy as np
-import joblib
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.compose import ColumnTransformer
@@ -9,54 +9,73 @@ from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.metrics import r2_score, mean_absolute_error
 
 # استيراد الإعدادات والميزات من الملفات التي أنشأناها
-from src.config import DATA_PATH, MODEL_PATH
+from src.config import DATA_PATH
 from src.features import FEATURES_NUMERIC, FEATURES_CATEGORICAL, TARGET_COLUMN
 from src.data_loader import load_data
+from src.compiled_model import export_compiled
+from src.uncertainty import calibrate_interval
+from src.drift import build_reference, reference_defaults
+from src.prediction_cache import prediction_cache
+from src.feature_store import source_rows, source_version
+from src.model_registry import register_bundle, current_model_path, set_current, version_dir, BUNDLE_NAME
 
-def train_price_model(df=None):
-    """
-    تدريب النموذج باستخدام خوارزمية Random Forest مع معالجة متقدمة للبيانات.
-    """
-    print("⏳ جاري تحضير البيانات...")
-    if df is None:
-        df = load_data(DATA_PATH)
+# إعدادات الغابة (تُستخدم أيضاً في التحديث التدريجي حتى تبقى الأشجار الجديدة متسقة)
+FOREST_PARAMS = dict(
+    n_estimators=300,   # عدد الأشجار
+    max_depth=20,       # العمق الأقصى لمنع Overfitting
+    min_samples_split=5,
+    random_state=42     # لضمان ثبات النتائج عند كل تشغيل
+)
 
-    # 1. فصل الميزات عن الهدف
-    X = df[FEATURES_NUMERIC + FEATURES_CATEGORICAL]
-    y = df[TARGET_COLUMN]
+def save_bundle(bundle, activate=True):
+    """حفظ الموديل كنسخة جديدة في سجل النسخ ثم تحويل مؤشر النسخة الحالية إليها (ذرياً)."""
+    return register_bundle(bundle, activate=activate)
 
-    # 2. السر في رفع R2: تحويل السعر للوغاريتم لتقليل أثر الفجوات السعرية الكبيرة
-    y_log = np.log1p(y)
+def split_holdout(df):
+    """تقسيم (80% تدريب، 20% اختبار) مع تحويل السعر للوغاريتم؛ ثابت حتى يمكن إعادة إنتاجه لاحقاً."""
+    X = df[FEATURES_NUMERIC + FEATURES_CATEGORICAL]
+    y_log = np.log1p(df[TARGET_COLUMN])
+    return train_test_split(X, y_log, test_size=0.2, random_state=42)
 
-    # 3. بناء معالج البيانات (Preprocessing)
-    # StandardScaler للأرقام و OneHotEncoder للنصوص
+def build_preprocessor(dense=False):
+    """
+    StandardScaler للأرقام و OneHotEncoder للنصوص.
+    dense=True لنماذج لا تقبل المصفوفات المتفرقة (مثل HistGradientBoosting).
+    """
     numeric_transformer = StandardScaler()
-    categorical_transformer = OneHotEncoder(handle_unknown='ignore')
+    categorical_transformer = OneHotEncoder(handle_unknown='ignore', sparse_output=not dense)
 
-    preprocessor = ColumnTransformer(
+    return ColumnTransformer(
         transformers=[
             ('num', numeric_transformer, FEATURES_NUMERIC),
             ('cat', categorical_transformer, FEATURES_CATEGORICAL)
         ])
 
-    # 4. بناء النموذج (استخدام RandomForestRegressor بدلاً من الموديلات الخطية)
+def train_price_model(df=None, export_compact=False):
+    """
+    تدريب النموذج باستخدام خوارزمية Random Forest مع معالجة متقدمة للبيانات.
+    export_compact=True يصدّر أيضاً نسخة مضغوطة مُقلَّمة (انظر compact_model.py) مع تقرير الدقة والحجم.
+    """
+    print("⏳ جاري تحضير البيانات...")
+    if df is None:
+        df = load_data(DATA_PATH)
+
+    # 1. بناء معالج البيانات (Preprocessing)
+    preprocessor = build_preprocessor()
+
+    # 2. بناء النموذج (استخدام RandomForestRegressor بدلاً من الموديلات الخطية)
     model = Pipeline(steps=[
         ('preprocessor', preprocessor),
-        ('regressor', RandomForestRegressor(
-            n_estimators=300,   # عدد الأشجار
-            max_depth=20,       # العمق الأقصى لمنع Overfitting
-            min_samples_split=5,
-            random_state=42     # لضمان ثبات النتائج عند كل تشغيل
-        ))
+        ('regressor', RandomForestRegressor(**FOREST_PARAMS))
     ])
 
-    # 5. تقسيم البيانات (80% تدريب، 20% اختبار)
-    X_train, X_test, y_train, y_test = train_test_split(X, y_log, test_size=0.2, random_state=42)
+    # 3. تقسيم البيانات (80% تدريب، 20% اختبار)
+    X_train, X_test, y_train, y_test = split_holdout(df)
 
     print(f"🚀 جاري التدريب على {len(X_train)} عينة...")
     model.fit(X_train, y_train)
 
-    # 6. التقييم
+    # 4. التقييم
     y_pred_log = model.predict(X_test)
     r2 = r2_score(y_test, y_pred_log)
     
@@ -71,18 +90,44 @@ def train_price_model(df=None):
     print(f"💰 متوسط الخطأ المطلق: {mae:,.2f} دولار")
     print("="*30)
 
-    # 7. حفظ النموذج (Bundle)
+    # 5. حفظ النموذج (Bundle)
     bundle = {
         "pipeline": model,
         "features_used": FEATURES_NUMERIC + FEATURES_CATEGORICAL,
         "metrics": {"r2": r2, "mae": mae},
-        "use_log_target": True
+        "use_log_target": True,
+        # عدد صفوف المصدر وقت التدريب؛ التحديث التدريجي يبدأ من بعدها
+        "data_rows": source_rows(DATA_PATH),
+        "data_hash": source_version(DATA_PATH),
+        "version": 1,
+        "trained_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
+    # تصدير نسخة مجمعة من الأشجار لتسريع التوقع في الـ API
+    export_compiled(bundle)
+    # معايرة نطاق السعر لكل سيارة (تشتت الأشجار) على بيانات الاختبار
+    bundle["interval"] = calibrate_interval(bundle, X_test, y_test)
+    # مرجع التوزيعات لمراقبة انحراف الطلبات (ميزات وتوقعات نفس صفوف الاختبار: توقعات صفوف التدريب
+    # نفسها أضيق مما يراه الموديل في الطلبات)، ووسيط كل ميزة للقيم التي لا يرسلها العميل
+    bundle["drift_reference"] = build_reference(X_test, y_pred_log)
+    bundle["feature_defaults"] = reference_defaults(bundle["drift_reference"])
     
-    joblib.dump(bundle, MODEL_PATH)
-    print(f"💾 تم حفظ النموذج في: {MODEL_PATH}")
+    # مع النسخة المضغوطة لا نحرك المؤشر إلا بعد أن يصبح ملفها جاهزاً بجانب الموديل
+    version = save_bundle(bundle, activate=not export_compact)
+    if export_compact:
+        from src.compact_model import export_compact_for
+        export_compact_for(version_dir(version) / BUNDLE_NAME, bundle, X_train, y_train, X_test, y_test)
+        set_current(version)
+    print(f"💾 تم حفظ النموذج كنسخة {version} في: {current_model_path()}")
+
+    # النتائج المخزنة تخص الموديل السابق
+    prediction_cache.invalidate()
     
     return bundle
 
 if __name__ == "__main__":
-    train_price_model()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the price model")
+    parser.add_argument("--compact", action="store_true", help="also export a pruned compact model file")
+    args = parser.parse_args()
+    train_price_model(export_compact=args.compact)
\ No newline at end of file
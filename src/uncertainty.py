@@ -0,0 +1,84 @@
+"""
+نطاق سعر لكل سيارة من تشتت أشجار الغابة (بأسلوب quantile forest) بدل نطاق ثابت للجميع.
+
+كل شجرة تعطي سعراً؛ نأخذ النِسب المئوية لتوقعات الأشجار حول المتوسط (في فضاء اللوغاريتم)
+ثم نضربها بمعامل معايرة يُحسب وقت التدريب على بيانات الاختبار حتى يغطي النطاق
+PRICE_INTERVAL_COVERAGE من الأسعار الحقيقية. السيارة التي تختلف عليها الأشجار (بيانات قليلة
+تشبهها) تأخذ نطاقاً أعرض وثقة أقل.
+
+الكلفة: مرور واحد على كل الأشجار (نفس مرور predict) + quantile على محور الأشجار.
+"""
+import numpy as np
+import pandas as pd
+
+from src.config import PRICE_INTERVAL_COVERAGE
+from src.metrics import metrics
+
+# النِسب المئوية لتوقعات الأشجار التي يُبنى منها النطاق قبل المعايرة
+SPREAD_QUANTILES = (0.1, 0.9)
+
+# للموديلات القديمة التي لم تُعاير: تشتت الأشجار كما هو
+DEFAULT_CALIBRATION = {"quantiles": list(SPREAD_QUANTILES), "scale": 1.0, "coverage": None}
+
+# أصغر نصف عرض (لوغاريتم) حتى لا تكون القسمة على صفر عند اتفاق كل الأشجار
+MIN_HALF_WIDTH = 1e-6
+
+
+def tree_predictions(bundle, columns) -> np.ndarray:
+    """توقع كل شجرة لكل صف (في فضاء اللوغاريتم)، بشكل (عدد الصفوف، عدد الأشجار)."""
+    compiled = bundle.get("compiled")
+    if compiled is not None:
+        with metrics.timer("preprocess"):
+            X = compiled.transform_columns(columns)
+        with metrics.timer("forest"):
+            return compiled.tree_predictions(X)
+
+    # الـ Pipeline الأصلي: المعالجة مرة واحدة ثم الأشجار على نفس المصفوفة
+    with metrics.timer("pipeline"):
+        pipe = bundle["pipeline"]
+        Xt = pipe.named_steps["preprocessor"].transform(pd.DataFrame(columns, columns=bundle["features_used"]))
+        return np.column_stack([tree.predict(Xt) for tree in pipe.named_steps["regressor"].estimators_])
+
+
+def spread(tree_preds, quantiles=SPREAD_QUANTILES):
+    """(المتوسط، نصف العرض للأسفل، نصف العرض للأعلى) لكل صف من توقعات الأشجار."""
+    mean = tree_preds.mean(axis=1)
+    q_low, q_high = np.quantile(tree_preds, quantiles, axis=1)
+    return mean, np.maximum(mean - q_low, MIN_HALF_WIDTH), np.maximum(q_high - mean, MIN_HALF_WIDTH)
+
+
+def calibrate_interval(bundle, X, y_log, coverage=PRICE_INTERVAL_COVERAGE) -> dict:
+    """
+    معامل تكبير/تصغير لتشتت الأشجار يجعل النطاق يغطي `coverage` من الأسعار الحقيقية
+    (split conformal: النسبة المئوية المصححة لانحراف السعر الحقيقي مقسوماً على نصف العرض).
+    """
+    columns = {c: X[c].to_numpy() for c in bundle["features_used"]}
+    return calibrate_tree_predictions(tree_predictions(bundle, columns), y_log, coverage)
+
+
+def calibrate_tree_predictions(tree_preds, y_log, coverage=PRICE_INTERVAL_COVERAGE) -> dict:
+    """نفس calibrate_interval من توقعات أشجار جاهزة (مثلاً مجموعة جزئية من الأشجار بعد التقليم)."""
+    mean, down, up = spread(tree_preds)
+    y_log = np.asarray(y_log, dtype=np.float64)
+    ratio = np.where(y_log < mean, (mean - y_log) / down, (y_log - mean) / up)
+
+    n = len(ratio)
+    level = min(1.0, np.ceil((n + 1) * coverage) / n) if n else 1.0
+    scale = float(np.quantile(ratio, level)) if n else 1.0
+    return {"quantiles": list(SPREAD_QUANTILES), "scale": scale, "coverage": coverage}
+
+
+def price_intervals(bundle, columns):
+    """(السعر المتوقع، الحد الأدنى، الحد الأعلى) بالدولار لكل صف من مرور واحد على الأشجار."""
+    calibration = bundle.get("interval", DEFAULT_CALIBRATION)
+    mean, down, up = spread(tree_predictions(bundle, columns), calibration["quantiles"])
+    scale = calibration["scale"]
+    return np.expm1(mean), np.expm1(mean - scale * down), np.expm1(mean + scale * up)
+
+
+def interval_confidence(predicted, lower, upper) -> np.ndarray:
+    """ثقة (0-100) لكل سيارة: 100 ناقص نصف عرض النطاق كنسبة من السعر المتوقع."""
+    predicted = np.asarray(predicted, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative_half_width = (np.asarray(upper) - np.asarray(lower)) / (2.0 * predicted)
+    return np.round(np.clip(100.0 * (1.0 - relative_half_width), 0.0, 100.0), 2)
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+صيغ الطلبات والردود البديلة لعملاء الـ API ذوي الحجم الكبير (اختيار الصيغة عبر Content-Type و Accept):
+- JSON: عبر orjson إن كان مثبتاً (أسرع بكثير من json القياسية)، وإلا json.
+- MessagePack للطلبات المفردة (يحتاج الحزمة msgpack؛ بدونها تُرفض هذه الصيغة بـ 415).
+- Arrow IPC (stream) للدفعات: الأعمدة تُقرأ كمصفوفات مباشرة بدون كائن لكل صف.
+- NDJSON للدفعات: سيارة في كل سطر، والرد يُبث سطراً سطراً.
+"""
+import json
+
+import numpy as np
+import pyarrow as pa
+
+try:
+    import orjson
+except ImportError:  # orjson اختياري
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack اختياري
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+NDJSON = "application/x-ndjson"
+
+# أسماء بديلة شائعة لنفس الصيغ
+MEDIA_ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    "application/jsonl": NDJSON,
+}
+
+
+class UnsupportedFormatError(Exception):
+    pass
+
+
+def media_type(header) -> str:
+    """نوع المحتوى بدون المعاملات (charset...) وبعد توحيد الأسماء البديلة."""
+    value = (header or JSON).split(";", 1)[0].strip().lower()
+    return MEDIA_ALIASES.get(value, value)
+
+
+def negotiate(accept, offered, default=JSON) -> str:
+    """أفضل صيغة رد من ترويسة Accept (حسب q ثم ترتيب العميل) من بين الصيغ المتاحة."""
+    if not accept:
+        return default
+    choices = []
+    for i, part in enumerate(accept.split(",")):
+        name, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        choices.append((-q, i, media_type(name)))
+    for neg_q, _, name in sorted(choices):
+        if neg_q == 0:
+            break
+        if name in ("*/*", "application/*"):
+            return default
+        if name in offered:
+            return name
+    return default
+
+
+def single_formats():
+    return [JSON, MSGPACK] if msgpack is not None else [JSON]
+
+
+def dumps_json(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, default=lambda v: v.item()).encode("utf-8")
+
+
+def loads_json(body):
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+def encode(payload, fmt) -> bytes:
+    if fmt == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    return dumps_json(payload)
+
+
+def decode(body, fmt):
+    """جسم طلب مفرد (JSON أو MessagePack) إلى كائن Python."""
+    if fmt == MSGPACK:
+        if msgpack is None:
+            raise UnsupportedFormatError("MessagePack support requires the msgpack package")
+        return msgpack.unpackb(body, raw=False)
+    if fmt == JSON:
+        return loads_json(body)
+    raise UnsupportedFormatError(f"Unsupported content type: {fmt}")
+
+
+def read_arrow_columns(body) -> dict:
+    """أعمدة جسم Arrow IPC كمصفوفات NumPy (الأرقام بدون نسخ حيث أمكن)."""
+    table = pa.ipc.open_stream(pa.BufferReader(body)).read_all()
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def read_ndjson_columns(body) -> dict:
+    """أسطر NDJSON (سيارة في كل سطر) إلى أعمدة."""
+    rows = [loads_json(line) for line in body.splitlines() if line.strip()]
+    names = list(dict.fromkeys(name for row in rows if isinstance(row, dict) for name in row))
+    return {name: np.array([row.get(name) if isinstance(row, dict) else None for row in rows], dtype=object)
+            for name in names}
+
+
+def write_arrow(columns) -> bytes:
+    table = pa.table(columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def iter_ndjson(records, lines_per_chunk=1000):
+    """الرد كأسطر NDJSON على دفعات (للبث عبر StreamingResponse)."""
+    chunk = []
+    for record in records:
+        chunk.append(dumps_json(record))
+        if len(chunk) >= lines_per_chunk:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
\ No newline at end of file